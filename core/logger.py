@@ -2,7 +2,7 @@ import os
 import requests
 from .settings import logpath
 from loguru import logger as log
-from .settings import NOTIFICATION_API_KEY, NOTIFICATION_API_URL
+from .settings import NOTIFICATION_API_KEY, NOTIFICATION_API_URL, HTTP_TIMEOUT
 
 
 def overwrite_on_100mb(message, file):
@@ -35,6 +35,7 @@ def send_notification(email: str, message: str):
                 "message": message,
                 "apikey": NOTIFICATION_API_KEY,
             },
+            timeout=HTTP_TIMEOUT,
         )
         response.raise_for_status()
     except Exception as err:
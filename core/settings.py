@@ -50,6 +50,85 @@ TIKTOK_CLIENT_SECRET = os.getenv("TIKTOK_CLIENT_SECRET")
 TIKTOK_REDIRECT_URI = APP_URL + "/tiktok/callback/"
 TIKTOK_UNINSTALL_URI = APP_URL + "/tiktok/uninstall/"
 
+# Integrations page/schedule form context, must stay below the signed avatar urls lifetime (1h)
+INTEGRATIONS_CONTEXT_CACHE_SECONDS = int(os.getenv("INTEGRATIONS_CONTEXT_CACHE_SECONDS", 1800))
+# TikTok creator info (posting caps, max video duration), cleared when a cap is reached
+TIKTOK_CREATOR_INFO_CACHE_SECONDS = int(os.getenv("TIKTOK_CREATOR_INFO_CACHE_SECONDS", 3600))
+
+# Rows fetched at a time by the poster queries, keeps memory flat on large backlogs
+POSTER_QUERY_CHUNK_SIZE = int(os.getenv("POSTER_QUERY_CHUNK_SIZE", 200))
+
+# Downloaded and rendered media, served by proxy_media_file and emptied when runposter starts
+POSTER_TMP_DIR = os.getenv("POSTER_TMP_DIR", "/tmp/poster")
+os.makedirs(POSTER_TMP_DIR, exist_ok=True)
+
+# Image processing worker processes (0 = one per core) and time limit per image
+IMAGE_PROCESS_WORKERS = int(os.getenv("IMAGE_PROCESS_WORKERS", 0))
+IMAGE_PROCESS_TIMEOUT_SECONDS = int(os.getenv("IMAGE_PROCESS_TIMEOUT_SECONDS", 120))
+# Background media processing, posts are picked up within MEDIA_POLL_SECONDS of being saved.
+# Claims older than MEDIA_CLAIM_TIMEOUT_SECONDS (crashed or failed jobs) are processed again.
+# Due posts wait up to MEDIA_READY_WAIT_SECONDS for their media before going out unprocessed.
+MEDIA_VIDEO_WORKERS = int(os.getenv("MEDIA_VIDEO_WORKERS", 2))
+MEDIA_POLL_SECONDS = int(os.getenv("MEDIA_POLL_SECONDS", 2))
+MEDIA_CLAIM_TIMEOUT_SECONDS = int(os.getenv("MEDIA_CLAIM_TIMEOUT_SECONDS", 900))
+MEDIA_READY_WAIT_SECONDS = int(os.getenv("MEDIA_READY_WAIT_SECONDS", 900))
+# Text card backgrounds: Pexels searches are cached, photos are kept in a local pool
+# refilled in the background with at most PEXELS_REFILL_SEARCHES API calls per interval
+PEXELS_POOL_DIR = os.getenv("PEXELS_POOL_DIR", "/tmp/pexels")
+PEXELS_POOL_SIZE = int(os.getenv("PEXELS_POOL_SIZE", 200))
+PEXELS_QUERY_CACHE_SECONDS = int(os.getenv("PEXELS_QUERY_CACHE_SECONDS", 604800))
+PEXELS_REFILL_INTERVAL_SECONDS = int(os.getenv("PEXELS_REFILL_INTERVAL_SECONDS", 600))
+PEXELS_REFILL_SEARCHES = int(os.getenv("PEXELS_REFILL_SEARCHES", 3))
+# Uploaded images above this pixel count are not decoded (~100MP)
+IMAGE_MAX_PIXELS = int(os.getenv("IMAGE_MAX_PIXELS", 100_000_000))
+
+# Published/exhausted posts are moved to the archive table after this many days
+POST_ARCHIVE_AFTER_DAYS = int(os.getenv("POST_ARCHIVE_AFTER_DAYS", 30))
+POST_ARCHIVE_INTERVAL_SECONDS = int(os.getenv("POST_ARCHIVE_INTERVAL_SECONDS", 3600))
+POST_ARCHIVE_BATCH_SIZE = int(os.getenv("POST_ARCHIVE_BATCH_SIZE", 500))
+
+# Calendar template fragments, keyed by the account schedule version
+SCHEDULE_FRAGMENT_CACHE_SECONDS = int(os.getenv("SCHEDULE_FRAGMENT_CACHE_SECONDS", 86400))
+
+# Decrypted integration tokens kept in memory
+TOKEN_CACHE_SIZE = int(os.getenv("TOKEN_CACHE_SIZE", 1024))
+TOKEN_CACHE_TTL_SECONDS = int(os.getenv("TOKEN_CACHE_TTL_SECONDS", 3600))
+
+# Timeouts (seconds) for calls to external APIs
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 5))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 30))
+HTTP_TIMEOUT = (HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT)
+HTTP_UPLOAD_READ_TIMEOUT = float(os.getenv("HTTP_UPLOAD_READ_TIMEOUT", 120))
+HTTP_STATUS_READ_TIMEOUT = float(os.getenv("HTTP_STATUS_READ_TIMEOUT", 15))
+
+# Poster
+# Total time a single platform post can take before it's given up and retried
+POST_DEADLINE_SECONDS = int(os.getenv("POST_DEADLINE_SECONDS", 600))
+VIDEO_POST_DEADLINE_SECONDS = int(os.getenv("VIDEO_POST_DEADLINE_SECONDS", 3600))
+# Worker threads publishing text/image posts and video posts
+DISPATCH_SHORT_WORKERS = int(os.getenv("DISPATCH_SHORT_WORKERS", 4))
+DISPATCH_MEDIA_WORKERS = int(os.getenv("DISPATCH_MEDIA_WORKERS", 2))
+# Deliveries late by more than this are a backlog and get drained at DISPATCH_CATCHUP_RATE/sec (0 for no limit)
+DISPATCH_CATCHUP_AFTER_SECONDS = int(os.getenv("DISPATCH_CATCHUP_AFTER_SECONDS", 300))
+DISPATCH_CATCHUP_RATE = float(os.getenv("DISPATCH_CATCHUP_RATE", 1))
+# Pause a platform after this many consecutive network/5xx/429 errors, probe again after the cooldown
+CIRCUIT_BREAKER_FAILURES = int(os.getenv("CIRCUIT_BREAKER_FAILURES", 5))
+CIRCUIT_BREAKER_COOLDOWN_SECONDS = int(os.getenv("CIRCUIT_BREAKER_COOLDOWN_SECONDS", 60))
+CIRCUIT_BREAKER_MAX_COOLDOWN_SECONDS = int(os.getenv("CIRCUIT_BREAKER_MAX_COOLDOWN_SECONDS", 1800))
+# Publishes per account and UTC calendar day (0 means no limit), X limits are taken from the API headers.
+# Counts reset at UTC midnight, so up to twice the limit can go out in the 24h around it
+X_DAILY_POST_LIMIT = int(os.getenv("X_DAILY_POST_LIMIT", 17))
+INSTAGRAM_DAILY_POST_LIMIT = int(os.getenv("INSTAGRAM_DAILY_POST_LIMIT", 50))
+FACEBOOK_DAILY_POST_LIMIT = int(os.getenv("FACEBOOK_DAILY_POST_LIMIT", 0))
+LINKEDIN_DAILY_POST_LIMIT = int(os.getenv("LINKEDIN_DAILY_POST_LIMIT", 150))
+TIKTOK_DAILY_POST_LIMIT = int(os.getenv("TIKTOK_DAILY_POST_LIMIT", 15))
+# Concurrent token refreshes and how often the refresh schedule is reloaded from the DB
+TOKEN_REFRESH_WORKERS = int(os.getenv("TOKEN_REFRESH_WORKERS", 4))
+TOKEN_REFRESH_RESYNC_SECONDS = int(os.getenv("TOKEN_REFRESH_RESYNC_SECONDS", 300))
+# Media is uploaded to the platforms this many minutes before scheduled_on
+PRESTAGE_WINDOW_MINUTES = int(os.getenv("PRESTAGE_WINDOW_MINUTES", 30))
+PRESTAGE_INTERVAL_SECONDS = int(os.getenv("PRESTAGE_INTERVAL_SECONDS", 15))
+
 # Firebase Web config (frontend)
 FIREBASE_API_KEY = os.getenv("FIREBASE_API_KEY")
 FIREBASE_AUTH_DOMAIN = os.getenv("FIREBASE_AUTH_DOMAIN")
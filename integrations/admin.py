@@ -1,4 +1,6 @@
 from django.contrib import admin
-from .models import IntegrationsModel
+from .models import IntegrationsModel, QuotaLedgerModel, MediaRenditionModel
 
 admin.site.register(IntegrationsModel)
+admin.site.register(QuotaLedgerModel)
+admin.site.register(MediaRenditionModel)
@@ -1,9 +1,18 @@
+import time
 import uuid
+from threading import Lock
+from functools import lru_cache
+from collections import OrderedDict
 from Crypto.Cipher import AES
 from Crypto.Util.Padding import pad, unpad
 from hashlib import sha256
 
 
+@lru_cache(maxsize=8)
+def derive_key(secret_key: str):
+    return sha256(uuid.uuid5(uuid.NAMESPACE_DNS, secret_key).bytes).digest()
+
+
 class AESCBC:
     """
     aes_cbc = AESCBC("secret text")
@@ -17,7 +26,7 @@ class AESCBC:
     """
 
     def __init__(self, secret_key: str):
-        self.key = sha256(uuid.uuid5(uuid.NAMESPACE_DNS, secret_key).bytes).digest()
+        self.key = derive_key(secret_key)
 
     def encrypt(self, text: str):
         cipher = AES.new(self.key, AES.MODE_CBC)
@@ -32,3 +41,43 @@ class AESCBC:
         cipher = AES.new(self.key, AES.MODE_CBC, iv)
         plaintext = unpad(cipher.decrypt(encrypted_text), AES.block_size)
         return plaintext.decode()
+
+
+class DecryptedCache:
+    """
+    Bounded LRU of decrypted values keyed by their ciphertext, entries expire after `ttl` seconds.
+
+    cache = DecryptedCache(AESCBC("secret text"), maxsize=1024, ttl=3600)
+    cache.decrypt(encrypted_message_hex)
+
+    """
+
+    def __init__(self, aes_cbc: AESCBC, maxsize: int, ttl: float):
+        self.aes_cbc = aes_cbc
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.values = OrderedDict()  # ciphertext -> (expires_at, plaintext)
+        self.lock = Lock()
+
+    def set(self, encrypted_text: str, text: str):
+        with self.lock:
+            self.values[encrypted_text] = (time.monotonic() + self.ttl, text)
+            self.values.move_to_end(encrypted_text)
+            while len(self.values) > self.maxsize:
+                self.values.popitem(last=False)
+
+    def decrypt(self, encrypted_text: str):
+        with self.lock:
+            cached = self.values.get(encrypted_text)
+            if cached and cached[0] > time.monotonic():
+                self.values.move_to_end(encrypted_text)
+                return cached[1]
+
+        text = self.aes_cbc.decrypt(encrypted_text)
+        self.set(encrypted_text, text)
+        return text
+
+    def encrypt(self, text: str):
+        encrypted_text = self.aes_cbc.encrypt(text)
+        self.set(encrypted_text, text)
+        return encrypted_text
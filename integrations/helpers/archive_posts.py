@@ -0,0 +1,60 @@
+from core import settings
+from core.logger import log
+from datetime import timedelta
+from collections import Counter
+from django.db import transaction
+from django.utils import timezone
+from socialsched.models import PostModel, ArchivedPostModel, DailyPlatformCountModel, PENDING_POSTS
+
+
+def get_posts_to_archive(now_utc, older_than: timedelta):
+    # Nothing left to publish or retry, scheduled_on is a wall clock time (up to UTC+14)
+    return PostModel.objects.exclude(PENDING_POSTS).filter(
+        scheduled_on__lt=now_utc - older_than - timedelta(hours=14)
+    )
+
+
+@transaction.atomic
+def archive_batch(post_ids: list):
+    posts = list(PostModel.objects.filter(pk__in=post_ids).exclude(PENDING_POSTS))
+    if not posts:
+        return 0
+
+    archived = ArchivedPostModel.objects.bulk_create([ArchivedPostModel.from_post(post) for post in posts])
+    archived_posts = PostModel.objects.filter(pk__in=[post.pk for post in posts])
+
+    # The archived copies keep the media files, without them on the posts
+    # django_cleanup has nothing to remove on delete
+    archived_posts.update(media_file="")
+
+    # The delete signals take the posts out of the calendar counts (and bump the
+    # schedule versions), the archived copies are counted again in the same transaction
+    archived_posts.delete()
+
+    counts = Counter()
+    for post in archived:
+        counts.update(post.get_rollup_keys())
+    DailyPlatformCountModel.apply(counts)
+
+    return len(posts)
+
+
+def archive_posts(now_utc=None):
+    now_utc = now_utc or timezone.now()
+    older_than = timedelta(days=settings.POST_ARCHIVE_AFTER_DAYS)
+
+    archived = 0
+    while True:
+        post_ids = list(
+            get_posts_to_archive(now_utc, older_than)
+            .order_by("pk")
+            .values_list("pk", flat=True)[: settings.POST_ARCHIVE_BATCH_SIZE]
+        )
+        if not post_ids:
+            break
+        archived += archive_batch(post_ids)
+
+    if archived > 0:
+        log.info(f"Archived {archived} posts older than {older_than.days} days")
+
+    return archived
@@ -0,0 +1,467 @@
+import os
+import time
+import heapq
+import queue
+import asyncio
+import itertools
+from core import settings
+from core.logger import log
+from datetime import datetime, timedelta
+from collections import deque, defaultdict
+from dataclasses import dataclass, field
+from threading import Thread, Event, Lock, Condition
+from django.utils import timezone
+from django.db import close_old_connections
+from socialsched.models import PostModel, MediaFileTypes, PLATFORM_FIELD_KEYS, PENDING_POSTS
+from integrations.models import IntegrationsModel, Platform
+from integrations.platforms.linkedin import post_on_linkedin
+from integrations.platforms.xtwitter import post_on_x
+from integrations.platforms.facebook import post_on_facebook
+from integrations.platforms.instagram import post_on_instagram
+from integrations.platforms.tiktok import post_on_tiktok
+from integrations.platforms.circuit_breaker import circuit_breakers, HALF_OPEN
+from integrations.platforms.quota_ledger import get_deferral, defer_post
+from integrations.platforms.common import Deadline
+from .utils import get_filepath_from_cloudflare_url
+from .refresh_tokens import refresh_scheduler
+from .renditions import get_platform_media_path
+
+
+SHORT_LANE = "short"
+MEDIA_LANE = "media"
+
+sequence = itertools.count()
+
+
+@dataclass(order=True)
+class Delivery:
+    """
+    One post on one platform.
+    Deliveries are ordered by scheduled time, the sequence keeps FIFO order on ties.
+    """
+
+    scheduled_aware: datetime
+    sequence: int = field(default_factory=lambda: next(sequence))
+    post_id: int = field(default=None, compare=False)
+    account_id: int = field(default=None, compare=False)
+    platform: str = field(default=None, compare=False)
+    lane: str = field(default=SHORT_LANE, compare=False)
+    integration: IntegrationsModel = field(default=None, compare=False, repr=False)
+
+    @property
+    def key(self):
+        return self.post_id, self.platform
+
+
+def publish_on_x(post: PostModel, integration: IntegrationsModel, media_url: str, media_path: str, deadline: Deadline):
+    return post_on_x(
+        post.account_id,
+        post.id,
+        post.description,
+        media_path,
+        post.staged_x,
+        integration=integration,
+        deadline=deadline,
+    )
+
+
+def publish_on_linkedin(post: PostModel, integration: IntegrationsModel, media_url: str, media_path: str, deadline: Deadline):
+    return post_on_linkedin(
+        post.account_id,
+        post.id,
+        post.description,
+        media_path,
+        post.staged_linkedin,
+        integration=integration,
+        deadline=deadline,
+    )
+
+
+def publish_on_facebook(post: PostModel, integration: IntegrationsModel, media_url: str, media_path: str, deadline: Deadline):
+    return post_on_facebook(
+        post.account_id,
+        post.id,
+        post.description,
+        post.media_file_type,
+        media_url,
+        media_path,
+        post.staged_facebook,
+        integration=integration,
+        deadline=deadline,
+    )
+
+
+def publish_on_instagram(post: PostModel, integration: IntegrationsModel, media_url: str, media_path: str, deadline: Deadline):
+    return post_on_instagram(
+        post.account_id,
+        post.id,
+        post.description,
+        post.media_file_type,
+        media_url,
+        media_path,
+        post.staged_instagram,
+        integration=integration,
+        deadline=deadline,
+    )
+
+
+def publish_on_tiktok(post: PostModel, integration: IntegrationsModel, media_url: str, media_path: str, deadline: Deadline):
+    return post_on_tiktok(post, post.description, media_path, integration=integration, deadline=deadline)
+
+
+publish_methods = {
+    Platform.X_TWITTER.value: publish_on_x,
+    Platform.LINKEDIN.value: publish_on_linkedin,
+    Platform.FACEBOOK.value: publish_on_facebook,
+    Platform.INSTAGRAM.value: publish_on_instagram,
+    Platform.TIKTOK.value: publish_on_tiktok,
+}
+
+
+def get_due_deliveries(now_utc: datetime):
+    # scheduled_on is a wall clock time and timezones go up to UTC+14
+    latest_wall_clock = now_utc + timedelta(hours=14)
+
+    potential_posts = PostModel.objects.filter(
+        PENDING_POSTS, scheduled_on__lte=latest_wall_clock
+    ).only(
+        "pk",
+        "account_id",
+        "scheduled_on",
+        "post_timezone",
+        "media_file_type",
+        "process_image",
+        "process_video",
+        "image_processed",
+        "video_processed",
+        "post_on_x",
+        "post_on_instagram",
+        "post_on_facebook",
+        "post_on_linkedin",
+        "post_on_tiktok",
+    )
+
+    media_wait = timedelta(seconds=settings.MEDIA_READY_WAIT_SECONDS)
+
+    deliveries = []
+    for post in potential_posts.iterator(chunk_size=settings.POSTER_QUERY_CHUNK_SIZE):
+        scheduled_aware = post.scheduled_aware
+        if now_utc < scheduled_aware:
+            continue
+
+        # The media worker is still on it, give up waiting if processing keeps failing
+        if not post.media_ready:
+            if now_utc - scheduled_aware < media_wait:
+                continue
+            log.warning(f"Publishing post {post.pk} with unprocessed media")
+
+        # Video uploads can take up to an hour, keep them away from the short posts
+        lane = MEDIA_LANE if post.media_file_type == MediaFileTypes.VIDEO.value else SHORT_LANE
+
+        for platform, key in PLATFORM_FIELD_KEYS.items():
+            if not getattr(post, f"post_on_{key}"):
+                continue
+            deliveries.append(
+                Delivery(
+                    scheduled_aware=scheduled_aware,
+                    post_id=post.pk,
+                    account_id=post.account_id,
+                    platform=platform,
+                    lane=lane,
+                )
+            )
+
+    deliveries.sort()
+    return deliveries
+
+
+def preload_integrations(deliveries: list):
+    # One query for the whole batch instead of one per post and platform
+    integrations = IntegrationsModel.objects.filter(
+        account_id__in={delivery.account_id for delivery in deliveries},
+        platform__in={delivery.platform for delivery in deliveries},
+    )
+    integrations = {(i.account_id, i.platform): i for i in integrations}
+
+    for delivery in deliveries:
+        delivery.integration = integrations.get((delivery.account_id, delivery.platform))
+
+    return deliveries
+
+
+class MediaCopies:
+    """
+    Local copies of the post media shared by the deliveries of the post on each platform,
+    so the media is downloaded once per post instead of once per platform.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.copies = {}  # post_id -> [download lock, local path]
+
+    def get(self, post_id: int, url: str):
+        with self.lock:
+            entry = self.copies.setdefault(post_id, [Lock(), None])
+
+        # Other platforms of the post wait for the download instead of starting their own
+        with entry[0]:
+            if entry[1] is None or not os.path.exists(entry[1]):
+                entry[1] = get_filepath_from_cloudflare_url(url)
+            return entry[1]
+
+    def release(self, post_id: int):
+        with self.lock:
+            entry = self.copies.pop(post_id, None)
+
+        if entry and entry[1] and os.path.exists(entry[1]):
+            os.remove(entry[1])
+
+
+def deliver(delivery: Delivery, media_copies: MediaCopies = None):
+    post = PostModel.objects.filter(pk=delivery.post_id).first()
+    key = PLATFORM_FIELD_KEYS[delivery.platform]
+
+    # Already published (or retried) since it was queued
+    if post is None or not getattr(post, f"post_on_{key}"):
+        return
+
+    # Don't make calls we know will fail, move them to the next quota window
+    deferral = get_deferral(post.account_id, delivery.platform)
+    if deferral:
+        defer_post(post.pk, delivery.platform, deferral, "Daily post limit reached.")
+        return
+
+    # One time budget for the token refresh and the platform calls
+    deadline = Deadline.for_media_type(post.media_file_type)
+
+    # Token may expire between scheduler runs
+    integration = refresh_scheduler.ensure_fresh(delivery.integration, deadline)
+
+    # Staged platforms only need the publish call
+    staged = getattr(post, f"staged_{key}", None)
+
+    media_path = None
+    media_url = None
+    media_paths = set()
+    try:
+        if post.media_file and not staged:
+            if media_copies is None:
+                media_path = get_filepath_from_cloudflare_url(post.media_file.url)
+                media_paths.add(media_path)
+            else:
+                # Removed by the dispatcher once the last platform of the post is done
+                media_path = media_copies.get(post.pk, post.media_file.url)
+            # Platforms with their own size limits get a rendition of the post media
+            rendition_path = get_platform_media_path(delivery.platform, post.media_file_type, media_path)
+            if rendition_path != media_path:
+                media_paths.add(rendition_path)
+            media_path = rendition_path
+            media_url = f"{settings.APP_URL}/proxy-media-file/{os.path.basename(media_path)}"
+
+        asyncio.run(
+            publish_methods[delivery.platform](post, integration, media_url, media_path, deadline)
+        )
+    finally:
+        for path in media_paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class FairQueue:
+    """
+    Accounts take turns, then the platforms of each account do.
+    Within a turn the account with the most overdue delivery goes first and
+    within an account/platform the most overdue delivery goes first,
+    so one account with hundreds of queued posts can't starve the others.
+    """
+
+    def __init__(self):
+        self.condition = Condition()
+        self.heaps = defaultdict(list)  # (account_id, platform) -> heap of deliveries
+        self.platforms = defaultdict(deque)  # account_id -> platforms to rotate
+        self.turns = {}  # account_id -> turns taken while queued
+        self.turn = 0  # turn being served
+        self.size = 0
+
+    def qsize(self):
+        with self.condition:
+            return self.size
+
+    def put(self, delivery: Delivery):
+        with self.condition:
+            key = (delivery.account_id, delivery.platform)
+            if not self.heaps[key]:
+                if not self.platforms[delivery.account_id]:
+                    # Joins the turn being served, no credit for the time it was idle
+                    self.turns[delivery.account_id] = self.turn
+                self.platforms[delivery.account_id].append(delivery.platform)
+            heapq.heappush(self.heaps[key], delivery)
+            self.size += 1
+            self.condition.notify()
+
+    def get_oldest(self, account_id: int):
+        return min(self.heaps[(account_id, platform)][0] for platform in self.platforms[account_id])
+
+    def get(self, timeout: float = None):
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.size > 0, timeout):
+                raise queue.Empty
+
+            account_id = min(
+                self.platforms, key=lambda account_id: (self.turns[account_id], self.get_oldest(account_id))
+            )
+            self.turn = self.turns[account_id]
+            self.turns[account_id] += 1
+
+            platforms = self.platforms[account_id]
+            platform = platforms.popleft()
+
+            key = (account_id, platform)
+            delivery = heapq.heappop(self.heaps[key])
+            self.size -= 1
+
+            if self.heaps[key]:
+                platforms.append(platform)
+            else:
+                del self.heaps[key]
+
+            if not platforms:
+                del self.platforms[account_id]
+                del self.turns[account_id]
+
+            return delivery
+
+
+class RateLimiter:
+    """Token bucket shared by the workers, a rate of 0 or less doesn't throttle."""
+
+    def __init__(self, rate: float, burst: int = 1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.lock = Lock()
+
+    def acquire(self, stop_event: Event):
+        if self.rate <= 0:
+            return not stop_event.is_set()
+
+        while not stop_event.is_set():
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(
+                    self.burst, self.tokens + (now - self.updated_at) * self.rate
+                )
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait_seconds = (1 - self.tokens) / self.rate
+            stop_event.wait(wait_seconds)
+        return False
+
+
+class Dispatcher:
+    """
+    Publishes due deliveries as soon as a worker of their lane is free.
+
+    dispatcher = Dispatcher({SHORT_LANE: 4, MEDIA_LANE: 2})
+    dispatcher.start()
+    dispatcher.submit(delivery)
+    dispatcher.stop()
+
+    Deliveries overdue by more than `catchup_after` (backlog after downtime or a burst)
+    are drained at `catchup_rate` per second instead of all at once.
+
+    """
+
+    def __init__(
+        self,
+        lanes: dict,
+        catchup_after: timedelta = timedelta(minutes=5),
+        catchup_rate: float = 1,
+    ):
+        self.lanes = lanes
+        self.queues = {lane: FairQueue() for lane in lanes}
+        self.catchup_after = catchup_after
+        self.catchup_limiter = RateLimiter(catchup_rate, burst=max(1, int(catchup_rate)))
+        self.in_flight = set()
+        self.media_copies = MediaCopies()
+        self.lock = Lock()
+        self.stop_event = Event()
+        self.workers = []
+
+    def start(self):
+        for lane, workers in self.lanes.items():
+            for idx in range(workers):
+                worker = Thread(target=self.work, args=(lane,), name=f"{lane}-{idx}")
+                worker.start()
+                self.workers.append(worker)
+
+    def stop(self):
+        # Queued deliveries are still pending in the DB and will be picked up on next start
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
+
+    def submit(self, delivery: Delivery):
+        # Platform is down, the post stays pending and is submitted again once the cooldown is over
+        if circuit_breakers.paused(delivery.platform):
+            return False
+
+        with self.lock:
+            if delivery.key in self.in_flight:
+                return False
+            self.in_flight.add(delivery.key)
+
+        self.queues[delivery.lane].put(delivery)
+        return True
+
+    def is_catching_up(self, delivery: Delivery):
+        return timezone.now() - delivery.scheduled_aware > self.catchup_after
+
+    def work(self, lane: str):
+        while not self.stop_event.is_set():
+            try:
+                delivery = self.queues[lane].get(timeout=1)
+            except queue.Empty:
+                continue
+
+            # Tripped since it was queued, or another delivery took the probe
+            circuit_state = circuit_breakers.allow(delivery.platform)
+            if circuit_state is None:
+                self.finish(delivery)
+                continue
+
+            try:
+                if self.is_catching_up(delivery):
+                    if not self.catchup_limiter.acquire(self.stop_event):
+                        continue
+                deliver(delivery, self.media_copies)
+            except Exception as err:
+                log.error(f"Delivery failed: {delivery.platform} post {delivery.post_id}")
+                log.exception(err)
+            finally:
+                if circuit_state == HALF_OPEN:
+                    circuit_breakers.release_probe(delivery.platform)
+                self.finish(delivery)
+                close_old_connections()
+
+    def finish(self, delivery: Delivery):
+        with self.lock:
+            self.in_flight.discard(delivery.key)
+            # Platforms of a post are submitted together, the media copy goes with the last one
+            # (under the lock, a delivery of the post submitted meanwhile gets a new copy)
+            if not any(post_id == delivery.post_id for post_id, _ in self.in_flight):
+                self.media_copies.release(delivery.post_id)
+
+
+def create_dispatcher():
+    return Dispatcher(
+        {
+            SHORT_LANE: settings.DISPATCH_SHORT_WORKERS,
+            MEDIA_LANE: settings.DISPATCH_MEDIA_WORKERS,
+        },
+        catchup_after=timedelta(seconds=settings.DISPATCH_CATCHUP_AFTER_SECONDS),
+        catchup_rate=settings.DISPATCH_CATCHUP_RATE,
+    )
@@ -0,0 +1,118 @@
+import io
+import os
+import math
+from core.logger import log
+from PIL import Image, ImageChops, ImageStat
+
+
+# Smallest limit of the platforms sharing the default image (Facebook)
+DEFAULT_MAX_BYTES = 4 * 1024 * 1024
+
+JPEG_MIN_QUALITY = 60
+JPEG_MAX_QUALITY = 92
+
+# Lowest PSNR (dB) kept when shrinking, below it JPEG artifacts get visible on photos
+MIN_PSNR = 38.0
+
+# Text cards and other flat images stay sharp and small as PNG
+MAX_PNG_COLORS = 1024
+
+
+def get_psnr(original: Image.Image, encoded: Image.Image):
+    rms = ImageStat.Stat(ImageChops.difference(original, encoded)).rms
+    mse = sum(value ** 2 for value in rms) / len(rms)
+    if mse == 0:
+        return math.inf
+    return 10 * math.log10(255 ** 2 / mse)
+
+
+def encode_jpeg(img: Image.Image, quality: int):
+    buffer = io.BytesIO()
+    img.save(buffer, "JPEG", quality=quality, optimize=True, progressive=True)
+    return buffer.getvalue()
+
+
+def encode_png(img: Image.Image):
+    buffer = io.BytesIO()
+    img.save(buffer, "PNG", optimize=True)
+    return buffer.getvalue()
+
+
+def get_jpeg_psnr(img: Image.Image, data: bytes):
+    with Image.open(io.BytesIO(data)) as encoded:
+        return get_psnr(img, encoded.convert("RGB"))
+
+
+def encode_image(img: Image.Image, max_bytes: int = None):
+    """
+    Smallest encoding of the image that keeps MIN_PSNR and fits in max_bytes.
+    Returns (data, params) where params has the format and the chosen settings.
+    """
+
+    img = img.convert("RGB")
+    max_bytes = max_bytes or DEFAULT_MAX_BYTES
+
+    if img.getcolors(MAX_PNG_COLORS) is not None:
+        data = encode_png(img)
+        if len(data) <= max_bytes:
+            return data, {"format": "PNG", "optimize": True, "bytes": len(data)}
+
+    # Lowest quality above the PSNR floor, both grow with the quality
+    best = None
+    low, high = JPEG_MIN_QUALITY, JPEG_MAX_QUALITY
+    while low <= high:
+        quality = (low + high) // 2
+        data = encode_jpeg(img, quality)
+        psnr = get_jpeg_psnr(img, data)
+        if psnr >= MIN_PSNR:
+            best = (quality, data, psnr)
+            high = quality - 1
+        else:
+            low = quality + 1
+
+    if best is None:
+        data = encode_jpeg(img, JPEG_MAX_QUALITY)
+        best = (JPEG_MAX_QUALITY, data, get_jpeg_psnr(img, data))
+
+    # Over the platform limit, give up quality for size (the size drops with the quality)
+    if len(best[1]) > max_bytes:
+        low, high = 1, best[0] - 1
+        while low <= high:
+            quality = (low + high) // 2
+            data = encode_jpeg(img, quality)
+            if len(data) <= max_bytes:
+                best = (quality, data, get_jpeg_psnr(img, data))
+                low = quality + 1
+            else:
+                high = quality - 1
+        log.warning(f"Image quality lowered to fit {max_bytes} bytes")
+
+    quality, data, psnr = best
+    params = {
+        "format": "JPEG",
+        "quality": quality,
+        "progressive": True,
+        "optimize": True,
+        "bytes": len(data),
+        "psnr": None if math.isinf(psnr) else round(psnr, 2),
+    }
+    return data, params
+
+
+def save_encoded_image(img: Image.Image, image_path: str, max_bytes: int = None):
+    """
+    Encode the image into image_path, the extension follows the chosen format
+    (the previous file is removed if it changes). Returns (path, params).
+    """
+
+    data, params = encode_image(img, max_bytes)
+
+    ext = ".png" if params["format"] == "PNG" else ".jpg"
+    output_path = os.path.splitext(image_path)[0] + ext
+    with open(output_path, "wb") as f:
+        f.write(data)
+
+    if output_path != image_path and os.path.exists(image_path):
+        os.remove(image_path)
+
+    return output_path, params
@@ -1,12 +1,14 @@
 import os
+import math
 import uuid
 import shutil
 import tempfile
-import textwrap
-from pathlib import Path
-from PIL import Image, ImageDraw, ImageFont, ImageFilter
+from PIL import Image, ImageFilter
+from core import settings
 from core.logger import log, send_notification
 from .pexels import get_relevant_image_for_text
+from .encode_image import save_encoded_image
+from .text_card import CardStyle, create_text_card
 
 
 def resize_image_width(image_path: str, target_width: int = 1080):
@@ -24,42 +26,61 @@ def resize_image_width(image_path: str, target_width: int = 1080):
     return image_path
 
 
-def resize_image(image_path: str, image_bg: str = None, target_width: int = 1080, target_height: int = 1350):
-    # Open and convert the main image to RGB
-    img = Image.open(image_path).convert("RGB")
-    
-    # Calculate target and image aspect ratios
+def get_cover_box(width: int, height: int, target_width: int, target_height: int):
+    # Centered region of the image with the target aspect ratio
     target_aspect = target_width / target_height
-    img_aspect = img.width / img.height
-
-    if img_aspect > target_aspect:
-        # Image is wider than target frame — match height, then crop width
-        new_height = target_height
-        new_width = int(new_height * img_aspect)
-        resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Calculate cropping box for width
-        left = (new_width - target_width) // 2
-        top = 0
-        right = left + target_width
-        bottom = target_height
-    else:
-        # Image is taller than target frame — match width, then crop height
-        new_width = target_width
-        new_height = int(new_width / img_aspect)
-        resized_img = img.resize((new_width, new_height), Image.LANCZOS)
-        
-        # Calculate cropping box for height
-        left = 0
-        top = (new_height - target_height) // 2
-        right = target_width
-        bottom = top + target_height
-
-    # Crop the image to the exact target dimensions
-    final_img = resized_img.crop((left, top, right, bottom))
-    
-    # Save the final image
-    final_img.save(image_path)
+
+    if width / height > target_aspect:
+        # Image is wider than target frame — keep the height, crop the width
+        crop_width = height * target_aspect
+        left = (width - crop_width) / 2
+        return (left, 0, left + crop_width, height)
+
+    # Image is taller than target frame — keep the width, crop the height
+    crop_height = width / target_aspect
+    top = (height - crop_height) / 2
+    return (0, top, width, top + crop_height)
+
+
+def render_image(
+    image_path: str,
+    target_width: int = 1080,
+    target_height: int = 1350,
+    max_bytes: int = None,
+):
+    """Cover crop of the image to the target size, encoded within max_bytes (default budget if None). Returns (path, encoder params)."""
+
+    with Image.open(image_path) as img:
+        # Only the header is read so far, refuse to decode huge images
+        if img.width * img.height > settings.IMAGE_MAX_PIXELS:
+            raise Exception(f"Image is too large ({img.width}x{img.height})")
+
+        width, height = img.size
+        box = get_cover_box(width, height, target_width, target_height)
+
+        # JPEGs can be decoded at 1/2, 1/4 or 1/8 scale, as long as the crop stays above target size
+        scale = target_width / (box[2] - box[0])
+        img.draft("RGB", (math.ceil(width * scale), math.ceil(height * scale)))
+        if img.size != (width, height):
+            box = get_cover_box(*img.size, target_width, target_height)
+
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+
+        # Resample only the visible region, other formats get reduced first when much larger
+        final_img = img.resize(
+            (target_width, target_height),
+            Image.LANCZOS,
+            box=box,
+            reducing_gap=3.0,
+        )
+
+    # The extension may change with the format picked by the encoder
+    return save_encoded_image(final_img, image_path, max_bytes)
+
+
+def resize_image(image_path: str, target_width: int = 1080, target_height: int = 1350):
+    image_path, _ = render_image(image_path, target_width, target_height)
     return image_path
 
 
@@ -67,55 +88,28 @@ def create_image_from_text(
     text: str,
     image_path: str = None,
     width: int = 1080,
-    font_size: int = 40,
+    font_size: int = 72,
     padding: int = 40,
     background_color: str = "black",
     text_color: str = "white",
+    height: int = 1350,
+    background_path: str = None,
 ):
     if image_path is None:
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = tempfile.mkdtemp(dir=settings.POSTER_TMP_DIR)
         image_path = os.path.join(temp_dir, f"{uuid.uuid4()}.png")
-    
-    font_path = Path(__file__).parent / "Inter_28pt-SemiBold.ttf"
-    font = ImageFont.truetype(font_path, font_size)
-
-    # Calculate how much space we have for text
-    text_width = width - (2.3 * padding)
-
-    # Split the text by newlines first to preserve manual line breaks
-    paragraphs = text.split("\n")
-
-    # Then wrap each paragraph to fit width
-    all_lines = []
-    for paragraph in paragraphs:
-        if paragraph.strip():
-            # Wrap non-empty paragraphs
-            wrapped_lines = textwrap.wrap(
-                paragraph, width=int(text_width / (font_size * 0.5))
-            )
-            all_lines.extend(wrapped_lines)
-        else:
-            # Preserve empty lines
-            all_lines.append("")
-
-    # Calculate height based on number of lines
-    line_height = font_size * 1.5
-    text_height = len(all_lines) * line_height
-    height = int(text_height + (2 * padding))
-
-    # Create image
-    image = Image.new("RGB", (width, height), color=background_color)
-    draw = ImageDraw.Draw(image)
-
-    # Draw text
-    y_position = padding
-    for line in all_lines:
-        draw.text((padding, y_position), line, font=font, fill=text_color)
-        y_position += line_height
-
-    image.save(image_path)
 
-    return image_path
+    # The font size is fitted to the text, font_size is the largest one used
+    style = CardStyle(
+        width=width,
+        height=height,
+        padding=padding,
+        max_font_size=font_size,
+        background_color=background_color,
+        text_color=text_color,
+        background_path=background_path,
+    )
+    return create_text_card(text, image_path, style)
 
 
 def concat_image_vertically(
@@ -146,10 +140,12 @@ def create_image(*, image_path: str = None, text: str = None):
 
     # If only text (no image), create an image from text with background
     if text and not image_path:
-        text_image_path = create_image_from_text(text)
         bg_image_path = get_relevant_image_for_text(text)
-        resized_image_path = resize_image(text_image_path, bg_image_path)
-        os.remove(bg_image_path)
+        try:
+            text_image_path = create_image_from_text(text, background_path=bg_image_path)
+        finally:
+            os.remove(bg_image_path)
+        resized_image_path = resize_image(text_image_path)
         return resized_image_path
 
     raise Exception("Image or text must be provided!")
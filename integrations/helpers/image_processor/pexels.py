@@ -1,67 +1,261 @@
+import io
 import re
+import os
+import json
+import time
 import uuid
 import random
 import shutil
+import hashlib
 import requests
 from pathlib import Path
 from collections import Counter
+from PIL import Image, ImageOps
 from core import settings
 from core.logger import log, send_notification
 
 
+BACKGROUND_SIZE = (1080, 1350)
+
+# Plain files so the image worker processes and the refill thread share them
+POOL_DIR = Path(settings.PEXELS_POOL_DIR)
+INDEX_PATH = POOL_DIR / "index.json"  # photo id -> tags
+QUERIES_DIR = POOL_DIR / "queries"  # cached search results
+WANTED_DIR = POOL_DIR / "wanted"  # queries the pool had no match for
+NOTIFIED_PATH = POOL_DIR / "notified_at"
+
+NOTIFY_INTERVAL_SECONDS = 3600
+
+# Searched to fill the pool when posts didn't ask for anything specific
+DEFAULT_QUERIES = [
+    "nature", "city", "ocean", "mountains", "abstract",
+    "texture", "sky", "forest", "technology", "workspace",
+]
+
+# Photos added to the pool per search
+PHOTOS_PER_QUERY = 3
+
+
 def extract_keywords(text):
     words = re.findall(r"\b[a-zA-Z]{4,}\b", text.lower())  # Words > 3 letters
     return Counter(words)
 
 
-def get_relevant_image_for_text(text: str):
+def get_keywords(text: str):
+    return [word for word, _ in extract_keywords(text).most_common(4)]
+
+
+def write_json(path: Path, data):
+    # Readers never see a partial file
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_name(f"{uuid.uuid4().hex}.tmp")
+    tmp_path.write_text(json.dumps(data))
+    os.replace(tmp_path, path)
+
+
+def read_json(path: Path, default):
     try:
+        return json.loads(path.read_text())
+    except (FileNotFoundError, ValueError):
+        return default
 
-        # Step 1: Extract keywords and form query
-        keyword_counts = extract_keywords(text)
-        keywords = [word for word, _ in keyword_counts.most_common(4)]
-        query = "+".join(keywords) or "random"
 
-        # Step 2: Fetch images from Pexels
-        response = requests.get(
-            f"https://api.pexels.com/v1/search?query={query}&per_page=9",
-            headers={"Authorization": settings.PEXELS_API_KEY},
-        )
-        response.raise_for_status()
-        photos = response.json()["photos"]
+def get_query_key(query: str, page: int = 1):
+    return hashlib.sha256(f"{query}:{page}".encode()).hexdigest()
 
-        if not photos:
-            return None  # No images found
 
-        # Step 3: Find best match based on 'alt' field
-        def score(photo):
-            alt_words = re.findall(r"\b[a-zA-Z]{4,}\b", photo["alt"].lower())
-            return sum(word in alt_words for word in keywords)
+def search_photos(query: str, page: int = 1):
+    """Pexels search results (id, alt, url), cached for PEXELS_QUERY_CACHE_SECONDS."""
+
+    cache_path = QUERIES_DIR / f"{get_query_key(query, page)}.json"
+    cached = read_json(cache_path, None)
+    if cached and time.time() - cached["fetched_at"] < settings.PEXELS_QUERY_CACHE_SECONDS:
+        return cached["photos"]
+
+    response = requests.get(
+        "https://api.pexels.com/v1/search",
+        params={"query": query, "per_page": 9, "page": page},
+        headers={"Authorization": settings.PEXELS_API_KEY},
+        timeout=settings.HTTP_TIMEOUT,
+    )
+    response.raise_for_status()
+
+    photos = [
+        {"id": str(photo["id"]), "alt": photo.get("alt") or "", "url": photo["src"]["large"]}
+        for photo in response.json()["photos"]
+    ]
+    write_json(cache_path, {"fetched_at": time.time(), "photos": photos})
+    return photos
 
-        scored_photos = [(photo, score(photo)) for photo in photos]
-        scored_photos.sort(key=lambda x: x[1], reverse=True)
 
-        best_photo = (
-            scored_photos[0][0] if scored_photos[0][1] > 0 else random.choice(photos)
-        )
-        photo_url = best_photo["src"]["large"]  # Or "original", "large", etc.
+def get_tags(text: str):
+    return set(re.findall(r"\b[a-zA-Z]{4,}\b", text.lower()))
+
+
+def pick_photo(photos: list, keywords: list):
+    # Best match based on the 'alt' field, random if nothing matches
+    scored_photos = [(photo, len(get_tags(photo["alt"]).intersection(keywords))) for photo in photos]
+    scored_photos.sort(key=lambda x: x[1], reverse=True)
+    return scored_photos[0][0] if scored_photos[0][1] > 0 else random.choice(photos)
+
+
+def download_background(photo: dict, image_path: Path):
+    response = requests.get(photo["url"], timeout=settings.HTTP_TIMEOUT)
+    response.raise_for_status()
+
+    with Image.open(io.BytesIO(response.content)) as img:
+        background = ImageOps.fit(img.convert("RGB"), BACKGROUND_SIZE, Image.LANCZOS)
+    background.save(image_path, quality=90)
+
+
+def pick_from_pool(keywords: list):
+    """(path, matched keywords) of the best pooled background, None if the pool is empty."""
+
+    index = read_json(INDEX_PATH, {})
+    if not index:
+        return None
+
+    scored = [(len(set(tags).intersection(keywords)), photo_id) for photo_id, tags in index.items()]
+    best_score = max(score for score, _ in scored)
+    photo_id = random.choice([photo_id for score, photo_id in scored if score == best_score])
+    path = POOL_DIR / f"{photo_id}.jpg"
+    # The modification time is when it was last picked, the refill evicts the oldest ones
+    os.utime(path)
+    return path, best_score
+
+
+def want_query(query: str):
+    WANTED_DIR.mkdir(parents=True, exist_ok=True)
+    (WANTED_DIR / f"{get_query_key(query)}.txt").write_text(query)
+
+
+def notify_error(err: Exception):
+    # The bg.jpg fallback keeps posts going, don't notify on every text card
+    try:
+        notified_at = NOTIFIED_PATH.stat().st_mtime
+    except FileNotFoundError:
+        notified_at = 0
+    if time.time() - notified_at < NOTIFY_INTERVAL_SECONDS:
+        return
 
-        img_response = requests.get(photo_url)
-        log.debug(img_response.content)
-        img_response.raise_for_status()
+    POOL_DIR.mkdir(parents=True, exist_ok=True)
+    NOTIFIED_PATH.touch()
+    send_notification("ImPosting", f"Error on pexels: {err}")
 
-        image_path = f"/tmp/{uuid.uuid4().hex}.png"
-        with open(image_path, "wb") as f:
-            f.write(img_response.content)
 
+def get_relevant_image_for_text(text: str):
+    keywords = get_keywords(text)
+    image_path = f"{settings.POSTER_TMP_DIR}/{uuid.uuid4().hex}.jpg"
+
+    try:
+
+        # Pre-downloaded backgrounds, no network call
+        pooled = pick_from_pool(keywords)
+        if pooled:
+            background_path, matched = pooled
+            if keywords and not matched:
+                # Closer matches for the next time, searched by the refill
+                want_query(" ".join(keywords))
+            shutil.copyfile(background_path, image_path)
+            return image_path
+
+        # Empty pool (first run), search and download now
+        photos = search_photos(" ".join(keywords) or "random")
+        if not photos:
+            raise Exception(f"No pexels photos for {keywords}")
+
+        download_background(pick_photo(photos, keywords), image_path)
         return image_path
-    
+
     except Exception as err:
         log.exception(err)
-        send_notification("ImPosting", f"Error on pexels: {err}")
-        
+        notify_error(err)
+
         src = Path(__file__).parent / "bg.jpg"
-        dst = f"/tmp/{uuid.uuid4().hex}.jpg"
-        shutil.copyfile(src, dst)
-        
-        return dst
+        shutil.copyfile(src, image_path)
+
+        return image_path
+
+
+def prune_pool(index: dict):
+    """Evict the least recently picked backgrounds above PEXELS_POOL_SIZE, returns how many were removed."""
+
+    def picked_at(photo_id: str):
+        try:
+            return (POOL_DIR / f"{photo_id}.jpg").stat().st_mtime
+        except FileNotFoundError:
+            return 0
+
+    evicted = sorted(index, key=picked_at)[: max(0, len(index) - settings.PEXELS_POOL_SIZE)]
+    for photo_id in evicted:
+        del index[photo_id]
+    if evicted:
+        # Index first, pickers don't get the removed photos from it anymore
+        write_json(INDEX_PATH, index)
+
+    # Evicted photos and downloads that never made it to the index
+    for path in POOL_DIR.glob("*.jpg"):
+        if path.stem not in index:
+            path.unlink(missing_ok=True)
+
+    return len(evicted)
+
+
+def expire_query_cache():
+    expired_at = time.time() - settings.PEXELS_QUERY_CACHE_SECONDS
+    for path in QUERIES_DIR.glob("*.json"):
+        try:
+            if path.stat().st_mtime < expired_at:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def refill_background_pool(max_searches: int):
+    """
+    Download backgrounds for the wanted queries, then for DEFAULT_QUERIES while
+    the pool is below PEXELS_POOL_SIZE. At most max_searches API calls per run
+    (photo downloads go to the CDN, they don't count). Returns how many were added.
+    The pool is then trimmed back to PEXELS_POOL_SIZE and expired searches removed.
+    """
+
+    index = read_json(INDEX_PATH, {})
+
+    wanted = sorted(WANTED_DIR.glob("*.txt"), key=lambda path: path.stat().st_mtime)
+    searches = [(path, path.read_text(), 1) for path in wanted[:max_searches]]
+    if len(index) < settings.PEXELS_POOL_SIZE:
+        searches += [
+            (None, random.choice(DEFAULT_QUERIES), random.randint(1, 20))
+            for _ in range(max_searches - len(searches))
+        ]
+
+    added = 0
+    for wanted_path, query, page in searches:
+        try:
+            photos = search_photos(query, page)
+        except requests.RequestException as err:
+            # Rate limited or down, try again next run
+            log.warning(f"Pexels refill stopped: {err}")
+            break
+
+        new_photos = [photo for photo in photos if photo["id"] not in index]
+        for photo in new_photos[:PHOTOS_PER_QUERY]:
+            try:
+                POOL_DIR.mkdir(parents=True, exist_ok=True)
+                download_background(photo, POOL_DIR / f"{photo['id']}.jpg")
+            except Exception as err:
+                log.warning(f"Could not download pexels photo {photo['id']}: {err}")
+                continue
+            index[photo["id"]] = sorted(get_tags(photo["alt"]) | set(query.split()))
+            added += 1
+
+        write_json(INDEX_PATH, index)
+        if wanted_path:
+            wanted_path.unlink(missing_ok=True)
+
+    evicted = prune_pool(index)
+    expire_query_cache()
+
+    if added or evicted:
+        log.info(f"Added {added} and evicted {evicted} pexels backgrounds ({len(index)} total)")
+    return added
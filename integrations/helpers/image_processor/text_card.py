@@ -0,0 +1,174 @@
+import os
+import uuid
+import shutil
+import hashlib
+import tempfile
+from pathlib import Path
+from functools import lru_cache
+from dataclasses import dataclass, replace
+from PIL import Image, ImageDraw, ImageFont, ImageOps
+
+
+FONT_PATH = Path(__file__).parent / "Inter_28pt-SemiBold.ttf"
+
+# Rendered cards, shared by the image worker processes
+CARDS_DIR = Path(tempfile.gettempdir()) / "text_cards"
+
+
+@dataclass(frozen=True)
+class CardStyle:
+    width: int = 1080
+    height: int = 1350
+    padding: int = 40
+    min_font_size: int = 16
+    max_font_size: int = 72
+    line_spacing: float = 1.5
+    background_color: str = "black"
+    text_color: str = "white"
+    # Photo under the text, covered by background_color at background_dim opacity
+    background_path: str = None
+    background_dim: float = 0.6
+
+    @property
+    def text_width(self):
+        return self.width - 2 * self.padding
+
+    @property
+    def text_height(self):
+        return self.height - 2 * self.padding
+
+    def line_height(self, font_size: int):
+        return int(font_size * self.line_spacing)
+
+
+@lru_cache(maxsize=None)
+def get_font(font_size: int):
+    return ImageFont.truetype(FONT_PATH, font_size)
+
+
+@lru_cache(maxsize=100_000)
+def get_text_width(text: str, font_size: int):
+    return get_font(font_size).getlength(text)
+
+
+def split_word(word: str, font_size: int, max_width: float):
+    # Words wider than a line (urls, hashtags) are cut where they overflow
+    parts = []
+    part = ""
+    for char in word:
+        if part and get_text_width(part + char, font_size) > max_width:
+            parts.append(part)
+            part = ""
+        part += char
+    return parts + [part]
+
+
+def wrap_text(text: str, font_size: int, max_width: float):
+    """Lines of text that fit max_width once drawn, manual line breaks are kept."""
+
+    lines = []
+    for paragraph in text.split("\n"):
+        line = ""
+        for word in paragraph.split():
+            candidate = f"{line} {word}" if line else word
+            if get_text_width(candidate, font_size) <= max_width:
+                line = candidate
+                continue
+
+            if line:
+                lines.append(line)
+            *full_parts, line = split_word(word, font_size, max_width)
+            lines.extend(full_parts)
+        lines.append(line)
+
+    return lines
+
+
+def fits(lines: list, font_size: int, style: CardStyle):
+    return len(lines) * style.line_height(font_size) <= style.text_height
+
+
+def layout_text(text: str, style: CardStyle):
+    """Largest font size (binary search) the wrapped text fits the card with, returns (font_size, lines)."""
+
+    low, high = style.min_font_size, style.max_font_size
+    best = None
+    while low <= high:
+        font_size = (low + high) // 2
+        lines = wrap_text(text, font_size, style.text_width)
+        if fits(lines, font_size, style):
+            best = (font_size, lines)
+            low = font_size + 1
+        else:
+            high = font_size - 1
+
+    if best:
+        return best
+
+    # Too long even at the smallest size, cut it instead of overflowing
+    font_size = style.min_font_size
+    lines = wrap_text(text, font_size, style.text_width)
+    max_lines = style.text_height // style.line_height(font_size)
+    lines = lines[:max_lines]
+    lines[-1] = lines[-1].rstrip() + "…"
+    while get_text_width(lines[-1], font_size) > style.text_width:
+        lines[-1] = lines[-1][:-2] + "…"
+    return font_size, lines
+
+
+def render_background(style: CardStyle):
+    size = (style.width, style.height)
+    background = Image.new("RGB", size, color=style.background_color)
+    if not style.background_path:
+        return background
+
+    with Image.open(style.background_path) as photo:
+        # JPEGs are decoded at the smallest scale still covering the card
+        photo.draft("RGB", size)
+        photo = ImageOps.fit(photo.convert("RGB"), size, Image.LANCZOS)
+
+    # Darkened so the text stays readable
+    return Image.blend(photo, background, style.background_dim)
+
+
+def render_text_card(text: str, style: CardStyle):
+    font_size, lines = layout_text(text, style)
+    font = get_font(font_size)
+    line_height = style.line_height(font_size)
+
+    image = render_background(style)
+    draw = ImageDraw.Draw(image)
+
+    # Vertically centered block of left aligned lines
+    y_position = style.padding + (style.text_height - len(lines) * line_height) // 2
+    for line in lines:
+        draw.text((style.padding, y_position), line, font=font, fill=style.text_color)
+        y_position += line_height
+
+    return image
+
+
+def get_card_path(text: str, style: CardStyle):
+    # Backgrounds are temporary copies, the card is keyed by their content
+    background = ""
+    if style.background_path:
+        background = hashlib.sha256(Path(style.background_path).read_bytes()).hexdigest()
+        style = replace(style, background_path=None)
+
+    key = hashlib.sha256(f"{style!r}\n{background}\n{text}".encode()).hexdigest()
+    return CARDS_DIR / f"{key}.png"
+
+
+def create_text_card(text: str, image_path: str, style: CardStyle = CardStyle()):
+    """Write the card of the text to image_path, rendered once per (text, style)."""
+
+    card_path = get_card_path(text, style)
+    if not card_path.exists():
+        CARDS_DIR.mkdir(parents=True, exist_ok=True)
+        # Other workers may render the same card, publish it atomically
+        tmp_path = CARDS_DIR / f"{uuid.uuid4().hex}.tmp.png"
+        render_text_card(text, style).save(tmp_path)
+        os.replace(tmp_path, card_path)
+
+    shutil.copy(card_path, image_path)
+    return image_path
@@ -0,0 +1,37 @@
+from core import settings
+from datetime import datetime, timedelta
+from django.db.models import Q, QuerySet
+from django.utils import timezone
+from socialsched.models import PostModel
+
+
+def get_claimable(now_utc: datetime):
+    # Unclaimed, or claimed by a job that crashed or failed a while ago
+    stale_before = now_utc - timedelta(seconds=settings.MEDIA_CLAIM_TIMEOUT_SECONDS)
+    return Q(media_claimed_at__isnull=True) | Q(media_claimed_at__lt=stale_before)
+
+
+def claim_media_posts(posts: QuerySet, limit: int):
+    """
+    Claim up to `limit` posts of the queryset for processing, soonest scheduled first.
+    Workers (threads or processes) racing for the same rows get disjoint posts.
+    Processing clears the claim, a failed job keeps it until it goes stale.
+    """
+
+    now_utc = timezone.now()
+    claimable = get_claimable(now_utc)
+
+    ids = list(
+        posts.filter(claimable).order_by("scheduled_on").values_list("pk", flat=True)[:limit]
+    )
+    if not ids:
+        return []
+
+    PostModel.objects.filter(claimable, pk__in=ids).update(media_claimed_at=now_utc)
+
+    return list(posts.filter(pk__in=ids, media_claimed_at=now_utc).order_by("scheduled_on"))
+
+
+def release_media_claims():
+    # Jobs of a previous run won't finish
+    return PostModel.objects.filter(media_claimed_at__isnull=False).update(media_claimed_at=None)
@@ -0,0 +1,100 @@
+from core import settings
+from core.logger import log
+from threading import Thread, Event
+from django.db import close_old_connections
+from .media_claims import release_media_claims
+from .process_images import process_images, get_image_workers, create_image_pool, close_image_pool
+from .process_videos import process_videos
+from .image_processor.pexels import refill_background_pool
+
+
+class MediaWorker:
+    """
+    Processes uploaded images and videos in the background, shortly after the post is saved.
+    The posts table is the queue: pending media rows are claimed (media_claimed_at)
+    so each one is handled by a single worker. Images go through the process pool
+    (started on the first poll, replaced only after a hung or crashed worker),
+    each video worker transcodes one video at a time. Text card backgrounds are
+    downloaded ahead of time every `refill_interval` seconds (None to disable).
+
+    media_worker = create_media_worker()
+    media_worker.start()
+    media_worker.stop()
+
+    """
+
+    def __init__(self, video_workers: int, poll_seconds: float, refill_interval: float = None):
+        self.video_workers = video_workers
+        self.poll_seconds = poll_seconds
+        self.refill_interval = refill_interval
+        self.stop_event = Event()
+        self.workers = []
+        self.image_pool = None
+
+    def start(self):
+        released = release_media_claims()
+        if released:
+            log.info(f"Released {released} media claims of the previous run")
+
+        jobs = [("media-images", self.process_images)]
+        jobs += [(f"media-videos-{idx}", process_videos) for idx in range(self.video_workers)]
+
+        for name, process in jobs:
+            worker = Thread(target=self.work, args=(process,), name=name)
+            worker.start()
+            self.workers.append(worker)
+
+        if self.refill_interval:
+            worker = Thread(target=self.refill_backgrounds, name="media-backgrounds")
+            worker.start()
+            self.workers.append(worker)
+
+    def stop(self):
+        # Jobs in progress finish, unprocessed posts keep waiting in the DB
+        self.stop_event.set()
+        for worker in self.workers:
+            worker.join()
+        if self.image_pool is not None:
+            close_image_pool(self.image_pool)
+            self.image_pool = None
+
+    def work(self, process):
+        while not self.stop_event.is_set():
+            try:
+                handled = process()
+            except Exception as err:
+                log.exception(err)
+                handled = 0
+            finally:
+                close_old_connections()
+
+            # Keep going while there is a backlog
+            if not handled:
+                self.stop_event.wait(self.poll_seconds)
+
+    def process_images(self):
+        if self.image_pool is None:
+            self.image_pool = create_image_pool(get_image_workers())
+
+        handled, pool_ok = process_images(self.image_pool)
+        if not pool_ok:
+            # Hung or crashed workers can't be reused, the next poll starts a new pool
+            close_image_pool(self.image_pool, terminate=True)
+            self.image_pool = None
+        return handled
+
+    def refill_backgrounds(self):
+        while not self.stop_event.is_set():
+            try:
+                refill_background_pool(settings.PEXELS_REFILL_SEARCHES)
+            except Exception as err:
+                log.exception(err)
+            self.stop_event.wait(self.refill_interval)
+
+
+def create_media_worker():
+    return MediaWorker(
+        settings.MEDIA_VIDEO_WORKERS,
+        settings.MEDIA_POLL_SECONDS,
+        refill_interval=settings.PEXELS_REFILL_INTERVAL_SECONDS if settings.PEXELS_API_KEY else None,
+    )
@@ -0,0 +1,173 @@
+import os
+from datetime import timedelta
+from threading import Thread, Event
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+from core import settings
+from core.logger import log
+from socialsched.models import PostModel, PLATFORM_FIELD_KEYS
+from integrations.models import IntegrationsModel, Platform
+from integrations.platforms.xtwitter import XPoster
+from integrations.platforms.linkedin import LinkedinPoster
+from integrations.platforms.facebook import FacebookPoster
+from integrations.platforms.instagram import InstagramPoster
+from integrations.platforms.common import Deadline
+from .utils import get_filepath_from_cloudflare_url
+from .renditions import get_platform_media_path
+
+
+def stage_on_x(integration: IntegrationsModel, post: PostModel, media_url: str, media_path: str):
+    return XPoster(integration).stage_media(media_path)
+
+
+def stage_on_linkedin(integration: IntegrationsModel, post: PostModel, media_url: str, media_path: str):
+    return LinkedinPoster(integration).stage_media(media_path)
+
+
+def stage_on_facebook(integration: IntegrationsModel, post: PostModel, media_url: str, media_path: str):
+    poster = FacebookPoster(
+        integration, deadline=Deadline.for_media_type(post.media_file_type)
+    )
+    return poster.stage_media(post.media_file_type, media_url, media_path)
+
+
+def stage_on_instagram(integration: IntegrationsModel, post: PostModel, media_url: str, media_path: str):
+    poster = InstagramPoster(
+        integration, deadline=Deadline.for_media_type(post.media_file_type)
+    )
+    return poster.stage_media(
+        post.description, post.media_file_type, media_url, media_path
+    )
+
+
+# TikTok direct posts are published as soon as the upload finishes so they can't be staged
+stage_methods = {
+    Platform.X_TWITTER.value: stage_on_x,
+    Platform.LINKEDIN.value: stage_on_linkedin,
+    Platform.FACEBOOK.value: stage_on_facebook,
+    Platform.INSTAGRAM.value: stage_on_instagram,
+}
+
+
+def get_posts_to_stage(now_utc, window: timedelta):
+    # scheduled_on is a wall clock time and timezones go up to UTC+14
+    latest_wall_clock = now_utc + window + timedelta(hours=14)
+
+    potential_posts = (
+        PostModel.objects.filter(
+            Q(post_on_x=True, staged_x__isnull=True)
+            | Q(post_on_instagram=True, staged_instagram__isnull=True)
+            | Q(post_on_facebook=True, staged_facebook__isnull=True)
+            | Q(post_on_linkedin=True, staged_linkedin__isnull=True),
+            scheduled_on__lte=latest_wall_clock,
+        )
+        .exclude(media_file="")
+        .exclude(media_file__isnull=True)
+    )
+
+    posts = []
+    for post in potential_posts.iterator(chunk_size=settings.POSTER_QUERY_CHUNK_SIZE):
+        if not post.media_ready:
+            continue
+        if now_utc < post.scheduled_aware <= now_utc + window:
+            posts.append(post)
+
+    return posts
+
+
+def stage_post(post: PostModel):
+    source_path = get_filepath_from_cloudflare_url(post.media_file.url)
+
+    staged = {}
+    try:
+        for platform, stage_method in stage_methods.items():
+            key = PLATFORM_FIELD_KEYS[platform]
+            if not getattr(post, f"post_on_{key}") or getattr(post, f"staged_{key}"):
+                continue
+
+            integration = IntegrationsModel.objects.filter(
+                account_id=post.account_id, platform=platform
+            ).first()
+            if not integration:
+                continue
+
+            media_path = source_path
+            try:
+                media_path = get_platform_media_path(platform, post.media_file_type, source_path)
+                media_url = f"{settings.APP_URL}/proxy-media-file/{os.path.basename(media_path)}"
+                staged[f"staged_{key}"] = stage_method(integration, post, media_url, media_path)
+                log.debug(f"Staged {platform} media for post {post.pk}")
+            except Exception as err:
+                # Publishing will do the full upload instead
+                log.warning(f"Could not stage {platform} media for post {post.pk}: {err}")
+            finally:
+                if media_path != source_path:
+                    os.remove(media_path)
+    finally:
+        os.remove(source_path)
+
+    if staged:
+        PostModel.objects.filter(pk=post.pk).update(staged_on=timezone.now(), **staged)
+
+    return staged
+
+
+def prestage_posts():
+    try:
+        now_utc = timezone.now()
+        window = timedelta(minutes=settings.PRESTAGE_WINDOW_MINUTES)
+
+        posts = get_posts_to_stage(now_utc, window)
+        if not posts:
+            return
+
+        log.debug(f"Got {len(posts)} posts to pre-stage")
+
+        for post in posts:
+            try:
+                stage_post(post)
+            except Exception as err:
+                log.exception(err)
+
+    except Exception as err:
+        log.exception(err)
+
+
+class PrestageWorker:
+    """
+    Stages media for posts due soon in its own thread, uploads can take as long
+    as the video deadline and must not hold up the ticks that queue due deliveries.
+
+    prestage_worker = PrestageWorker(interval=15)
+    prestage_worker.start()
+    prestage_worker.stop()
+
+    """
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        self.thread = Thread(target=self.run, name="prestage")
+        self.thread.start()
+
+    def stop(self):
+        # An upload in progress finishes, the rest is staged on next start
+        self.stop_event.set()
+        if self.thread:
+            self.thread.join()
+
+    def run(self):
+        while not self.stop_event.is_set():
+            try:
+                prestage_posts()
+            finally:
+                close_old_connections()
+            self.stop_event.wait(self.interval)
+
+
+def create_prestage_worker():
+    return PrestageWorker(settings.PRESTAGE_INTERVAL_SECONDS)
@@ -1,56 +1,244 @@
 import os
-from django.db.models import Q
+import time
+import multiprocessing
+from core import settings
+from django.db import transaction
 from django.core.files import File
 from core.logger import log, send_notification
-from socialsched.models import PostModel, MediaFileTypes
-from integrations.helpers.image_processor.make_image_postable import make_image_postable
+from socialsched.models import PostModel, MediaFileTypes, PENDING_POSTS
+from integrations.helpers.image_processor.make_image_postable import make_image_postable, render_image
 from integrations.helpers.utils import get_filepath_from_cloudflare_url
+from integrations.helpers.media_claims import claim_media_posts
+from integrations.helpers.renditions import (
+    IMAGE_4X5,
+    get_content_hash,
+    get_rendition_path,
+    save_rendition,
+    get_missing_platform_renditions,
+)
 
 
 
-def process_images():
-    try:
+def get_image_workers():
+    return settings.IMAGE_PROCESS_WORKERS or os.cpu_count() or 1
 
-        posts: list[PostModel] = PostModel.objects.filter(
-            process_image = True,
-            image_processed = False,
-            media_file_type = MediaFileTypes.IMAGE.value,
-        ).filter(
-            Q(post_on_x=True)
-            | Q(post_on_instagram=True)
-            | Q(post_on_facebook=True)
-            | Q(post_on_linkedin=True)
-            | Q(post_on_tiktok=True)
-        ).only("pk", "account_id", "description", "media_file")
-
-        if len(posts) == 0:
-            return
-
-        log.debug(f"Got {len(posts)} images to process")
-        
-        for post in posts:
-            try:
-                image_path = None
-                if post.media_file:
-                    image_path = get_filepath_from_cloudflare_url(post.media_file.url)                
 
-                image_path = make_image_postable(image_path, post.description)
+def create_image_pool(workers: int):
+    # Spawned workers don't inherit the poster threads, locks or db connections
+    return multiprocessing.get_context("spawn").Pool(workers)
+
 
-                log.debug(f"Processing {image_path}...")
+def close_image_pool(pool, terminate: bool = False):
+    # Hung workers never finish their job, they have to be killed
+    if terminate:
+        pool.terminate()
+    else:
+        pool.close()
+    pool.join()
 
-                with open(image_path, "rb") as f:
-                    post.media_file = File(f)
-                    post.image_processed = True
-                    post.save(skip_validation=True)
 
+def run_image_jobs(pool, jobs: list, timeout: float):
+    """
+    Run each (func, args) job in the pool, func must not need Django (spawned workers).
+    Returns the processed path or the exception of each job, TimeoutError for
+    jobs that didn't finish in time (hung or crashed worker).
+    """
+
+    results = [pool.apply_async(func, args) for func, args in jobs]
+
+    deadline = time.monotonic() + timeout
+    outcomes = []
+    for result in results:
+        try:
+            outcomes.append(result.get(timeout=max(0, deadline - time.monotonic())))
+        except multiprocessing.TimeoutError:
+            outcomes.append(TimeoutError("Image processing timed out"))
+        except Exception as err:
+            outcomes.append(err)
+
+    return outcomes
+
+
+def save_processed_images(processed: list):
+    # Upload first, then write the whole batch in one transaction
+    uploaded = []
+    for post, image_path in processed:
+        try:
+            with open(image_path, "rb") as f:
+                post.media_file.save(os.path.basename(image_path), File(f), save=False)
+            post.image_processed = True
+            post.media_claimed_at = None
+            uploaded.append(post)
+        except Exception as err:
+            log.exception(err)
+            send_notification("ImPosting", f"Got error on saving processed image {err}")
+        finally:
+            if os.path.exists(image_path):
                 os.remove(image_path)
 
-                log.debug(f"Done processing {image_path}!")
-                
+    with transaction.atomic():
+        for post in uploaded:
+            post.save(
+                skip_validation=True,
+                update_fields=["media_file", "image_processed", "media_claimed_at"],
+            )
+
+
+def render_platform_renditions(pool, processed: list):
+    """
+    Render in the pool what publishing the processed images will need, instead of when the post is due.
+    Returns False if a job timed out and the pool has to be replaced.
+    """
+
+    jobs = []
+    for post, image_path in processed:
+        try:
+            for spec, source_hash in get_missing_platform_renditions(
+                post, MediaFileTypes.IMAGE.value, image_path
+            ):
+                jobs.append((post, spec, source_hash, spec.get_image_job(image_path)))
+        except Exception as err:
+            # Publishing renders it again
+            log.warning(f"Could not prepare the renditions of post {post.pk}: {err}")
+
+    if not jobs:
+        return True
+
+    outcomes = run_image_jobs(
+        pool,
+        [job for _, _, _, job in jobs],
+        settings.IMAGE_PROCESS_TIMEOUT_SECONDS,
+    )
+
+    pool_ok = True
+    for (post, spec, source_hash, (_, args)), outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            pool_ok = pool_ok and not isinstance(outcome, TimeoutError)
+            log.warning(f"Could not render {spec.name} for post {post.pk}: {outcome}")
+            if os.path.exists(args[0]):
+                os.remove(args[0])
+            continue
+
+        path, params = outcome
+        try:
+            save_rendition(source_hash, spec, path, params)
+        except Exception as err:
+            log.warning(f"Could not save {spec.name} for post {post.pk}: {err}")
+        finally:
+            if os.path.exists(path):
+                os.remove(path)
+
+    return pool_ok
+
+
+def get_image_job(post: PostModel):
+    """(source path, source hash, job), the job is None if the image was processed before."""
+
+    # Text only posts get an image made from the text
+    if not post.media_file:
+        return None, None, (make_image_postable, (None, post.description))
+
+    source_path = get_filepath_from_cloudflare_url(post.media_file.url)
+    source_hash = get_content_hash(source_path)
+
+    # Same upload already processed for another post or retry
+    rendition_path = get_rendition_path(source_hash, IMAGE_4X5)
+    if rendition_path:
+        os.remove(source_path)
+        return rendition_path, source_hash, None
+
+    job = (render_image, (source_path, IMAGE_4X5.width, IMAGE_4X5.height, IMAGE_4X5.max_bytes))
+    return source_path, source_hash, job
+
+
+def process_image_batch(pool, posts: list):
+    """Returns False if a job timed out and the pool has to be replaced."""
+
+    processed = []
+    jobs = []
+    for post in posts:
+        try:
+            source_path, source_hash, job = get_image_job(post)
+            if job is None:
+                processed.append((post, source_path))
+            else:
+                jobs.append((post, source_path, source_hash, job))
+        except Exception as err:
+            log.exception(err)
+            send_notification("ImPosting", f"Got error on processing image {err}")
+
+    outcomes = run_image_jobs(
+        pool,
+        [job for _, _, _, job in jobs],
+        settings.IMAGE_PROCESS_TIMEOUT_SECONDS,
+    )
+
+    pool_ok = True
+    for (post, source_path, source_hash, _), outcome in zip(jobs, outcomes):
+        if isinstance(outcome, Exception):
+            pool_ok = pool_ok and not isinstance(outcome, TimeoutError)
+            log.error(f"Image processing failed for post {post.pk}: {outcome}")
+            send_notification("ImPosting", f"Got error on processing image {outcome}")
+            if source_path and os.path.exists(source_path):
+                os.remove(source_path)
+            continue
+
+        # Uploads give (path, encoder params), text only posts a path
+        if source_hash:
+            outcome, params = outcome
+            try:
+                save_rendition(source_hash, IMAGE_4X5, outcome, params)
             except Exception as err:
                 log.exception(err)
-                send_notification("ImPosting", f"Got error on processing image {err}")
+
+        log.debug(f"Processed {outcome}")
+        processed.append((post, outcome))
+
+    pool_ok = render_platform_renditions(pool, processed) and pool_ok
+    save_processed_images(processed)
+
+    return pool_ok
+
+
+def process_images(pool):
+    """
+    Process the claimable images in the pool.
+    Returns how many posts were handled and False if the pool has to be replaced.
+    """
+
+    processed = 0
+    try:
+
+        # Only the columns used here, the saves leave the calendar counts alone
+        posts = PostModel.objects.filter(
+            process_image = True,
+            image_processed = False,
+            media_file_type = MediaFileTypes.IMAGE.value,
+        ).filter(PENDING_POSTS).only(
+            "pk",
+            "account_id",
+            "description",
+            "media_file",
+            "post_on_x",
+            "post_on_instagram",
+            "post_on_facebook",
+            "post_on_linkedin",
+            "post_on_tiktok",
+        )
+
+        # One image per worker at a time, so the timeout applies to each job
+        workers = get_image_workers()
+        batch = claim_media_posts(posts, workers)
+        while batch:
+            pool_ok = process_image_batch(pool, batch)
+            processed += len(batch)
+            if not pool_ok:
+                # Hung or crashed workers can't be reused
+                return processed, False
+            batch = claim_media_posts(posts, workers)
 
     except Exception as err:
         log.exception(err)
         send_notification("ImPosting", f"Got error on processing images {err}")
+
+    return processed, True
@@ -1,60 +1,70 @@
 import os
-import uuid
-import requests
-from django.db.models import Q
 from django.core.files import File
-from socialsched.models import PostModel, MediaFileTypes
+from socialsched.models import PostModel, MediaFileTypes, PENDING_POSTS
 from core.logger import log, send_notification
-from integrations.helpers.video_processor.make_video_postable import make_video_postable
-
+from integrations.helpers.utils import get_filepath_from_cloudflare_url
+from integrations.helpers.media_claims import claim_media_posts
+from integrations.helpers.renditions import (
+    VIDEO_9X16,
+    get_or_render,
+    prepare_platform_renditions,
+)
 
 
 def process_videos():
+    """Process the claimable videos one at a time, returns how many posts were handled."""
+
+    processed = 0
     try:
 
-        posts: list[PostModel] = PostModel.objects.filter(
+        # Only the columns used here, the saves leave the calendar counts alone
+        posts = PostModel.objects.filter(
             process_video = True,
             video_processed = False,
             media_file_type = MediaFileTypes.VIDEO.value,
-        ).filter(
-            Q(post_on_x=True)
-            | Q(post_on_instagram=True)
-            | Q(post_on_facebook=True)
-            | Q(post_on_linkedin=True)
-            | Q(post_on_tiktok=True)
-        ).only("pk", "account_id", "description", "media_file")
-
-        if len(posts) == 0:
-            return
+        ).filter(PENDING_POSTS).only(
+            "pk",
+            "account_id",
+            "media_file",
+            "post_on_x",
+            "post_on_instagram",
+            "post_on_facebook",
+            "post_on_linkedin",
+            "post_on_tiktok",
+        )
 
-        log.debug(f"Got {len(posts)} videos to process")
-        
-        for post in posts:
+        # Each video worker claims its own post
+        while batch := claim_media_posts(posts, 1):
+            post = batch[0]
+            processed += 1
             try:
 
-                ext = os.path.splitext(post.media_file.url)[1].lower()
-                ext = ext.split("?")[0]
-                vid_response = requests.get(post.media_file.url)
-                vid_response.raise_for_status()
+                source_path = get_filepath_from_cloudflare_url(post.media_file.url)
 
-                video_path = f"/tmp/{uuid.uuid4().hex}{ext}"
+                log.debug(f"Processing {source_path}...")
 
-                log.debug(f"Processing {video_path}...")
-        
-                with open(video_path, "wb") as f:
-                    f.write(vid_response.content)
+                # Same upload already transcoded for another post or retry
+                try:
+                    video_path = get_or_render(VIDEO_9X16, source_path)
+                finally:
+                    os.remove(source_path)
 
-                video_path = make_video_postable(video_path, post.description)
+                try:
+                    with open(video_path, "rb") as f:
+                        post.media_file = File(f)
+                        post.video_processed = True
+                        post.media_claimed_at = None
+                        post.save(
+                            skip_validation=True,
+                            update_fields=["media_file", "video_processed", "media_claimed_at"],
+                        )
 
-                with open(video_path, "rb") as f:
-                    post.media_file = File(f)
-                    post.video_processed = True
-                    post.save(skip_validation=True)
+                    prepare_platform_renditions(post, MediaFileTypes.VIDEO.value, video_path)
+                finally:
+                    os.remove(video_path)
 
-                os.remove(video_path)
-                
                 log.debug(f"Done processing {video_path}!")
-                
+
             except Exception as err:
                 log.exception(err)
                 send_notification("ImPosting", f"Got error on processing video {err}")
@@ -63,3 +73,5 @@ def process_videos():
         log.exception(err)
         send_notification("ImPosting", f"Got error on processing videos {err}")
 
+    return processed
+
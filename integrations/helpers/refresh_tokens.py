@@ -1,11 +1,16 @@
+import heapq
 import requests
 from datetime import datetime
 from datetime import timedelta
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from threading import Thread, Event, Lock, Condition
 from core import settings
 from django.utils import timezone
 from core.logger import log, send_notification
 from integrations.models import IntegrationsModel, Platform
-from django.db.models import Q
+from integrations.platforms.common import Deadline, ErrorDeadlineExceeded
+from django.db import close_old_connections
 
 
 def refresh_access_token_for_x(integration: IntegrationsModel):
@@ -29,7 +34,13 @@ def refresh_access_token_for_x(integration: IntegrationsModel):
         }
 
         log.info(f"Refreshing access token for account {integration.account_id}")
-        response = requests.post(token_url, data=data, headers=headers, auth=auth)
+        response = requests.post(
+            token_url,
+            data=data,
+            headers=headers,
+            auth=auth,
+            timeout=settings.HTTP_TIMEOUT,
+        )
         response.raise_for_status()
 
         new_token = response.json()
@@ -99,7 +110,12 @@ def refresh_access_token_for_facebook(integration: IntegrationsModel):
         log.info(
             f"Refreshing Facebook access token for account {integration.account_id}"
         )
-        response = requests.get(token_url, params=params, headers=headers)
+        response = requests.get(
+            token_url,
+            params=params,
+            headers=headers,
+            timeout=settings.HTTP_TIMEOUT,
+        )
         response.raise_for_status()
 
         new_token_data = response.json()
@@ -153,7 +169,12 @@ def refresh_access_token_for_tiktok(integration: IntegrationsModel):
         }
 
         log.info(f"Refreshing access token for TikTok account {integration.account_id}")
-        response = requests.post(token_url, data=data, headers=headers)
+        response = requests.post(
+            token_url,
+            data=data,
+            headers=headers,
+            timeout=settings.HTTP_TIMEOUT,
+        )
         response.raise_for_status()
 
         new_token = response.json()
@@ -197,20 +218,182 @@ refresh_methods = {
 }
 
 
-def refresh_tokens():
-    try:
-
-        time_threshold = timezone.now() + timedelta(minutes=15)
-
+# Tokens are refreshed this long before they expire
+REFRESH_LEAD = timedelta(minutes=15)
+
+
+def get_refresh_due(integration: IntegrationsModel):
+    expires = [e for e in [integration.access_expire, integration.refresh_expire] if e]
+    if not expires:
+        return None
+    return min(expires) - REFRESH_LEAD
+
+
+class RefreshScheduler:
+    """
+    Min-heap of integrations keyed by when their tokens need a refresh.
+    Sleeps until the next one is due and refreshes in a bounded pool.
+    The heap is resynced from the DB periodically to pick up new authorizations.
+
+    refresh_scheduler.start()
+    integration = refresh_scheduler.ensure_fresh(integration, deadline)  # just in time before posting
+    refresh_scheduler.stop()
+
+    """
+
+    def __init__(self, workers: int, resync_interval: timedelta):
+        self.workers = workers
+        self.resync_interval = resync_interval
+        self.heap = []  # (due, integration pk)
+        self.scheduled = {}  # integration pk -> due, older heap entries are stale
+        self.locks = defaultdict(Lock)  # one refresh at a time per integration
+        self.condition = Condition()
+        self.stop_event = Event()
+        self.thread = None
+        self.pool = None
+
+    def start(self):
+        self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix="refresh")
+        self.thread = Thread(target=self.run, name="refresh-scheduler")
+        self.thread.start()
+
+    def stop(self):
+        self.stop_event.set()
+        with self.condition:
+            self.condition.notify_all()
+        if self.thread:
+            self.thread.join()
+        if self.pool:
+            self.pool.shutdown(wait=True)
+            self.pool = None
+
+    def schedule(self, pk: int, due: datetime):
+        with self.condition:
+            if due is None:
+                self.scheduled.pop(pk, None)
+                return
+            self.scheduled[pk] = due
+            heapq.heappush(self.heap, (due, pk))
+            self.condition.notify_all()
+
+    def resync(self):
         integrations = IntegrationsModel.objects.filter(
-            Q(access_expire__lte=time_threshold) | Q(refresh_expire__lte=time_threshold)
-        )
+            platform__in=refresh_methods.keys()
+        ).only("pk", "platform", "access_expire", "refresh_expire")
 
-        for integration in integrations:
-            refresh_method = refresh_methods.get(integration.platform)
-            if refresh_method:
-                refresh_method(integration)
+        with self.condition:
+            self.heap = []
+            self.scheduled = {}
 
-    except Exception as err:
-        log.exception(err)
-        send_notification("ImPosting", f"Could not refresh tokens because {err}")
+        pks = set()
+        for integration in integrations:
+            pks.add(integration.pk)
+            self.schedule(integration.pk, get_refresh_due(integration))
+
+        # Locks of deleted integrations
+        with self.condition:
+            for pk in set(self.locks) - pks:
+                del self.locks[pk]
+
+    def get_lock(self, pk: int):
+        with self.condition:
+            return self.locks[pk]
+
+    def pop_due(self, now: datetime):
+        with self.condition:
+            due_pks = []
+            while self.heap and self.heap[0][0] <= now:
+                due, pk = heapq.heappop(self.heap)
+                if self.scheduled.get(pk) == due:
+                    del self.scheduled[pk]
+                    due_pks.append(pk)
+            return due_pks
+
+    def run(self):
+        next_resync = timezone.now()
+
+        while not self.stop_event.is_set():
+            try:
+                now = timezone.now()
+                if now >= next_resync:
+                    self.resync()
+                    next_resync = now + self.resync_interval
+
+                for pk in self.pop_due(now):
+                    self.pool.submit(self.refresh, pk)
+
+                with self.condition:
+                    wake_at = next_resync
+                    if self.heap:
+                        wake_at = min(wake_at, self.heap[0][0])
+                    timeout = (wake_at - timezone.now()).total_seconds()
+                    if timeout > 0 and not self.stop_event.is_set():
+                        self.condition.wait(timeout)
+
+            except Exception as err:
+                log.exception(err)
+                send_notification("ImPosting", f"Could not refresh tokens because {err}")
+                self.stop_event.wait(5)
+
+    def refresh(self, pk: int):
+        try:
+            with self.get_lock(pk):
+                # Reload, it may have been refreshed or re-authorized in the meantime
+                integration = IntegrationsModel.objects.filter(pk=pk).first()
+                if integration is None:
+                    return
+
+                due = get_refresh_due(integration)
+                if due is not None and due <= timezone.now():
+                    refresh_method = refresh_methods.get(integration.platform)
+                    if refresh_method:
+                        refresh_method(integration)
+
+                integration = IntegrationsModel.objects.filter(pk=pk).first()
+                if integration is None:
+                    return
+
+                due = get_refresh_due(integration)
+                if due is not None and due <= timezone.now():
+                    # Nothing to refresh yet (LinkedIn), check again when it expires
+                    expires = due + REFRESH_LEAD
+                    due = max(expires, timezone.now() + timedelta(minutes=1))
+                self.schedule(pk, due)
+
+        except Exception as err:
+            log.exception(err)
+            send_notification("ImPosting", f"Could not refresh tokens because {err}")
+        finally:
+            close_old_connections()
+
+    def ensure_fresh(self, integration: IntegrationsModel, deadline: Deadline = None):
+        """
+        Refresh a (preloaded) integration if it's due and return the up to date one.
+        The refresh runs in the scheduler pool, the caller waits for it at most until the deadline.
+        """
+
+        if integration is None:
+            return None
+
+        due = get_refresh_due(integration)
+        if due is None or due > timezone.now():
+            return integration
+
+        if self.pool is None:
+            # Scheduler not started (shell, tests)
+            self.refresh(integration.pk)
+        else:
+            future = self.pool.submit(self.refresh, integration.pk)
+            try:
+                future.result(timeout=max(0, deadline.remaining()) if deadline else None)
+            except FutureTimeoutError:
+                # The refresh goes on, the post is picked up again on a later tick
+                raise ErrorDeadlineExceeded
+
+        return IntegrationsModel.objects.filter(pk=integration.pk).first()
+
+
+refresh_scheduler = RefreshScheduler(
+    workers=settings.TOKEN_REFRESH_WORKERS,
+    resync_interval=timedelta(seconds=settings.TOKEN_REFRESH_RESYNC_SECONDS),
+)
@@ -0,0 +1,182 @@
+import os
+import uuid
+import shutil
+import hashlib
+import requests
+from core import settings
+from core.logger import log
+from dataclasses import dataclass
+from django.core.files import File
+from django.db import transaction, IntegrityError
+from socialsched.models import PostModel, MediaFileTypes, PLATFORM_FIELD_KEYS
+from integrations.models import MediaRenditionModel, Platform
+from .utils import get_filepath_from_cloudflare_url
+from .image_processor.make_image_postable import render_image
+from .video_processor.make_video_postable import process_video
+
+
+@dataclass(frozen=True)
+class RenditionSpec:
+    name: str
+    media_type: str
+    width: int
+    height: int
+    max_bytes: int = None
+
+    def get_image_job(self, source_path: str):
+        """(func, args) rendering a copy of the image, runs in the image pool (no Django needed)."""
+
+        ext = os.path.splitext(source_path)[1].lower()
+        output_path = f"{settings.POSTER_TMP_DIR}/{uuid.uuid4().hex}{ext}"
+        shutil.copy(source_path, output_path)
+        return render_image, (output_path, self.width, self.height, self.max_bytes)
+
+    def render(self, source_path: str):
+        """New file in POSTER_TMP_DIR (served by proxy_media_file), returns (path, params)."""
+
+        if self.media_type == MediaFileTypes.IMAGE.value:
+            func, args = self.get_image_job(source_path)
+            return func(*args)
+
+        output_path = f"{settings.POSTER_TMP_DIR}/{uuid.uuid4().hex}.mp4"
+        process_video(source_path, output_path, self.width, self.height)
+        return output_path, {"format": "mp4", "width": self.width, "height": self.height}
+
+
+# Image upload limits, the shared renditions fit the smallest of them
+IMAGE_BYTE_LIMITS = {
+    Platform.X_TWITTER.value: 5 * 1024 * 1024,
+    Platform.LINKEDIN.value: 5 * 1024 * 1024,
+    Platform.FACEBOOK.value: 4 * 1024 * 1024,
+    Platform.INSTAGRAM.value: 8 * 1024 * 1024,
+}
+
+IMAGE_4X5 = RenditionSpec(
+    "image_1080x1350", MediaFileTypes.IMAGE.value, 1080, 1350, min(IMAGE_BYTE_LIMITS.values())
+)
+VIDEO_9X16 = RenditionSpec("video_1080x1920", MediaFileTypes.VIDEO.value, 1080, 1920)
+# X rejects videos above 1200x1900
+VIDEO_X = RenditionSpec("video_720x1280", MediaFileTypes.VIDEO.value, 720, 1280)
+
+# What the media worker turns uploads into (post.media_file)
+DEFAULT_RENDITIONS = {
+    MediaFileTypes.IMAGE.value: IMAGE_4X5,
+    MediaFileTypes.VIDEO.value: VIDEO_9X16,
+}
+
+# Platforms that need something else than the processed post media
+PLATFORM_RENDITIONS = {
+    (Platform.X_TWITTER.value, MediaFileTypes.VIDEO.value): VIDEO_X,
+}
+
+
+def get_content_hash(path: str):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def is_missing_file_error(err: Exception):
+    if isinstance(err, FileNotFoundError):
+        return True
+    return (
+        isinstance(err, requests.HTTPError)
+        and err.response is not None
+        and err.response.status_code == 404
+    )
+
+
+def get_rendition_path(source_hash: str, spec: RenditionSpec):
+    """Local copy of the stored rendition or None if it wasn't rendered yet."""
+
+    rendition = MediaRenditionModel.objects.filter(source_hash=source_hash, spec=spec.name).first()
+    if rendition is None:
+        return None
+
+    try:
+        return get_filepath_from_cloudflare_url(rendition.media_file.url)
+    except Exception as err:
+        if is_missing_file_error(err):
+            # Gone from storage, it will be rendered again
+            log.warning(f"Rendition {rendition.pk} is missing: {err}")
+            rendition.delete()
+        else:
+            # Storage hiccup, render it this time and keep the stored one
+            log.warning(f"Rendition {rendition.pk} is not available: {err}")
+        return None
+
+
+def save_rendition(source_hash: str, spec: RenditionSpec, path: str, params: dict = None):
+    rendition = MediaRenditionModel(source_hash=source_hash, spec=spec.name, params=params or {})
+    with open(path, "rb") as f:
+        rendition.media_file.save(os.path.basename(path), File(f), save=False)
+
+    try:
+        with transaction.atomic():
+            rendition.save()
+    except IntegrityError:
+        # Another worker stored the same rendition first
+        rendition.media_file.delete(save=False)
+
+
+def get_or_render(spec: RenditionSpec, source_path: str, source_hash: str = None):
+    """Local path of the spec rendition of the source file, rendered and stored on first use."""
+
+    source_hash = source_hash or get_content_hash(source_path)
+
+    path = get_rendition_path(source_hash, spec)
+    if path is None:
+        path, params = spec.render(source_path)
+        save_rendition(source_hash, spec, path, params)
+
+    return path
+
+
+def get_platform_media_path(platform: str, media_type: str, media_path: str):
+    """
+    Media file to upload to the platform: the processed post media,
+    or a new local file with the platform rendition of it (remove both when done).
+    """
+
+    spec = PLATFORM_RENDITIONS.get((platform, media_type))
+    if spec is None:
+        return media_path
+    return get_or_render(spec, media_path)
+
+
+def get_missing_platform_renditions(post: PostModel, media_type: str, media_path: str):
+    """(spec, source hash) of the platform renditions publishing the post will need and weren't rendered yet."""
+
+    specs = [
+        PLATFORM_RENDITIONS[(platform, media_type)]
+        for platform, key in PLATFORM_FIELD_KEYS.items()
+        if (platform, media_type) in PLATFORM_RENDITIONS and getattr(post, f"post_on_{key}")
+    ]
+    if not specs:
+        return []
+
+    source_hash = get_content_hash(media_path)
+    rendered = set(
+        MediaRenditionModel.objects.filter(
+            source_hash=source_hash, spec__in=[spec.name for spec in specs]
+        ).values_list("spec", flat=True)
+    )
+    return [(spec, source_hash) for spec in dict.fromkeys(specs) if spec.name not in rendered]
+
+
+def prepare_platform_renditions(post: PostModel, media_type: str, media_path: str):
+    # Render ahead of time what publishing will need, instead of when the post is due
+    try:
+        missing = get_missing_platform_renditions(post, media_type, media_path)
+    except Exception as err:
+        log.warning(f"Could not check the renditions of post {post.pk}: {err}")
+        return
+
+    for spec, source_hash in missing:
+        try:
+            os.remove(get_or_render(spec, media_path, source_hash))
+        except Exception as err:
+            # Publishing renders it again
+            log.warning(f"Could not render {spec.name} for post {post.pk}: {err}")
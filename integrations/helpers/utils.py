@@ -7,19 +7,19 @@ from core import settings
 from pathlib import Path
 from django.core.cache import cache
 from integrations.models import IntegrationsModel, Platform
-from integrations.platforms.tiktok import TikTokPoster
+from integrations.platforms.tiktok import TikTokPoster, get_creator_info_cache_key
 
 
 
 def get_filepath_from_cloudflare_url(url: str):
     """
     Get a local filepath for a media URL.
-    If URL is remote (http/https), downloads to /tmp.
-    If URL is local (/media/...), copies from MEDIA_ROOT to /tmp.
+    If URL is remote (http/https), downloads to POSTER_TMP_DIR.
+    If URL is local (/media/...), copies from MEDIA_ROOT to POSTER_TMP_DIR.
     """
     ext = os.path.splitext(url)[1].lower()
     ext = ext.split("?")[0]
-    filepath = f"/tmp/{uuid.uuid4().hex}{ext}"
+    filepath = f"{settings.POSTER_TMP_DIR}/{uuid.uuid4().hex}{ext}"
 
     # Check if it's a local URL (starts with /media/)
     if url.startswith("/media/") and settings.MEDIA_ROOT:
@@ -33,7 +33,7 @@ def get_filepath_from_cloudflare_url(url: str):
             raise FileNotFoundError(f"Media file not found: {source_path}")
     
     # Remote URL - download it
-    response = requests.get(url)
+    response = requests.get(url, timeout=settings.HTTP_TIMEOUT)
     response.raise_for_status()
 
     with open(filepath, "wb") as f:
@@ -44,9 +44,7 @@ def get_filepath_from_cloudflare_url(url: str):
 
 def get_tiktok_creator_info(account_id: int):
 
-    key = f"tiktok_creator_info_{account_id}"
-
-    result = cache.get(key)
+    result = cache.get(get_creator_info_cache_key(account_id))
     if result:
         return result
 
@@ -59,53 +57,74 @@ def get_tiktok_creator_info(account_id: int):
 
     poster = TikTokPoster(integration)
 
-    result = poster.get_creator_info()
+    result = poster.get_cached_creator_info()
 
     if result is None:
-        cache.delete(key)
-        integration.delete()
-    
-    cache.set(key, value=result)
+        # A reached posting cap doesn't mean the authorization is gone
+        if not poster.quota_exhausted:
+            integration.delete()
+        return
+
     return result
 
 
 
 def delete_tmp_media_files():
-
-    for file_path in Path("/tmp").iterdir():
-        if file_path.is_file() and file_path.suffix.lower() in {".png", ".jpeg", ".jpg", ".mp4"}:
-            try:
+    # Only run before the workers start, they keep their media in the same directory
+    for file_path in Path(settings.POSTER_TMP_DIR).iterdir():
+        try:
+            if file_path.is_dir():
+                shutil.rmtree(file_path)
+            else:
                 file_path.unlink()
-            except Exception as err:
-                log.exception(err)
+        except Exception as err:
+            log.exception(err)
+
 
 
+def get_integrations_context_cache_key(social_uid: int):
+    return f"integrations_context_{social_uid}"
+
+
+def delete_integrations_context(social_uid: int):
+    cache.delete(get_integrations_context_cache_key(social_uid))
+
 
 def get_integrations_context(social_uid: int):
 
-    linkedin_integration = IntegrationsModel.objects.filter(
-        account_id=social_uid, platform=Platform.LINKEDIN.value
-    ).first()
+    key = get_integrations_context_cache_key(social_uid)
+
+    context = cache.get(key)
+    if context is not None:
+        return context
+
+    context = build_integrations_context(social_uid)
+
+    # Less than the signed avatar urls are valid for
+    cache.set(key, context, timeout=settings.INTEGRATIONS_CONTEXT_CACHE_SECONDS)
+    return context
+
+
+def build_integrations_context(social_uid: int):
+
+    integrations = {
+        integration.platform: integration
+        for integration in IntegrationsModel.objects.filter(account_id=social_uid)
+    }
+
+    linkedin_integration = integrations.get(Platform.LINKEDIN.value)
     linkedin_ok = bool(linkedin_integration)
 
-    x_integration = IntegrationsModel.objects.filter(
-        account_id=social_uid, platform=Platform.X_TWITTER.value
-    ).first()
+    x_integration = integrations.get(Platform.X_TWITTER.value)
     x_ok = bool(x_integration)
 
-    tiktok_integration = IntegrationsModel.objects.filter(
-        account_id=social_uid, platform=Platform.TIKTOK.value
-    ).first()
+    tiktok_integration = integrations.get(Platform.TIKTOK.value)
     tiktok_ok = bool(tiktok_integration)
 
-    facebook_integration = IntegrationsModel.objects.filter(
-        account_id=social_uid, platform=Platform.FACEBOOK.value
-    ).first()
+    facebook_integration = integrations.get(Platform.FACEBOOK.value)
     facebook_ok = bool(facebook_integration)
 
-    instagram_integration = IntegrationsModel.objects.filter(
-        account_id=social_uid, platform=Platform.INSTAGRAM.value
-    ).first()
+    instagram_integration = integrations.get(Platform.INSTAGRAM.value)
     instagram_ok = bool(instagram_integration)
 
     x_expire = None
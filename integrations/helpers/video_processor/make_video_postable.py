@@ -10,8 +10,7 @@ def has_audio_stream(video_path: str) -> bool:
     return any(stream["codec_type"] == "audio" for stream in probe["streams"])
 
 
-def process_video(video_path: str, output_path: str) -> None:
-    width, height = 1080, 1920
+def process_video(video_path: str, output_path: str, width: int = 1080, height: int = 1920) -> None:
     fps = 30
     max_duration = 90
 
@@ -21,7 +20,7 @@ def process_video(video_path: str, output_path: str) -> None:
     # Trim and reset timestamps
     video = video_input.trim(start=0, end=max_duration).setpts("PTS-STARTPTS")
 
-    # Scale to at least 1080x1920 then crop to exact frame
+    # Scale to at least width x height then crop to exact frame
     video = (
         video.filter("scale", width, height, force_original_aspect_ratio="increase")
              .filter("crop", width, height)
@@ -1,16 +1,34 @@
+import time
 import signal
+from core import settings
 from core.logger import log
 from threading import Thread, Event
 from django.core.management.base import BaseCommand
 from integrations.helpers.post_management import post_scheduled_posts
+from integrations.helpers.dispatcher import create_dispatcher
+from integrations.helpers.media_worker import create_media_worker
+from integrations.helpers.prestage import create_prestage_worker
+from integrations.helpers.refresh_tokens import refresh_scheduler
+from integrations.helpers.archive_posts import archive_posts
+from integrations.helpers.utils import delete_tmp_media_files
 
 stop_event = Event()
 
 
-def runner():
+def runner(dispatcher):
     buffer_seconds = 0
+    next_archive_at = 0
     while not stop_event.is_set():        
-        buffer_seconds = post_scheduled_posts(buffer_seconds)
+        buffer_seconds = post_scheduled_posts(buffer_seconds, dispatcher)
+
+        # Keep the live posts table small
+        if time.monotonic() >= next_archive_at:
+            try:
+                archive_posts()
+            except Exception as err:
+                log.exception(err)
+            next_archive_at = time.monotonic() + settings.POST_ARCHIVE_INTERVAL_SECONDS
+
         stop_event.wait(5)
         buffer_seconds += 5
 
@@ -27,7 +45,21 @@ class Command(BaseCommand):
         signal.signal(signal.SIGTERM, handle_signal)
         signal.signal(signal.SIGINT, handle_signal)
 
-        poster = Thread(target=runner)
+        # Media left behind by a previous run, before any worker downloads new media
+        delete_tmp_media_files()
+
+        refresh_scheduler.start()
+
+        media_worker = create_media_worker()
+        media_worker.start()
+
+        prestage_worker = create_prestage_worker()
+        prestage_worker.start()
+
+        dispatcher = create_dispatcher()
+        dispatcher.start()
+
+        poster = Thread(target=runner, args=(dispatcher,))
         log.info("Poster started!")
         poster.start()
 
@@ -39,4 +71,9 @@ class Command(BaseCommand):
         finally:
             stop_event.set()
             poster.join()
+            log.info("Waiting for in-flight deliveries to finish...")
+            dispatcher.stop()
+            prestage_worker.stop()
+            media_worker.stop()
+            refresh_scheduler.stop()
             log.info("Poster stopped cleanly.")
@@ -0,0 +1,31 @@
+# Generated by Django 5.2 on 2026-10-19 19:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='QuotaLedgerModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.IntegerField()),
+                ('platform', models.CharField(choices=[('X', 'X'), ('LinkedIn', 'LinkedIn'), ('Facebook', 'Facebook'), ('Instagram', 'Instagram'), ('TikTok', 'TikTok')], max_length=1000)),
+                ('window_start', models.DateTimeField()),
+                ('count', models.IntegerField(default=0)),
+                ('limit', models.IntegerField(blank=True, null=True)),
+                ('reset_at', models.DateTimeField(blank=True, null=True)),
+                ('exhausted', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'quota ledger',
+                'constraints': [models.UniqueConstraint(fields=('account_id', 'platform', 'window_start'), name='unique_quota_window')],
+            },
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2 on 2026-10-19 19:58
+
+from django.db import migrations, models
+
+
+def delete_duplicate_integrations(apps, schema_editor):
+    IntegrationsModel = apps.get_model("integrations", "IntegrationsModel")
+
+    # Keep the latest authorization of each account/platform, it has the newest tokens
+    seen = set()
+    for integration in IntegrationsModel.objects.order_by("-pk").only("pk", "account_id", "platform"):
+        key = (integration.account_id, integration.platform)
+        if key in seen:
+            integration.delete()
+        seen.add(key)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0002_quotaledgermodel'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_integrations, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='integrationsmodel',
+            constraint=models.UniqueConstraint(fields=('account_id', 'platform'), name='unique_account_platform'),
+        ),
+    ]
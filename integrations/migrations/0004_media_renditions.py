@@ -0,0 +1,28 @@
+# Generated by Django 5.2 on 2026-10-19 20:08
+
+import integrations.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0003_unique_account_platform'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MediaRenditionModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_hash', models.CharField(max_length=64)),
+                ('spec', models.CharField(max_length=100)),
+                ('media_file', models.FileField(max_length=100000, upload_to=integrations.models.get_rendition_filename)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name_plural': 'media renditions',
+                'constraints': [models.UniqueConstraint(fields=('source_hash', 'spec'), name='unique_source_hash_spec')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2 on 2026-10-19 20:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('integrations', '0004_media_renditions'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='mediarenditionmodel',
+            name='params',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
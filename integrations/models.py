@@ -1,10 +1,11 @@
 import os
+import uuid
 import requests
 import mimetypes
 from core.logger import log
 from core import settings
 from django.db import models
-from integrations.helpers.aes import AESCBC
+from integrations.helpers.aes import AESCBC, DecryptedCache
 from django.core.files.base import ContentFile
 from django.utils.translation import gettext_lazy as _
 
@@ -24,6 +25,14 @@ def get_filename(instance, filename):
 
 
 
+# Decrypted tokens are needed by every poster and refresh, keep them around for a while
+tokens_cache = DecryptedCache(
+    AESCBC(settings.SECRET_KEY),
+    maxsize=settings.TOKEN_CACHE_SIZE,
+    ttl=settings.TOKEN_CACHE_TTL_SECONDS,
+)
+
+
 class IntegrationsModel(models.Model):
     account_id = models.IntegerField()
     user_id = models.CharField(max_length=5000, null=True, blank=True)
@@ -41,13 +50,34 @@ class IntegrationsModel(models.Model):
         blank=True,
     )
 
-    def save(self, *args, **kwargs):
-        aes_cbc = AESCBC(settings.SECRET_KEY)
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Ciphertexts as stored, anything else assigned later is a new plaintext token
+        instance._stored_tokens = {
+            field: getattr(instance, field)
+            for field in ["access_token", "refresh_token"]
+            if field in field_names
+        }
+        return instance
+
+    def _encrypt_token(self, field: str):
+        value = getattr(self, field)
+        stored = getattr(self, "_stored_tokens", {}).get(field)
 
-        if self.access_token:
-            self.access_token = aes_cbc.encrypt(self.access_token)
-        if self.refresh_token:
-            self.refresh_token = aes_cbc.encrypt(self.refresh_token)
+        if not value or value == stored:
+            return
+
+        # Same token assigned again, keep the stored ciphertext
+        if stored and tokens_cache.decrypt(stored) == value:
+            setattr(self, field, stored)
+            return
+
+        setattr(self, field, tokens_cache.encrypt(value))
+
+    def save(self, *args, **kwargs):
+        self._encrypt_token("access_token")
+        self._encrypt_token("refresh_token")
 
         # Only try to download avatar if storage is properly configured
         storage_configured = settings.MEDIA_ROOT or os.getenv("CLOUDFLARE_R2_BUCKET")
@@ -72,19 +102,106 @@ class IntegrationsModel(models.Model):
 
         super().save(*args, **kwargs)
 
+        self._stored_tokens = {
+            "access_token": self.access_token,
+            "refresh_token": self.refresh_token,
+        }
+
+    @classmethod
+    def get_authorized_platforms(cls, account_id: int):
+        return cls.get_authorized_platforms_by_account([account_id])[account_id]
+
+    @classmethod
+    def get_authorized_platforms_by_account(cls, account_ids: list):
+        # One query for any number of accounts (batch post creation)
+        authorized_platforms = {account_id: set() for account_id in account_ids}
+        integrations = cls.objects.filter(account_id__in=account_ids).values_list(
+            "account_id", "platform"
+        )
+        for account_id, platform in integrations:
+            authorized_platforms[account_id].add(platform)
+        return authorized_platforms
+
     @property
     def access_token_value(self):
-        aes_cbc = AESCBC(settings.SECRET_KEY)
-        return aes_cbc.decrypt(self.access_token) if self.access_token else None
+        return tokens_cache.decrypt(self.access_token) if self.access_token else None
 
     @property
     def refresh_token_value(self):
-        aes_cbc = AESCBC(settings.SECRET_KEY)
-        return aes_cbc.decrypt(self.refresh_token) if self.refresh_token else None
+        return tokens_cache.decrypt(self.refresh_token) if self.refresh_token else None
 
     class Meta:
         app_label = "integrations"
         verbose_name_plural = "integrations"
+        constraints = [
+            # Every lookup is by account and platform
+            models.UniqueConstraint(
+                fields=["account_id", "platform"],
+                name="unique_account_platform",
+            )
+        ]
 
     def __str__(self):
         return f"AccountId:{self.account_id} Platform: {self.platform}"
+
+
+
+class QuotaLedgerModel(models.Model):
+    """Publishes per account/platform/window, kept to defer posts before hitting API caps."""
+
+    account_id = models.IntegerField()
+    platform = models.CharField(max_length=1000, choices=Platform)
+    window_start = models.DateTimeField()
+    count = models.IntegerField(default=0)
+    # Reported by the platform (X headers), overrides the configured daily limit
+    limit = models.IntegerField(null=True, blank=True)
+    reset_at = models.DateTimeField(null=True, blank=True)
+    exhausted = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        app_label = "integrations"
+        verbose_name_plural = "quota ledger"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account_id", "platform", "window_start"],
+                name="unique_quota_window",
+            )
+        ]
+
+    def __str__(self):
+        return f"AccountId:{self.account_id} Platform: {self.platform} Window: {self.window_start} Count: {self.count}"
+
+
+def get_rendition_filename(instance, filename):
+    ext = os.path.splitext(filename)[1].lower()
+    # Unique name, storages may overwrite when two workers store the same rendition
+    return f"renditions/{instance.source_hash}/{instance.spec}-{uuid.uuid4().hex[:8]}{ext}"
+
+
+class MediaRenditionModel(models.Model):
+    """
+    Processed variant of a media file for a rendition spec (size, format).
+    Keyed by the content hash of the source so identical files are processed once,
+    whatever post, retry or account they belong to.
+    """
+
+    source_hash = models.CharField(max_length=64)
+    spec = models.CharField(max_length=100)
+    media_file = models.FileField(max_length=100_000, upload_to=get_rendition_filename)
+    # Encoder settings picked for this rendition (format, quality, bytes...)
+    params = models.JSONField(default=dict, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        app_label = "integrations"
+        verbose_name_plural = "media renditions"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["source_hash", "spec"],
+                name="unique_source_hash_spec",
+            )
+        ]
+
+    def __str__(self):
+        return f"Rendition: {self.spec} SourceHash: {self.source_hash}"
@@ -0,0 +1,170 @@
+import time
+import requests
+from core import settings
+from threading import Lock
+from dataclasses import dataclass
+from core.logger import log, send_notification
+
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+def classify_error(err: Exception):
+    """
+    Error class of a failed platform call or None if the platform did answer
+    (4xx errors are about the post or the account, not an outage).
+    """
+
+    if isinstance(err, (requests.ConnectionError, requests.Timeout)):
+        return "network"
+
+    if isinstance(err, requests.HTTPError) and err.response is not None:
+        if err.response.status_code == 429:
+            return "rate_limit"
+        if err.response.status_code >= 500:
+            return "server"
+
+    return None
+
+
+@dataclass
+class CircuitBreaker:
+    platform: str
+    error_class: str
+    cooldown: float
+    state: str = CLOSED
+    failures: int = 0
+    opened_at: float = 0
+    probing: bool = False
+
+    @property
+    def cooling_down(self):
+        return self.state == OPEN and time.monotonic() < self.opened_at + self.cooldown
+
+
+class CircuitBreakers:
+    """
+    One breaker per (platform, error class) shared by all accounts.
+
+    After `failure_threshold` failures of the same class (4xx errors don't count) the platform
+    is paused for `cooldown` seconds, then a single probe delivery is let through.
+    A failed probe doubles the cooldown (up to `max_cooldown`), a success closes it.
+
+    """
+
+    def __init__(
+        self,
+        failure_threshold: int = settings.CIRCUIT_BREAKER_FAILURES,
+        cooldown: float = settings.CIRCUIT_BREAKER_COOLDOWN_SECONDS,
+        max_cooldown: float = settings.CIRCUIT_BREAKER_MAX_COOLDOWN_SECONDS,
+    ):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.breakers = {}
+        self.lock = Lock()
+
+    def _platform_breakers(self, platform: str):
+        return [b for b in self.breakers.values() if b.platform == platform]
+
+    def paused(self, platform: str):
+        """True while allow would turn deliveries of the platform away, without claiming the probe."""
+
+        with self.lock:
+            return any(
+                b.cooling_down or b.probing
+                for b in self._platform_breakers(platform)
+                if b.state != CLOSED
+            )
+
+    def allow(self, platform: str):
+        """
+        CLOSED if the delivery can go, HALF_OPEN if it goes as the single probe
+        (call release_probe once it's done) or None if the platform is paused.
+        """
+
+        with self.lock:
+            tripped = [b for b in self._platform_breakers(platform) if b.state != CLOSED]
+            if not tripped:
+                return CLOSED
+
+            if any(b.cooling_down or b.probing for b in tripped):
+                return None
+
+            for breaker in tripped:
+                breaker.state = HALF_OPEN
+                breaker.probing = True
+
+            log.info(f"Circuit half-open for {platform}, sending a probe")
+            return HALF_OPEN
+
+    def release_probe(self, platform: str):
+        # Probe ended without a platform call (post already published, download failed...)
+        with self.lock:
+            for breaker in self._platform_breakers(platform):
+                breaker.probing = False
+
+    def record_success(self, platform: str):
+        with self.lock:
+            for breaker in self._platform_breakers(platform):
+                if breaker.state != CLOSED:
+                    log.info(f"Circuit closed for {platform} ({breaker.error_class})")
+                breaker.state = CLOSED
+                breaker.failures = 0
+                breaker.cooldown = self.cooldown
+                breaker.probing = False
+
+    def record_failure(self, platform: str, err: Exception):
+        """
+        Returns True if the failure is part of a platform outage.
+        Those posts should stay pending instead of counting as account retries.
+        """
+
+        error_class = classify_error(err)
+        if error_class is None:
+            # One account's bad post or revoked token says nothing about an outage,
+            # only published posts (record_success) close the breakers
+            return False
+
+        with self.lock:
+            key = (platform, error_class)
+            if key not in self.breakers:
+                self.breakers[key] = CircuitBreaker(platform, error_class, self.cooldown)
+            breaker = self.breakers[key]
+
+            # Failed probe, back off further
+            half_open = [
+                b for b in self._platform_breakers(platform) if b.state == HALF_OPEN
+            ]
+            if half_open:
+                if not any(b is breaker for b in half_open):
+                    half_open.append(breaker)
+                for b in half_open:
+                    b.state = OPEN
+                    b.opened_at = time.monotonic()
+                    b.cooldown = min(b.cooldown * 2, self.max_cooldown)
+                    b.probing = False
+                log.warning(f"Probe failed for {platform}, circuit open for {breaker.cooldown}s")
+                return True
+
+            if breaker.state == OPEN:
+                return True
+
+            breaker.failures += 1
+            if breaker.failures < self.failure_threshold:
+                return False
+
+            breaker.state = OPEN
+            breaker.opened_at = time.monotonic()
+
+        log.error(f"Circuit open for {platform} after {breaker.failures} {error_class} errors")
+        send_notification(
+            "ImPosting",
+            f"Paused posting on {platform} for {breaker.cooldown}s after {breaker.failures} {error_class} errors: {err}",
+        )
+        return True
+
+
+circuit_breakers = CircuitBreakers()
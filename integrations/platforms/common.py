@@ -1,5 +1,21 @@
+import time
+from core import settings
+from dataclasses import dataclass
 from asgiref.sync import sync_to_async
 from integrations.models import IntegrationsModel
+from socialsched.models import MediaFileTypes
+
+
+# (connect, read) timeouts for each phase of a post
+HTTP_TIMEOUTS = {
+    "upload": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_UPLOAD_READ_TIMEOUT),
+    "status": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_STATUS_READ_TIMEOUT),
+    "publish": (settings.HTTP_CONNECT_TIMEOUT, settings.HTTP_READ_TIMEOUT),
+}
+
+
+def get_creator_info_cache_key(account_id: int):
+    return f"tiktok_creator_info_{account_id}"
 
 
 @sync_to_async
@@ -37,3 +53,58 @@ class ErrorAccessTokenOrUserIdNotFound(Exception):
 class ErrorThisTypeOfPostIsNotSupported(Exception):
     def __str__(self):
         return "This type of posts is not supported."
+
+
+class ErrorDeadlineExceeded(Exception):
+    def __str__(self):
+        return "Posting deadline exceeded."
+
+
+class ErrorQuotaExceeded(Exception):
+    def __init__(self, reset_at=None):
+        super().__init__()
+        self.reset_at = reset_at
+
+    def __str__(self):
+        return "Daily post limit reached."
+
+
+@dataclass
+class Deadline:
+    """
+    Time budget of a single platform post.
+
+    deadline = Deadline(600)
+    requests.post(url, timeout=deadline.timeout("publish"))
+    deadline.sleep(5)  # raises ErrorDeadlineExceeded once the budget is spent
+
+    """
+
+    budget: float = settings.POST_DEADLINE_SECONDS
+
+    def __post_init__(self):
+        self.expires_at = time.monotonic() + self.budget
+
+    @classmethod
+    def for_media_type(cls, media_type: str = None):
+        if media_type == MediaFileTypes.VIDEO.value:
+            return cls(settings.VIDEO_POST_DEADLINE_SECONDS)
+        return cls(settings.POST_DEADLINE_SECONDS)
+
+    def remaining(self):
+        return self.expires_at - time.monotonic()
+
+    def check(self):
+        if self.remaining() <= 0:
+            raise ErrorDeadlineExceeded
+
+    def timeout(self, phase: str):
+        self.check()
+        remaining = self.remaining()
+        connect_timeout, read_timeout = HTTP_TIMEOUTS[phase]
+        return min(connect_timeout, remaining), min(read_timeout, remaining)
+
+    def sleep(self, seconds: float):
+        self.check()
+        time.sleep(min(seconds, self.remaining()))
+        self.check()
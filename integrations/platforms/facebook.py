@@ -1,15 +1,18 @@
 import os
 import re
-import time
 import requests
 from datetime import timedelta
 from core.logger import log, send_notification
 from asgiref.sync import sync_to_async
-from dataclasses import dataclass
+from django.db import transaction
+from dataclasses import dataclass, field
 from integrations.models import IntegrationsModel, Platform
 from socialsched.models import PostModel, MediaFileTypes
+from .circuit_breaker import circuit_breakers
+from .quota_ledger import record_publish
 from .common import (
     get_integration,
+    Deadline,
     ErrorAccessTokenNotProvided,
     ErrorPageIdNotProvided,
     ErrorThisTypeOfPostIsNotSupported,
@@ -20,6 +23,7 @@ from .common import (
 class FacebookPoster:
     integration: IntegrationsModel
     api_version: str = "v23.0"
+    deadline: Deadline = field(default_factory=Deadline)
 
     def __post_init__(self):
         self.access_token = self.integration.access_token_value
@@ -45,7 +49,11 @@ class FacebookPoster:
             "published": True,
             "access_token": self.access_token,
         }
-        response = requests.post(self.feed_url, json=payload)
+        response = requests.post(
+            self.feed_url,
+            json=payload,
+            timeout=self.deadline.timeout("publish"),
+        )
         log.debug(response.json())
         response.raise_for_status()
         return self.get_post_url(response.json()["id"])
@@ -57,12 +65,16 @@ class FacebookPoster:
             "published": True,
             "access_token": self.access_token,
         }
-        response = requests.post(self.feed_url, json=payload)
+        response = requests.post(
+            self.feed_url,
+            json=payload,
+            timeout=self.deadline.timeout("publish"),
+        )
         log.debug(response.json())
         response.raise_for_status()
         return self.get_post_url(response.json()["id"])
 
-    def post_text_with_reel(self, text: str, reel_path: str):
+    def upload_reel(self, reel_path: str):
 
         # Get upload url
         upload_start_response = requests.post(
@@ -71,6 +83,7 @@ class FacebookPoster:
                 "upload_phase": "start",
                 "access_token": self.access_token,
             },
+            timeout=self.deadline.timeout("upload"),
         )
         log.debug(upload_start_response.json())
         upload_start_response.raise_for_status()
@@ -78,7 +91,6 @@ class FacebookPoster:
         video_id = upload_start_data["video_id"]
 
         file_size_bytes = os.path.getsize(reel_path)
-        file_size_mb = file_size_bytes / (1024 * 1024)
 
         # Upload reel
         with open(reel_path, "rb") as file:
@@ -90,10 +102,15 @@ class FacebookPoster:
                     "file_size": str(file_size_bytes),
                 },
                 data=file,
+                timeout=self.deadline.timeout("upload"),
             )
             log.debug(upload_initiated_response.json())
             upload_initiated_response.raise_for_status()
 
+        return video_id
+
+    def publish_reel(self, text: str, video_id: str, file_size_mb: float = 0):
+
         finish_response = requests.post(
             url=f"https://graph.facebook.com/{self.api_version}/{self.page_id}/video_reels",
             params={
@@ -102,16 +119,18 @@ class FacebookPoster:
                 "upload_phase": "finish",
                 "description": text,
             },
+            timeout=self.deadline.timeout("publish"),
         )
         log.debug(finish_response.json())
         finish_response.raise_for_status()
 
-        time.sleep(5)
+        self.deadline.sleep(5)
         max_checks = max(30, int(file_size_mb * 2))  # More time for larger files
         for _ in range(max_checks):
             status_res = requests.get(
                 url=f"https://graph.facebook.com/{self.api_version}/{video_id}",
                 params={"fields": "status", "access_token": self.access_token},
+                timeout=self.deadline.timeout("status"),
             )
             log.debug(status_res.json())
             status_res.raise_for_status()
@@ -130,7 +149,7 @@ class FacebookPoster:
             ]:
                 raise Exception(f"Reel processing failed: {video_id}")
 
-            time.sleep(5)
+            self.deadline.sleep(5)
         else:
             raise Exception("Reel processing timed out")
 
@@ -141,6 +160,7 @@ class FacebookPoster:
                 "fields": "permalink_url",
                 "access_token": self.access_token,
             },
+            timeout=self.deadline.timeout("status"),
         )
         log.debug(reel_link_response.json())
         reel_link_response.raise_for_status()
@@ -149,21 +169,85 @@ class FacebookPoster:
 
         return f"https://facebook.com{reel_link}"
 
+    def post_text_with_reel(self, text: str, reel_path: str):
+        file_size_mb = os.path.getsize(reel_path) / (1024 * 1024)
+        video_id = self.upload_reel(reel_path)
+        return self.publish_reel(text, video_id, file_size_mb)
+
+    def upload_image(self, image_url: str):
+        # Unpublished photos can be attached to a feed post later on
+        payload = {
+            "url": image_url,
+            "published": False,
+            "access_token": self.access_token,
+        }
+        response = requests.post(
+            self.photos_url,
+            json=payload,
+            timeout=self.deadline.timeout("upload"),
+        )
+        log.debug(response.json())
+        response.raise_for_status()
+
+        return response.json()["id"]
+
+    def publish_image(self, text: str, photo_id: str):
+        payload = {
+            "message": text,
+            "attached_media": [{"media_fbid": photo_id}],
+            "published": True,
+            "access_token": self.access_token,
+        }
+        response = requests.post(
+            self.feed_url,
+            json=payload,
+            timeout=self.deadline.timeout("publish"),
+        )
+        log.debug(response.json())
+        response.raise_for_status()
+
+        return self.get_post_url(response.json()["id"])
+
     def post_text_with_image(self, text: str, image_url: str):
         payload = {
             "message": text,
             "url": image_url,
             "access_token": self.access_token,
         }
-        response = requests.post(self.photos_url, json=payload)
+        response = requests.post(
+            self.photos_url,
+            json=payload,
+            timeout=self.deadline.timeout("upload"),
+        )
         log.debug(response.json())
         response.raise_for_status()
 
         return self.get_post_url(response.json()["post_id"])
 
+    def stage_media(self, media_type: str, media_url: str = None, media_path: str = None):
+
+        if media_type == MediaFileTypes.IMAGE.value:
+            return self.upload_image(media_url)
+
+        if media_type == MediaFileTypes.VIDEO.value:
+            return self.upload_reel(media_path)
+
+        raise ErrorThisTypeOfPostIsNotSupported
+
     def make_post(
-        self, text: str, media_type: str, media_url: str = None, media_path: str = None
+        self,
+        text: str,
+        media_type: str,
+        media_url: str = None,
+        media_path: str = None,
+        staged_media_id: str = None,
     ):
+        if staged_media_id:
+            if media_type == MediaFileTypes.IMAGE.value:
+                return self.publish_image(text, staged_media_id)
+            if media_type == MediaFileTypes.VIDEO.value:
+                return self.publish_reel(text, staged_media_id)
+
         if media_url is None and media_path is None:
             pattern = r"(https?://[^\s]+)$"
             match = re.search(pattern, text)
@@ -182,14 +266,17 @@ class FacebookPoster:
 
 
 @sync_to_async
+@transaction.atomic
 def update_facebook_link(post_id: int, post_url: str, err: str):
-    post = PostModel.objects.get(id=post_id)
+    # Platforms of a post publish in parallel, the row lock keeps the calendar counts of
+    # concurrent updates consistent and each one only writes the columns of its platform
+    post = PostModel.objects.select_for_update().get(id=post_id)
 
     if err != "None":
         # Update existing post with error
         post.error_facebook = err
         post.post_on_facebook = False
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["error_facebook", "post_on_facebook"])
 
         # Clone post for retry
         new_post = PostModel.objects.get(id=post_id)
@@ -214,6 +301,9 @@ def update_facebook_link(post_id: int, post_url: str, err: str):
         new_post.link_linkedin = None
         new_post.link_tiktok = None
 
+        # Reset staged media (it may have expired or been consumed)
+        new_post.reset_staged_media()
+
         # Reset errors (keep only current one)
         new_post.error_x = None
         new_post.error_instagram = None
@@ -236,7 +326,7 @@ def update_facebook_link(post_id: int, post_url: str, err: str):
         post.link_facebook = post_url
         post.post_on_facebook = False
         post.error_facebook = None
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["link_facebook", "post_on_facebook", "error_facebook"])
         
         return post.retries_facebook
 
@@ -249,22 +339,36 @@ async def post_on_facebook(
     media_type: str,
     media_url: str = None,
     media_path: str = None,
+    staged_media_id: str = None,
+    deadline: Deadline = None,
+    integration: IntegrationsModel = None,
 ):
 
     err = None
     post_url = None
 
-    integration = await get_integration(account_id, Platform.FACEBOOK.value)
+    if integration is None:
+        integration = await get_integration(account_id, Platform.FACEBOOK.value)
 
     if integration:
         try:
-            poster = FacebookPoster(integration)
-            post_url = poster.make_post(post_text, media_type, media_url, media_path)
+            poster = FacebookPoster(
+                integration,
+                deadline=deadline or Deadline.for_media_type(media_type),
+            )
+            post_url = poster.make_post(
+                post_text, media_type, media_url, media_path, staged_media_id
+            )
+            circuit_breakers.record_success(Platform.FACEBOOK.value)
+            await sync_to_async(record_publish)(integration.account_id, Platform.FACEBOOK.value)
             log.success(f"Facebook post url: {integration.account_id} {post_url}")
         except Exception as e:
             err = e
             log.error(f"Facebook post error: {integration.account_id} {err}")
             log.exception(err)
+            if circuit_breakers.record_failure(Platform.FACEBOOK.value, err):
+                # Platform outage, the post stays pending until the circuit closes
+                return
             send_notification(
                 "ImPosting", f"AccountId: {integration.account_id} got error {err}"
             )
@@ -1,14 +1,17 @@
 import os
-import time
 import requests
 from datetime import timedelta
 from core.logger import log, send_notification
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from asgiref.sync import sync_to_async
+from django.db import transaction
 from integrations.models import IntegrationsModel, Platform
 from socialsched.models import PostModel, MediaFileTypes
+from .circuit_breaker import circuit_breakers
+from .quota_ledger import record_publish
 from .common import (
     get_integration,
+    Deadline,
     ErrorAccessTokenNotProvided,
     ErrorPageIdNotProvided,
     ErrorThisTypeOfPostIsNotSupported,
@@ -19,6 +22,7 @@ from .common import (
 class InstagramPoster:
     integration: IntegrationsModel
     api_version: str = "v23.0"
+    deadline: Deadline = field(default_factory=Deadline)
 
     def __post_init__(self):
         self.access_token = self.integration.access_token_value
@@ -40,7 +44,11 @@ class InstagramPoster:
             "fields": "permalink",
             "access_token": self.access_token,
         }
-        response = requests.get(url, params=params)
+        response = requests.get(
+            url,
+            params=params,
+            timeout=self.deadline.timeout("status"),
+        )
         log.debug(response.json())
         response.raise_for_status()
         return response.json()["permalink"]
@@ -55,6 +63,7 @@ class InstagramPoster:
                     "fields": "status_code",
                     "access_token": self.access_token,
                 },
+                timeout=self.deadline.timeout("status"),
             )
             log.debug(status_resp.json())
             status_resp.raise_for_status()
@@ -65,11 +74,23 @@ class InstagramPoster:
             elif status in {"ERROR", "EXPIRED"}:
                 raise Exception(f"Media container failed with status: {status}")
             else:
-                time.sleep(5)
+                self.deadline.sleep(5)
         
         raise TimeoutError("Media container not ready after polling")
 
-    def post_text_with_image(self, text: str, image_url: str):
+    def publish_container(self, container_id: str):
+        publish = requests.post(
+            self.media_publish_url,
+            headers={"Authorization": f"Bearer {self.access_token}"},
+            json={"creation_id": container_id},
+            timeout=self.deadline.timeout("publish"),
+        )
+        log.debug(publish.json())
+        publish.raise_for_status()
+
+        return self.get_post_url(publish.json()["id"])
+
+    def create_image_container(self, text: str, image_url: str):
         params = {
             "image_url": image_url,
             "is_carousel_item": False,
@@ -77,25 +98,24 @@ class InstagramPoster:
             "caption": text,
             "access_token": self.access_token,
         }
-        container = requests.post(self.media_url, params=params)
+        container = requests.post(
+            self.media_url,
+            params=params,
+            timeout=self.deadline.timeout("upload"),
+        )
         log.debug(container.json())
         container.raise_for_status()
 
         container_id = container.json()["id"]
         self._wait_for_container(container_id)
 
-        publish = requests.post(
-            self.media_publish_url,
-            headers={"Authorization": f"Bearer {self.access_token}"},
-            json={"creation_id": container_id},
-        )
-        log.debug(publish.json())
-        publish.raise_for_status()
-
-        return self.get_post_url(publish.json()["id"])
+        return container_id
 
+    def post_text_with_image(self, text: str, image_url: str):
+        container_id = self.create_image_container(text, image_url)
+        return self.publish_container(container_id)
 
-    def post_text_with_reel(self, text: str, reel_url: str, reel_path: str):
+    def create_reel_container(self, text: str, reel_url: str, reel_path: str):
         # Step 1: Get video file size from local path
         file_size_bytes = os.path.getsize(reel_path)
         file_size_mb = file_size_bytes / (1024 * 1024)
@@ -109,6 +129,7 @@ class InstagramPoster:
                 "access_token": self.access_token,
                 "media_type": "REELS",
             },
+            timeout=self.deadline.timeout("upload"),
         )
         log.debug(container_response.json())
         container_response.raise_for_status()
@@ -124,6 +145,7 @@ class InstagramPoster:
                     "fields": "status_code",
                     "access_token": self.access_token,
                 },
+                timeout=self.deadline.timeout("status"),
             )
             log.debug(status_resp.json())
             status_resp.raise_for_status()
@@ -134,23 +156,40 @@ class InstagramPoster:
             elif status in {"ERROR", "EXPIRED"}:
                 raise Exception(f"Media container failed with status: {status}")
             else:
-                time.sleep(5)
+                self.deadline.sleep(5)
         else:
             raise TimeoutError("Media container not ready after polling")
 
+        return container_id
+
+    def post_text_with_reel(self, text: str, reel_url: str, reel_path: str):
+        container_id = self.create_reel_container(text, reel_url, reel_path)
+
         # Step 4: Publish the Reel
-        publish_response = requests.post(
-            self.media_publish_url,
-            headers={"Authorization": f"Bearer {self.access_token}"},
-            json={"creation_id": container_id},
-        )
-        log.debug(publish_response.json())
-        publish_response.raise_for_status()
+        return self.publish_container(container_id)
 
-        return self.get_post_url(publish_response.json()["id"])
+    def stage_media(self, text: str, media_type: str, media_url: str, media_path: str = None):
+        # Containers stay valid for 24h and only need media_publish afterwards
 
+        if media_type == MediaFileTypes.IMAGE.value:
+            return self.create_image_container(text, media_url)
+
+        if media_type == MediaFileTypes.VIDEO.value:
+            return self.create_reel_container(text, media_url, media_path)
+
+        raise ErrorThisTypeOfPostIsNotSupported
+
+    def make_post(
+        self,
+        text: str,
+        media_type: str,
+        media_url: str = None,
+        media_path: str = None,
+        staged_container_id: str = None,
+    ):
+        if staged_container_id:
+            return self.publish_container(staged_container_id)
 
-    def make_post(self, text: str, media_type: str, media_url: str = None, media_path: str = None):
         if media_url is None:
             log.info("No media for instagram post. Skip posting.")
             return
@@ -165,14 +204,17 @@ class InstagramPoster:
 
 
 @sync_to_async
+@transaction.atomic
 def update_instagram_link(post_id: int, post_url: str, err: str):
-    post = PostModel.objects.get(id=post_id)
+    # Platforms of a post publish in parallel, the row lock keeps the calendar counts of
+    # concurrent updates consistent and each one only writes the columns of its platform
+    post = PostModel.objects.select_for_update().get(id=post_id)
 
     if err != "None":
         # Update existing post with error
         post.error_instagram = err
         post.post_on_instagram = False
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["error_instagram", "post_on_instagram"])
 
         # Clone post for retry
         new_post = PostModel.objects.get(id=post_id)
@@ -197,6 +239,9 @@ def update_instagram_link(post_id: int, post_url: str, err: str):
         new_post.link_linkedin = None
         new_post.link_tiktok = None
 
+        # Reset staged media (it may have expired or been consumed)
+        new_post.reset_staged_media()
+
         # Reset errors (keep only current one)
         new_post.error_x = None
         # new_post.error_instagram = None
@@ -219,7 +264,7 @@ def update_instagram_link(post_id: int, post_url: str, err: str):
         post.link_instagram = post_url
         post.post_on_instagram = False
         post.error_instagram = None
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["link_instagram", "post_on_instagram", "error_instagram"])
 
         return post.retries_instagram
 
@@ -232,24 +277,36 @@ async def post_on_instagram(
     media_type: str,
     media_url: str = None,
     media_path: str = None,
+    staged_container_id: str = None,
+    deadline: Deadline = None,
+    integration: IntegrationsModel = None,
 ):
 
     err = None
     post_url = None
 
-    integration = await get_integration(
-        account_id, Platform.INSTAGRAM.value
-    )
+    if integration is None:
+        integration = await get_integration(account_id, Platform.INSTAGRAM.value)
     
     if integration:
         try:
-            poster = InstagramPoster(integration)
-            post_url = poster.make_post(post_text, media_type, media_url, media_path)
+            poster = InstagramPoster(
+                integration,
+                deadline=deadline or Deadline.for_media_type(media_type),
+            )
+            post_url = poster.make_post(
+                post_text, media_type, media_url, media_path, staged_container_id
+            )
+            circuit_breakers.record_success(Platform.INSTAGRAM.value)
+            await sync_to_async(record_publish)(integration.account_id, Platform.INSTAGRAM.value)
             log.success(f"Instagram post url: {integration.account_id} {post_url}")
         except Exception as e:
             err = e
             log.error(f"Instagram post error: {integration.account_id} {err}")
             log.exception(err)
+            if circuit_breakers.record_failure(Platform.INSTAGRAM.value, err):
+                # Platform outage, the post stays pending until the circuit closes
+                return
             send_notification(
                 "ImPosting", f"AccountId: {integration.account_id} got error {err}"
             )
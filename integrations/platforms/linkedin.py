@@ -1,12 +1,16 @@
 import requests
 from datetime import timedelta
 from core.logger import log, send_notification
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from integrations.models import IntegrationsModel, Platform
 from socialsched.models import PostModel
 from asgiref.sync import sync_to_async
+from django.db import transaction
+from .circuit_breaker import circuit_breakers
+from .quota_ledger import record_publish
 from .common import (
     get_integration,
+    Deadline,
     ErrorAccessTokenNotProvided,
     ErrorUserIdNotProvided,
 )
@@ -16,6 +20,7 @@ from .common import (
 class LinkedinPoster:
     integration: IntegrationsModel
     api_version: str = "v2"
+    deadline: Deadline = field(default_factory=Deadline)
 
     def __post_init__(self):
 
@@ -69,6 +74,7 @@ class LinkedinPoster:
             url=f"https://api.linkedin.com/{self.api_version}/assets?action=registerUpload",
             headers=self.headers,
             json=upload_payload,
+            timeout=self.deadline.timeout("upload"),
         )
         log.debug(upload_response.json())
         upload_response.raise_for_status()
@@ -86,18 +92,23 @@ class LinkedinPoster:
                     "Content-Type": "application/octet-stream",
                 },
                 data=image_file,
+                timeout=self.deadline.timeout("upload"),
             )
             log.debug(response.content)
             response.raise_for_status()
         
         return asset
 
-    def make_post(self, text: str, media_path: str = None):
-        share_media_category = "IMAGE" if media_path else "NONE"
+    def stage_media(self, media_path: str):
+        # Registered assets can be referenced by a ugcPost later on
+        return self._upload_media(media_path)
+
+    def make_post(self, text: str, media_path: str = None, staged_asset: str = None):
+        share_media_category = "IMAGE" if media_path or staged_asset else "NONE"
         payload = self._get_basic_payload(text, share_media_category)
 
         if share_media_category == "IMAGE":
-            asset = self._upload_media(media_path)
+            asset = staged_asset or self._upload_media(media_path)
             payload["specificContent"]["com.linkedin.ugc.ShareContent"]["media"] = [
                 {
                     "status": "READY",
@@ -111,6 +122,7 @@ class LinkedinPoster:
             url=f"https://api.linkedin.com/{self.api_version}/ugcPosts",
             headers=self.headers,
             json=payload,
+            timeout=self.deadline.timeout("publish"),
         )
         log.debug(response.json())
         response.raise_for_status()
@@ -119,14 +131,17 @@ class LinkedinPoster:
 
 
 @sync_to_async
+@transaction.atomic
 def update_linkedin_link(post_id: int, post_url: str, err: str):
-    post = PostModel.objects.get(id=post_id)
+    # Platforms of a post publish in parallel, the row lock keeps the calendar counts of
+    # concurrent updates consistent and each one only writes the columns of its platform
+    post = PostModel.objects.select_for_update().get(id=post_id)
 
     if err != "None":
         # Update existing post with error
         post.error_linkedin = err
         post.post_on_linkedin = False
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["error_linkedin", "post_on_linkedin"])
 
         # Clone post for retry
         new_post = PostModel.objects.get(id=post_id)
@@ -151,6 +166,9 @@ def update_linkedin_link(post_id: int, post_url: str, err: str):
         new_post.link_linkedin = None
         new_post.link_tiktok = None
 
+        # Reset staged media (it may have expired or been consumed)
+        new_post.reset_staged_media()
+
         # Reset errors (keep only current one)
         new_post.error_x = None
         new_post.error_instagram = None
@@ -173,7 +191,7 @@ def update_linkedin_link(post_id: int, post_url: str, err: str):
         post.link_linkedin = post_url
         post.post_on_linkedin = False
         post.error_linkedin = None
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["link_linkedin", "post_on_linkedin", "error_linkedin"])
 
         return post.retries_linkedin
 
@@ -184,24 +202,31 @@ async def post_on_linkedin(
     post_id: int,
     post_text: str,
     media_path: str = None,
+    staged_asset: str = None,
+    deadline: Deadline = None,
+    integration: IntegrationsModel = None,
 ):
 
     err = None
     post_url = None
 
-    integration = await get_integration(
-        account_id, Platform.LINKEDIN.value
-    )
+    if integration is None:
+        integration = await get_integration(account_id, Platform.LINKEDIN.value)
 
     if integration:
         try:
-            poster = LinkedinPoster(integration)
-            post_url = poster.make_post(post_text, media_path)
+            poster = LinkedinPoster(integration, deadline=deadline or Deadline())
+            post_url = poster.make_post(post_text, media_path, staged_asset)
+            circuit_breakers.record_success(Platform.LINKEDIN.value)
+            await sync_to_async(record_publish)(integration.account_id, Platform.LINKEDIN.value)
             log.success(f"Linkedin post url: {integration.account_id} {post_url}")
         except Exception as e:
             err = e
             log.error(f"Linkedin post error: {integration.account_id} {err}")
             log.exception(err)
+            if circuit_breakers.record_failure(Platform.LINKEDIN.value, err):
+                # Platform outage, the post stays pending until the circuit closes
+                return
             send_notification(
                 "ImPosting", f"AccountId: {integration.account_id} got error {err}"
             )
@@ -0,0 +1,128 @@
+from core import settings
+from core.logger import log
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.db import transaction
+from django.db.models import F
+from django.core.cache import cache
+from django.utils import timezone
+from integrations.models import Platform, QuotaLedgerModel
+from socialsched.models import PostModel, PLATFORM_FIELD_KEYS
+from .common import get_creator_info_cache_key
+
+
+QUOTA_WINDOW = timedelta(hours=24)
+
+DAILY_LIMITS = {
+    Platform.X_TWITTER.value: settings.X_DAILY_POST_LIMIT,
+    Platform.INSTAGRAM.value: settings.INSTAGRAM_DAILY_POST_LIMIT,
+    Platform.FACEBOOK.value: settings.FACEBOOK_DAILY_POST_LIMIT,
+    Platform.LINKEDIN.value: settings.LINKEDIN_DAILY_POST_LIMIT,
+    Platform.TIKTOK.value: settings.TIKTOK_DAILY_POST_LIMIT,
+}
+
+
+def get_window_start(now_utc: datetime):
+    # Windows are UTC calendar days, reported reset times (reset_at) take precedence
+    return now_utc.astimezone(dt_timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+
+
+def get_ledger(account_id: int, platform: str, now_utc: datetime = None):
+    window_start = get_window_start(now_utc or timezone.now())
+    ledger, _ = QuotaLedgerModel.objects.get_or_create(
+        account_id=account_id, platform=platform, window_start=window_start
+    )
+    return ledger
+
+
+def get_deferral(account_id: int, platform: str, now_utc: datetime = None):
+    """Returns when the delivery can go if publishing now would go over quota, else None."""
+
+    now_utc = now_utc or timezone.now()
+    window_start = get_window_start(now_utc)
+
+    ledger = QuotaLedgerModel.objects.filter(
+        account_id=account_id, platform=platform, window_start=window_start
+    ).first()
+    if ledger is None:
+        return None
+
+    limit = ledger.limit or DAILY_LIMITS.get(platform)
+    over_limit = bool(limit) and ledger.count >= limit
+    if not ledger.exhausted and not over_limit:
+        return None
+
+    if ledger.reset_at and ledger.reset_at > now_utc:
+        return ledger.reset_at
+    return window_start + QUOTA_WINDOW
+
+
+def record_publish(
+    account_id: int,
+    platform: str,
+    limit: int = None,
+    remaining: int = None,
+    reset_at: datetime = None,
+):
+    ledger = get_ledger(account_id, platform)
+
+    updates = {"count": F("count") + 1}
+    if limit is not None:
+        updates["limit"] = limit
+    if remaining is not None and remaining <= 0:
+        updates["exhausted"] = True
+        updates["reset_at"] = reset_at
+
+    QuotaLedgerModel.objects.filter(pk=ledger.pk).update(**updates)
+
+
+def mark_exhausted(account_id: int, platform: str, reset_at: datetime = None):
+    ledger = get_ledger(account_id, platform)
+    QuotaLedgerModel.objects.filter(pk=ledger.pk).update(
+        exhausted=True, reset_at=reset_at
+    )
+    log.warning(f"Quota exhausted for {platform} account {account_id} until {reset_at or 'next window'}")
+
+
+@transaction.atomic
+def defer_post(post_id: int, platform: str, until: datetime, reason: str):
+    """
+    Move the platform delivery to `until` without counting it as a retry.
+    Same cloning as the update_*_link retries.
+    """
+
+    key = PLATFORM_FIELD_KEYS[platform]
+
+    # Same row lock as the update_*_link functions, other platforms of the post may be publishing
+    post = PostModel.objects.select_for_update().get(id=post_id)
+    setattr(post, f"post_on_{key}", False)
+    setattr(post, f"error_{key}", reason)
+    post.save(skip_validation=True, update_fields=[f"post_on_{key}", f"error_{key}"])
+
+    new_post = PostModel.objects.get(id=post_id)
+    new_post.pk = None
+    new_post.scheduled_aware = until
+    new_post.reset_staged_media()
+
+    # Only post on current platform, keep its retries
+    for other_key in PLATFORM_FIELD_KEYS.values():
+        setattr(new_post, f"post_on_{other_key}", other_key == key)
+        setattr(new_post, f"link_{other_key}", None)
+        if other_key != key:
+            setattr(new_post, f"error_{other_key}", None)
+            setattr(new_post, f"retries_{other_key}", 0)
+
+    new_post.save(skip_validation=True)
+
+    log.info(f"Deferred {platform} post {post_id} to {until} ({reason})")
+    return new_post
+
+
+def defer_exhausted(post_id: int, account_id: int, platform: str, err: Exception):
+    mark_exhausted(account_id, platform, getattr(err, "reset_at", None))
+    if platform == Platform.TIKTOK.value:
+        # Cached creator info doesn't know about the cap, fetch it again after the deferral
+        cache.delete(get_creator_info_cache_key(account_id))
+    until = get_deferral(account_id, platform)
+    return defer_post(post_id, platform, until, str(err)[0:50])
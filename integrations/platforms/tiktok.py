@@ -1,20 +1,31 @@
 import os
-import time
 import math
 import ffmpeg
 import requests
 from datetime import timedelta
+from core import settings
 from core.logger import log, send_notification
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from integrations.models import IntegrationsModel, Platform
 from socialsched.models import PostModel
 from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.core.cache import cache
+from .circuit_breaker import circuit_breakers
+from .quota_ledger import record_publish, defer_exhausted
 from .common import (
     get_integration,
+    get_creator_info_cache_key,
+    Deadline,
     ErrorAccessTokenNotProvided,
+    ErrorQuotaExceeded,
 )
 
 
+# Publishing caps, posts will fail until the daily window resets
+QUOTA_ERROR_CODES = {"spam_risk_too_many_posts", "reached_active_user_cap"}
+
+
 @dataclass
 class TikTokPoster:
     integration: IntegrationsModel
@@ -22,6 +33,7 @@ class TikTokPoster:
     MIN_CHUNK_SIZE: int = 5 * 1024 * 1024  # 5 MB
     MAX_CHUNK_SIZE: int = 64 * 1024 * 1024  # 64 MB
     DEFAULT_CHUNK_SIZE: int = 10 * 1024 * 1024  # 10 MB (safe default)
+    deadline: Deadline = field(default_factory=Deadline)
 
     def __post_init__(self):
         self.access_token = self.integration.access_token_value
@@ -32,6 +44,7 @@ class TikTokPoster:
             "Authorization": f"Bearer {self.access_token}",
             "Content-Type": "application/json; charset=UTF-8",
         }
+        self.quota_exhausted = False
 
     def get_creator_info(self):
         """
@@ -61,7 +74,11 @@ class TikTokPoster:
         try:
             creator_info_url = f"{self.base_url}/post/publish/creator_info/query/"
 
-            response = requests.post(creator_info_url, headers=self.headers)
+            response = requests.post(
+                creator_info_url,
+                headers=self.headers,
+                timeout=self.deadline.timeout("status"),
+            )
             log.debug(response.json())
             response.raise_for_status()
             data = response.json()
@@ -69,6 +86,7 @@ class TikTokPoster:
             if data.get("error", {}).get("code") != "ok":
                 error_msg = data.get("error", {}).get("message", "Unknown error")
                 error_code = data.get("error", {}).get("code", "unknown")
+                self.quota_exhausted = error_code in QUOTA_ERROR_CODES
 
                 # Handle specific error cases
                 if error_code == "spam_risk_too_many_posts":
@@ -182,8 +200,12 @@ class TikTokPoster:
                     "total_chunk_count": total_chunk_count,
                 },
             },
+            timeout=self.deadline.timeout("upload"),
         )
         log.debug(init_upload_response.json())
+        init_upload_error = init_upload_response.json().get("error", {})
+        if init_upload_error.get("code") in QUOTA_ERROR_CODES:
+            raise ErrorQuotaExceeded
         init_upload_response.raise_for_status()
 
         init_upload = init_upload_response.json()
@@ -210,17 +232,19 @@ class TikTokPoster:
                     "Content-Type": "video/mp4",
                 },
                 data=file,
+                timeout=self.deadline.timeout("upload"),
             )
             upload_response.raise_for_status()
 
         # 3600/5=720 - tiktok timeouts video upload after 1 hour
         for _ in range(720):
-            time.sleep(5)
+            self.deadline.sleep(5)
 
             upload_status_response = requests.post(
                 url=f"{self.base_url}/post/publish/status/fetch/",
                 headers=self.headers,
                 json={"publish_id": publish_id},
+                timeout=self.deadline.timeout("status"),
             )
             log.debug(upload_status_response.json())
             upload_status_response.raise_for_status()
@@ -237,9 +261,24 @@ class TikTokPoster:
 
         return upload_status
 
+    def get_cached_creator_info(self):
+        # Shared with the schedule views, creator info rarely changes
+        key = get_creator_info_cache_key(self.integration.account_id)
+
+        result = cache.get(key)
+        if result:
+            return result
+
+        result = self.get_creator_info()
+        if result is not None:
+            cache.set(key, value=result, timeout=settings.TIKTOK_CREATOR_INFO_CACHE_SECONDS)
+        return result
+
     async def make_post(self, account_id: int, post_text: str, media_path: str, post: PostModel):
 
-        creator_info = self.get_creator_info()
+        creator_info = self.get_cached_creator_info()
+        if creator_info is None and self.quota_exhausted:
+            raise ErrorQuotaExceeded
         video_duration = self.get_video_duration(media_path)
         if video_duration > creator_info["max_video_post_duration_sec"]:
             raise ValueError(
@@ -255,14 +294,17 @@ class TikTokPoster:
 
 
 @sync_to_async
+@transaction.atomic
 def update_tiktok_link(post_id: int, post_url: str, err: str):
-    post = PostModel.objects.get(id=post_id)
+    # Platforms of a post publish in parallel, the row lock keeps the calendar counts of
+    # concurrent updates consistent and each one only writes the columns of its platform
+    post = PostModel.objects.select_for_update().get(id=post_id)
 
     if err != "None":
         # Update existing post with error
         post.error_tiktok = err
         post.post_on_tiktok = False
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["error_tiktok", "post_on_tiktok"])
 
         # Clone post for retry
         new_post = PostModel.objects.get(id=post_id)
@@ -287,6 +329,9 @@ def update_tiktok_link(post_id: int, post_url: str, err: str):
         new_post.link_linkedin = None
         new_post.link_tiktok = None
 
+        # Reset staged media (it may have expired or been consumed)
+        new_post.reset_staged_media()
+
         # Reset errors (keep only current one)
         new_post.error_x = None
         new_post.error_instagram = None
@@ -309,7 +354,7 @@ def update_tiktok_link(post_id: int, post_url: str, err: str):
         post.link_tiktok = post_url
         post.post_on_tiktok = False
         post.error_tiktok = None
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["link_tiktok", "post_on_tiktok", "error_tiktok"])
 
         return post.retries_tiktok
 
@@ -319,24 +364,41 @@ async def post_on_tiktok(
     post: PostModel,
     post_text: str,
     media_path: str = None,
+    deadline: Deadline = None,
+    integration: IntegrationsModel = None,
 ):
 
     err = None
     post_url = None
 
-    integration = await get_integration(post.account_id, Platform.TIKTOK.value)
+    if integration is None:
+        integration = await get_integration(post.account_id, Platform.TIKTOK.value)
 
     if integration:
         try:
 
-            poster = TikTokPoster(integration)
+            poster = TikTokPoster(
+                integration,
+                deadline=deadline or Deadline.for_media_type(post.media_file_type),
+            )
             post_url = await poster.make_post(post.account_id, post_text, media_path, post)
             
+            circuit_breakers.record_success(Platform.TIKTOK.value)
+            await sync_to_async(record_publish)(integration.account_id, Platform.TIKTOK.value)
             log.success(f"TikTok post url: {integration.account_id} {post_url}")
         except Exception as e:
             err = e
             log.error(f"TikTok post error: {integration.account_id} {err}")
             log.exception(err)
+            if isinstance(err, ErrorQuotaExceeded):
+                # Known to fail until the quota window resets, not a retry
+                await sync_to_async(defer_exhausted)(
+                    post.pk, integration.account_id, Platform.TIKTOK.value, err
+                )
+                return
+            if circuit_breakers.record_failure(Platform.TIKTOK.value, err):
+                # Platform outage, the post stays pending until the circuit closes
+                return
             send_notification(
                 "ImPosting", f"AccountId: {integration.account_id} got error {err}"
             )
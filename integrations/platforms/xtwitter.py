@@ -1,18 +1,23 @@
 import base64
-from datetime import timedelta
+from datetime import datetime, timedelta, timezone as dt_timezone
 from typing import Literal
 from core import settings
 from core.logger import log, send_notification
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from asgiref.sync import sync_to_async
+from django.db import transaction
 from socialsched.models import PostModel
 from requests_oauthlib import OAuth2Session
 from integrations.models import IntegrationsModel, Platform
+from .circuit_breaker import circuit_breakers
 from .common import (
     get_integration,
+    Deadline,
     ErrorAccessTokenNotProvided,
+    ErrorQuotaExceeded,
     ErrorThisTypeOfPostIsNotSupported,
 )
+from .quota_ledger import record_publish, defer_exhausted
 
 
 @dataclass
@@ -20,6 +25,7 @@ class XPoster:
     integration: IntegrationsModel
     api_version: str = "2"
     chunk_size: int = 1024 * 1024  # 1MB
+    deadline: Deadline = field(default_factory=Deadline)
 
     def __post_init__(self):
         self.access_token = self.integration.access_token_value
@@ -35,19 +41,41 @@ class XPoster:
             lambda media_id: f"{self.upload_url}/{media_id}/finalize"
         )
 
+        self.quota = None
         self.client = OAuth2Session(
             client_id=settings.X_CLIENT_ID,
             token={"access_token": self.access_token, "token_type": "bearer"},
         )
 
     def _make_authenticated_request(
-        self, method: Literal["post", "get"], url: str, **kwargs
+        self,
+        method: Literal["post", "get"],
+        url: str,
+        phase: Literal["upload", "status", "publish"] = "publish",
+        **kwargs,
     ):
+        kwargs.setdefault("timeout", self.deadline.timeout(phase))
         response = getattr(self.client, method)(url, **kwargs)
         log.debug("X Athenticated Response: ", response.content)
+        self.quota = self.get_quota(response.headers) or self.quota
+        if response.status_code == 429 and self.quota and self.quota["remaining"] <= 0:
+            raise ErrorQuotaExceeded(self.quota["reset_at"])
         response.raise_for_status()
         return response
 
+    def get_quota(self, headers):
+        # Per user 24h posting limit reported on the tweets endpoints
+        if "x-user-limit-24hour-remaining" not in headers:
+            return None
+
+        return {
+            "limit": int(headers["x-user-limit-24hour-limit"]),
+            "remaining": int(headers["x-user-limit-24hour-remaining"]),
+            "reset_at": datetime.fromtimestamp(
+                int(headers["x-user-limit-24hour-reset"]), tz=dt_timezone.utc
+            ),
+        }
+
     def get_post_url(self, id: int):
         return f"https://x.com/user/status/{id}"
 
@@ -60,7 +88,7 @@ class XPoster:
         )
         return self.get_post_url(response.json()["data"]["id"])
 
-    def post_text_with_image(self, text: str, image_path: str):
+    def upload_media(self, image_path: str):
         media_type = None
         if image_path.endswith((".jpg", ".jpeg")):
             media_type = "image/jpeg"
@@ -74,6 +102,7 @@ class XPoster:
             upload_response = self._make_authenticated_request(
                 "post",
                 self.upload_url,
+                phase="upload",
                 headers={
                     "Content-Type": "application/json",
                     "Content-Transfer-Encoding": "base64",
@@ -87,8 +116,9 @@ class XPoster:
             )
             log.debug(upload_response.content)
 
-            media_id = upload_response.json()["data"]["id"]
+        return upload_response.json()["data"]["id"]
 
+    def post_text_with_media_id(self, text: str, media_id: str):
         response = self._make_authenticated_request(
             "post",
             self.base_url,
@@ -97,7 +127,21 @@ class XPoster:
         )
         return self.get_post_url(response.json()["data"]["id"])
 
-    def make_post(self, text: str, media_path: str = None):
+    def post_text_with_image(self, text: str, image_path: str):
+        media_id = self.upload_media(image_path)
+        return self.post_text_with_media_id(text, media_id)
+
+    def stage_media(self, media_path: str):
+        # Uploaded media ids stay valid for 24h on X
+        if media_path.endswith((".jpg", ".jpeg", ".png")):
+            return self.upload_media(media_path)
+
+        raise ErrorThisTypeOfPostIsNotSupported
+
+    def make_post(self, text: str, media_path: str = None, staged_media_id: str = None):
+
+        if staged_media_id:
+            return self.post_text_with_media_id(text, staged_media_id)
 
         if not media_path:
             return self.post_text(text)
@@ -109,14 +153,17 @@ class XPoster:
 
 
 @sync_to_async
+@transaction.atomic
 def update_x_link(post_id: int, post_url: str, err: str):
-    post = PostModel.objects.get(id=post_id)
+    # Platforms of a post publish in parallel, the row lock keeps the calendar counts of
+    # concurrent updates consistent and each one only writes the columns of its platform
+    post = PostModel.objects.select_for_update().get(id=post_id)
 
     if err != "None":
         # Update existing post with error
         post.error_x = err
         post.post_on_x = False
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["error_x", "post_on_x"])
 
         # Clone post for retry
         new_post = PostModel.objects.get(id=post_id)
@@ -141,6 +188,9 @@ def update_x_link(post_id: int, post_url: str, err: str):
         new_post.link_linkedin = None
         new_post.link_tiktok = None
 
+        # Reset staged media (it may have expired or been consumed)
+        new_post.reset_staged_media()
+
         # Reset errors (keep only current one)
         # new_post.error_x = None
         new_post.error_instagram = None
@@ -163,7 +213,7 @@ def update_x_link(post_id: int, post_url: str, err: str):
         post.link_x = post_url
         post.post_on_x = False
         post.error_x = None
-        post.save(skip_validation=True)
+        post.save(skip_validation=True, update_fields=["link_x", "post_on_x", "error_x"])
 
         return post.retries_x
 
@@ -173,22 +223,37 @@ async def post_on_x(
     post_id: int,
     post_text: str,
     media_path: str = None,
+    staged_media_id: str = None,
+    deadline: Deadline = None,
+    integration: IntegrationsModel = None,
 ):
 
     err = None
     post_url = None
 
-    integration = await get_integration(account_id, Platform.X_TWITTER.value)
+    if integration is None:
+        integration = await get_integration(account_id, Platform.X_TWITTER.value)
 
     if integration:
         try:
-            poster = XPoster(integration)
-            post_url = poster.make_post(post_text, media_path)
+            poster = XPoster(integration, deadline=deadline or Deadline())
+            post_url = poster.make_post(post_text, media_path, staged_media_id)
+            circuit_breakers.record_success(Platform.X_TWITTER.value)
+            await sync_to_async(record_publish)(integration.account_id, Platform.X_TWITTER.value, **(poster.quota or {}))
             log.success(f"X post url: {integration.account_id} {post_url}")
         except Exception as e:
             err = e
             log.error(f"X post error: {integration.account_id} {err}")
             log.exception(err)
+            if isinstance(err, ErrorQuotaExceeded):
+                # Known to fail until the quota window resets, not a retry
+                await sync_to_async(defer_exhausted)(
+                    post_id, integration.account_id, Platform.X_TWITTER.value, err
+                )
+                return
+            if circuit_breakers.record_failure(Platform.X_TWITTER.value, err):
+                # Platform outage, the post stays pending until the circuit closes
+                return
             send_notification(
                 "ImPosting", f"AccountId: {integration.account_id} got error {err}"
             )
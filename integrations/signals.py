@@ -0,0 +1,13 @@
+from django.dispatch import receiver
+from django.db.models.signals import post_save, post_delete
+from .models import IntegrationsModel
+from .helpers.utils import delete_integrations_context
+from socialsched.schedule_version import bump_schedule_version
+
+
+@receiver(post_save, sender=IntegrationsModel)
+@receiver(post_delete, sender=IntegrationsModel)
+def invalidate_integrations_context(sender, instance: IntegrationsModel, **kwargs):
+    delete_integrations_context(instance.account_id)
+    # Schedule form shows the integrations
+    bump_schedule_version(instance.account_id)
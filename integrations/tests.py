@@ -1,15 +1,87 @@
 import os
+import requests
 import webbrowser
+from collections import Counter
+from datetime import date, timedelta
+from threading import Event
 from core import settings
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from socialsched.models import (
+    PostModel,
+    ArchivedPostModel,
+    MediaFileTypes,
+    DailyPlatformCountModel,
+    PENDING_POSTS,
+)
+from socialsched.schedule_utils import get_calendar_range, get_calendar_counts
+from socialsched.schedule_version import get_schedule_version, get_schedule_version_cache_key
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
 from integrations.models import IntegrationsModel, Platform
 from integrations.platforms.xtwitter import XPoster
 from integrations.platforms.facebook import FacebookPoster
 from integrations.platforms.instagram import InstagramPoster
 from integrations.platforms.linkedin import LinkedinPoster
 from integrations.platforms.tiktok import TikTokPoster
-from integrations.helpers.refresh_tokens import refresh_access_token_for_tiktok
+from integrations.helpers.refresh_tokens import (
+    refresh_access_token_for_tiktok,
+    RefreshScheduler,
+)
 from integrations.helpers.video_processor.make_video_postable import make_video_postable
+from integrations.helpers.prestage import get_posts_to_stage
+from integrations.helpers.archive_posts import archive_posts
+from integrations.helpers.media_worker import MediaWorker
+from integrations.helpers.media_claims import claim_media_posts, release_media_claims
+from integrations.helpers.renditions import RenditionSpec, get_or_render, get_rendition_path
+from integrations.models import MediaRenditionModel
+from integrations.helpers.image_processor.make_image_postable import resize_image
+from integrations.helpers.image_processor.encode_image import encode_image, MIN_PSNR
+from integrations.helpers.image_processor import pexels
+from integrations.helpers.image_processor.text_card import (
+    CardStyle,
+    layout_text,
+    get_text_width,
+    get_card_path,
+    create_text_card,
+)
+from integrations.helpers.process_images import (
+    create_image_pool,
+    close_image_pool,
+    run_image_jobs,
+)
+from integrations.helpers.utils import get_integrations_context, delete_integrations_context
+from integrations.platforms.common import (
+    Deadline,
+    ErrorDeadlineExceeded,
+    ErrorQuotaExceeded,
+    get_creator_info_cache_key,
+)
+from integrations.platforms.circuit_breaker import (
+    CircuitBreakers,
+    CLOSED,
+    HALF_OPEN,
+)
+from integrations.platforms.quota_ledger import (
+    get_deferral,
+    get_window_start,
+    record_publish,
+    defer_post,
+    defer_exhausted,
+    QUOTA_WINDOW,
+)
+from integrations.helpers.dispatcher import (
+    Delivery,
+    Dispatcher,
+    FairQueue,
+    RateLimiter,
+    preload_integrations,
+    get_due_deliveries,
+    SHORT_LANE,
+    MEDIA_LANE,
+)
 
 
 
@@ -371,3 +443,1207 @@ class TestPostingOnSocials(TestCase):
     #     output_path = "./static/imposting-video-reel.mp4"
 
     #     convert_to_reel_format(input_path, output_path, duration_limit=60)
+
+
+def create_post(scheduled_on, **kwargs):
+    fields = dict(
+        scheduled_on=scheduled_on,
+        post_timezone="UTC",
+        account_id=1,
+        description="Test",
+    )
+    fields.update(kwargs)
+    post = PostModel(**fields)
+    post.save(skip_validation=True)
+    return post
+
+
+class TestPrestage(TestCase):
+
+    def test_only_posts_due_inside_the_window_are_staged(self):
+        # uv run python manage.py test integrations.tests.TestPrestage
+
+        now_utc = timezone.now()
+        window = timedelta(minutes=30)
+        media = dict(
+            media_file="1/image.jpg",
+            media_file_type=MediaFileTypes.IMAGE.value,
+            process_image=False,
+            post_on_x=True,
+        )
+
+        soon = create_post(now_utc + timedelta(minutes=10), **media)
+        create_post(now_utc + timedelta(hours=2), **media)
+        create_post(now_utc - timedelta(minutes=1), **media)
+        create_post(now_utc + timedelta(minutes=10), post_on_x=True)
+        create_post(now_utc + timedelta(minutes=10), staged_x="123", **media)
+        create_post(
+            now_utc + timedelta(minutes=10),
+            **{**media, "process_image": True, "image_processed": False},
+        )
+
+        posts = get_posts_to_stage(now_utc, window)
+
+        self.assertEqual([p.pk for p in posts], [soon.pk])
+
+
+
+class TestDeadline(TestCase):
+
+    def test_timeouts_are_clipped_to_the_remaining_budget(self):
+        # uv run python manage.py test integrations.tests.TestDeadline
+
+        deadline = Deadline(2)
+        connect_timeout, read_timeout = deadline.timeout("upload")
+
+        self.assertLessEqual(connect_timeout, settings.HTTP_CONNECT_TIMEOUT)
+        self.assertLessEqual(read_timeout, 2)
+
+        self.assertEqual(
+            Deadline.for_media_type(MediaFileTypes.VIDEO.value).budget,
+            settings.VIDEO_POST_DEADLINE_SECONDS,
+        )
+
+    def test_spent_deadline_raises(self):
+        deadline = Deadline(0)
+
+        with self.assertRaises(ErrorDeadlineExceeded):
+            deadline.timeout("publish")
+
+        with self.assertRaises(ErrorDeadlineExceeded):
+            deadline.sleep(5)
+
+
+class TestDispatcher(TestCase):
+
+    def test_due_deliveries_are_split_in_lanes_by_scheduled_time(self):
+        # uv run python manage.py test integrations.tests.TestDispatcher
+
+        now_utc = timezone.now()
+
+        video = create_post(
+            now_utc - timedelta(minutes=10),
+            media_file="1/video.mp4",
+            media_file_type=MediaFileTypes.VIDEO.value,
+            video_processed=True,
+            post_on_tiktok=True,
+        )
+        text = create_post(
+            now_utc - timedelta(minutes=5), post_on_x=True, post_on_linkedin=True
+        )
+        create_post(now_utc + timedelta(minutes=5), post_on_x=True)
+
+        deliveries = get_due_deliveries(now_utc)
+
+        self.assertEqual(
+            [(d.post_id, d.platform, d.lane) for d in deliveries],
+            [
+                (video.pk, Platform.TIKTOK.value, MEDIA_LANE),
+                (text.pk, Platform.X_TWITTER.value, SHORT_LANE),
+                (text.pk, Platform.LINKEDIN.value, SHORT_LANE),
+            ],
+        )
+
+    def test_deliveries_wait_for_media_processing(self):
+        # uv run python manage.py test integrations.tests.TestDispatcher
+
+        now_utc = timezone.now()
+        media_wait = timedelta(seconds=settings.MEDIA_READY_WAIT_SECONDS)
+
+        processing = create_post(
+            now_utc - timedelta(minutes=1),
+            media_file="1/video.mp4",
+            media_file_type=MediaFileTypes.VIDEO.value,
+            post_on_tiktok=True,
+        )
+        stuck = create_post(
+            now_utc - media_wait - timedelta(minutes=1),
+            media_file="1/image.jpg",
+            media_file_type=MediaFileTypes.IMAGE.value,
+            post_on_x=True,
+        )
+
+        deliveries = get_due_deliveries(now_utc)
+
+        # Failed processing doesn't hold the post forever
+        self.assertEqual([d.post_id for d in deliveries], [stuck.pk])
+
+        PostModel.objects.filter(pk=processing.pk).update(video_processed=True)
+        self.assertEqual(
+            [d.post_id for d in get_due_deliveries(now_utc)], [stuck.pk, processing.pk]
+        )
+
+    def test_in_flight_deliveries_are_not_queued_twice(self):
+        now_utc = timezone.now()
+        create_post(now_utc - timedelta(minutes=1), post_on_x=True)
+
+        dispatcher = Dispatcher({SHORT_LANE: 1, MEDIA_LANE: 1})
+
+        self.assertTrue(dispatcher.submit(get_due_deliveries(now_utc)[0]))
+        self.assertFalse(dispatcher.submit(get_due_deliveries(now_utc)[0]))
+        self.assertEqual(dispatcher.queues[SHORT_LANE].qsize(), 1)
+
+    def test_platforms_of_a_post_share_one_media_download(self):
+        import tempfile
+        from unittest import mock
+
+        now_utc = timezone.now()
+        create_post(now_utc - timedelta(minutes=1), post_on_x=True, post_on_linkedin=True)
+
+        def download(url):
+            return tempfile.mkstemp(suffix=".jpg")[1]
+
+        dispatcher = Dispatcher({SHORT_LANE: 1, MEDIA_LANE: 1})
+        deliveries = get_due_deliveries(now_utc)
+        for delivery in deliveries:
+            dispatcher.submit(delivery)
+
+        with mock.patch(
+            "integrations.helpers.dispatcher.get_filepath_from_cloudflare_url", side_effect=download
+        ) as downloaded:
+            paths = {dispatcher.media_copies.get(d.post_id, "/media/1/a.jpg") for d in deliveries}
+        self.assertEqual(downloaded.call_count, 1)
+        path = paths.pop()
+
+        # Kept until the last platform of the post is done
+        dispatcher.finish(deliveries[0])
+        self.assertTrue(os.path.exists(path))
+        dispatcher.finish(deliveries[1])
+        self.assertFalse(os.path.exists(path))
+
+    def test_paused_platforms_are_not_queued(self):
+        from unittest import mock
+
+        now_utc = timezone.now()
+        create_post(now_utc - timedelta(minutes=1), post_on_x=True, post_on_linkedin=True)
+
+        breakers = CircuitBreakers(failure_threshold=1, cooldown=60)
+        breakers.record_failure(Platform.X_TWITTER.value, requests.ConnectionError())
+
+        dispatcher = Dispatcher({SHORT_LANE: 1, MEDIA_LANE: 1})
+        with mock.patch("integrations.helpers.dispatcher.circuit_breakers", breakers):
+            queued = [dispatcher.submit(d) for d in get_due_deliveries(now_utc)]
+
+        # Only LinkedIn, X waits for its cooldown without being queued every tick
+        self.assertEqual(queued, [False, True])
+        self.assertEqual(dispatcher.queues[SHORT_LANE].qsize(), 1)
+
+    def test_integrations_are_preloaded_in_one_query(self):
+        now_utc = timezone.now()
+        for account_id in [1, 2]:
+            IntegrationsModel.objects.create(
+                account_id=account_id, platform=Platform.X_TWITTER.value
+            )
+            create_post(
+                now_utc - timedelta(minutes=1),
+                account_id=account_id,
+                post_on_x=True,
+                post_on_linkedin=True,
+            )
+
+        deliveries = get_due_deliveries(now_utc)
+        with self.assertNumQueries(1):
+            preload_integrations(deliveries)
+
+        self.assertEqual(
+            [(d.account_id, d.platform, bool(d.integration)) for d in deliveries],
+            [
+                (1, Platform.X_TWITTER.value, True),
+                (1, Platform.LINKEDIN.value, False),
+                (2, Platform.X_TWITTER.value, True),
+                (2, Platform.LINKEDIN.value, False),
+            ],
+        )
+
+    def test_fair_queue_round_robins_accounts_oldest_first(self):
+        now_utc = timezone.now()
+
+        def delivery(account_id, minutes_late, platform=Platform.X_TWITTER.value):
+            return Delivery(
+                scheduled_aware=now_utc - timedelta(minutes=minutes_late),
+                post_id=minutes_late,
+                account_id=account_id,
+                platform=platform,
+            )
+
+        fair_queue = FairQueue()
+        # Agency account with a backlog queued first
+        fair_queue.put(delivery(1, 10))
+        fair_queue.put(delivery(1, 30))
+        fair_queue.put(delivery(1, 20, Platform.LINKEDIN.value))
+        fair_queue.put(delivery(2, 1))
+
+        order = [fair_queue.get(timeout=0) for _ in range(4)]
+
+        self.assertEqual(
+            [(d.account_id, d.post_id) for d in order],
+            [(1, 30), (2, 1), (1, 20), (1, 10)],
+        )
+
+        # Accounts waiting longer go first, whatever order they were queued in
+        fair_queue.put(delivery(1, 5))
+        fair_queue.put(delivery(2, 1))
+        fair_queue.put(delivery(3, 40))
+        fair_queue.put(delivery(3, 50))
+
+        order = [fair_queue.get(timeout=0) for _ in range(4)]
+
+        self.assertEqual(
+            [(d.account_id, d.post_id) for d in order],
+            [(3, 50), (1, 5), (2, 1), (3, 40)],
+        )
+
+    def test_rate_limiter_without_rate_does_not_throttle(self):
+        stop_event = Event()
+        limiter = RateLimiter(0)
+
+        self.assertTrue(all(limiter.acquire(stop_event) for _ in range(10)))
+
+        stop_event.set()
+        self.assertFalse(limiter.acquire(stop_event))
+
+
+class TestCircuitBreaker(TestCase):
+
+    def http_error(self, status_code: int):
+        response = requests.Response()
+        response.status_code = status_code
+        return requests.HTTPError(response=response)
+
+    def test_opens_on_outage_and_closes_after_a_probe(self):
+        # uv run python manage.py test integrations.tests.TestCircuitBreaker
+
+        breakers = CircuitBreakers(failure_threshold=2, cooldown=0, max_cooldown=0)
+        platform = Platform.FACEBOOK.value
+
+        self.assertFalse(breakers.record_failure(platform, requests.ConnectionError()))
+        self.assertTrue(breakers.record_failure(platform, requests.ConnectionError()))
+
+        # Other platforms keep posting
+        self.assertEqual(breakers.allow(Platform.LINKEDIN.value), CLOSED)
+
+        # Only one probe goes through once the cooldown is over
+        self.assertEqual(breakers.allow(platform), HALF_OPEN)
+        self.assertIsNone(breakers.allow(platform))
+
+        breakers.record_success(platform)
+        self.assertEqual(breakers.allow(platform), CLOSED)
+
+    def test_client_errors_leave_the_breaker_alone(self):
+        breakers = CircuitBreakers(failure_threshold=2, cooldown=60)
+        platform = Platform.TIKTOK.value
+
+        self.assertFalse(breakers.record_failure(platform, self.http_error(400)))
+        self.assertFalse(breakers.record_failure(platform, self.http_error(401)))
+        self.assertEqual(breakers.allow(platform), CLOSED)
+
+        # Neither tripping nor resetting it
+        self.assertFalse(breakers.record_failure(platform, self.http_error(503)))
+        self.assertFalse(breakers.record_failure(platform, self.http_error(400)))
+        self.assertTrue(breakers.record_failure(platform, self.http_error(503)))
+
+        self.assertFalse(breakers.record_failure(platform, self.http_error(401)))
+        self.assertIsNone(breakers.allow(platform))
+
+
+class TestQuotaLedger(TestCase):
+
+    def test_deliveries_over_the_daily_limit_are_deferred(self):
+        # uv run python manage.py test integrations.tests.TestQuotaLedger
+
+        platform = Platform.X_TWITTER.value
+        self.assertIsNone(get_deferral(1, platform))
+
+        record_publish(1, platform, limit=2, remaining=1)
+        self.assertIsNone(get_deferral(1, platform))
+
+        record_publish(1, platform)
+        self.assertEqual(
+            get_deferral(1, platform),
+            get_window_start(timezone.now()) + QUOTA_WINDOW,
+        )
+
+        # Reported reset time wins over the fixed window
+        reset_at = timezone.now() + timedelta(hours=3)
+        record_publish(2, platform, limit=5, remaining=0, reset_at=reset_at)
+        self.assertEqual(get_deferral(2, platform), reset_at)
+
+    def test_deferred_post_keeps_wall_clock_and_retries(self):
+        post = create_post(
+            timezone.now(),
+            post_timezone="Europe/Bucharest",
+            post_on_x=True,
+            post_on_linkedin=True,
+            retries_x=2,
+        )
+        until = get_window_start(timezone.now()) + QUOTA_WINDOW
+
+        deferred = defer_post(post.pk, Platform.X_TWITTER.value, until, "Daily post limit reached.")
+        post.refresh_from_db()
+
+        self.assertFalse(post.post_on_x)
+        self.assertTrue(post.post_on_linkedin)
+
+        self.assertEqual(deferred.scheduled_aware, until)
+        self.assertTrue(deferred.post_on_x)
+        self.assertFalse(deferred.post_on_linkedin)
+        self.assertEqual(deferred.retries_x, 2)
+
+    def test_tiktok_cap_clears_the_creator_info(self):
+        post = create_post(timezone.now(), post_on_tiktok=True)
+        key = get_creator_info_cache_key(post.account_id)
+        cache.set(key, {"creator_nickname": "test"})
+
+        defer_exhausted(post.pk, post.account_id, Platform.TIKTOK.value, ErrorQuotaExceeded())
+
+        self.assertIsNone(cache.get(key))
+        self.assertIsNotNone(get_deferral(post.account_id, Platform.TIKTOK.value))
+
+
+class TestRefreshScheduler(TestCase):
+
+    def test_only_integrations_due_for_refresh_are_popped(self):
+        # uv run python manage.py test integrations.tests.TestRefreshScheduler
+
+        now = timezone.now()
+
+        def create_integration(platform, access_expire):
+            return IntegrationsModel.objects.create(
+                account_id=1, platform=platform, access_expire=access_expire
+            )
+
+        expiring = create_integration(Platform.X_TWITTER.value, now + timedelta(minutes=5))
+        create_integration(Platform.TIKTOK.value, now + timedelta(hours=20))
+        # Instagram tokens are refreshed with the Facebook ones
+        create_integration(Platform.INSTAGRAM.value, now - timedelta(minutes=5))
+
+        scheduler = RefreshScheduler(workers=1, resync_interval=timedelta(minutes=5))
+        scheduler.resync()
+
+        self.assertEqual(len(scheduler.heap), 2)
+        self.assertEqual(scheduler.pop_due(now), [expiring.pk])
+        self.assertEqual(scheduler.pop_due(now), [])
+
+        # Rescheduled entries replace the older ones
+        scheduler.schedule(expiring.pk, now - timedelta(minutes=1))
+        scheduler.schedule(expiring.pk, now + timedelta(hours=1))
+        self.assertEqual(scheduler.pop_due(now), [])
+
+        # Locks of integrations that are gone are dropped
+        scheduler.get_lock(expiring.pk)
+        scheduler.get_lock(expiring.pk + 100)
+        scheduler.resync()
+        self.assertEqual(set(scheduler.locks), {expiring.pk})
+
+    def test_refresh_waits_are_bounded_by_the_deadline(self):
+        from unittest import mock
+        from concurrent.futures import ThreadPoolExecutor
+
+        integration = IntegrationsModel.objects.create(
+            account_id=1,
+            platform=Platform.X_TWITTER.value,
+            access_expire=timezone.now() + timedelta(minutes=5),
+        )
+
+        scheduler = RefreshScheduler(workers=1, resync_interval=timedelta(minutes=5))
+        scheduler.pool = ThreadPoolExecutor(1)
+        token_endpoint = Event()
+        self.addCleanup(scheduler.pool.shutdown)
+        self.addCleanup(token_endpoint.set)
+
+        # Slow token endpoint, the publish worker gives up instead of waiting on it
+        with mock.patch.object(scheduler, "refresh", side_effect=lambda pk: token_endpoint.wait(10)):
+            with self.assertRaises(ErrorDeadlineExceeded):
+                scheduler.ensure_fresh(integration, Deadline(0.1))
+
+
+class TestIntegrationTokens(TestCase):
+
+    def test_tokens_are_encrypted_once(self):
+        # uv run python manage.py test integrations.tests.TestIntegrationTokens
+
+        integration = IntegrationsModel.objects.create(
+            account_id=1,
+            platform=Platform.X_TWITTER.value,
+            access_token="access",
+            refresh_token="refresh",
+        )
+        integration = IntegrationsModel.objects.get(pk=integration.pk)
+        stored_refresh_token = integration.refresh_token
+
+        # Only the access token changes on a refresh
+        integration.access_token = "new-access"
+        integration.save()
+        integration.save()
+
+        integration = IntegrationsModel.objects.get(pk=integration.pk)
+        self.assertEqual(integration.access_token_value, "new-access")
+        self.assertEqual(integration.refresh_token_value, "refresh")
+        self.assertEqual(integration.refresh_token, stored_refresh_token)
+
+
+class TestPostValidation(TestCase):
+
+    def test_authorized_platforms_are_loaded_once(self):
+        # uv run python manage.py test integrations.tests.TestPostValidation
+
+        IntegrationsModel.objects.create(account_id=1, platform=Platform.X_TWITTER.value)
+        IntegrationsModel.objects.create(account_id=1, platform=Platform.LINKEDIN.value)
+
+        post = PostModel(
+            scheduled_on=timezone.now(),
+            post_timezone="UTC",
+            account_id=1,
+            description="Test",
+            post_on_x=True,
+            post_on_linkedin=True,
+        )
+        # One lookup for the platforms and the insert (the rest are daily counts)
+        with CaptureQueriesContext(connection) as context:
+            post.save()
+        queries = [
+            query["sql"] for query in context.captured_queries
+            if "dailyplatformcount" not in query["sql"] and "SAVEPOINT" not in query["sql"]
+        ]
+        self.assertEqual(len(queries), 2)
+
+        authorized_platforms = IntegrationsModel.get_authorized_platforms_by_account([1, 2])
+        self.assertEqual(authorized_platforms[2], set())
+
+        post = PostModel(
+            scheduled_on=timezone.now(),
+            post_timezone="UTC",
+            account_id=2,
+            description="Test",
+            post_on_x=True,
+        )
+        with self.assertNumQueries(0):
+            with self.assertRaises(ValueError):
+                post.save(authorized_platforms=authorized_platforms[2])
+
+
+class TestIntegrationsContext(TestCase):
+
+    def test_context_is_cached_until_integrations_change(self):
+        # uv run python manage.py test integrations.tests.TestIntegrationsContext
+
+        delete_integrations_context(1)
+
+        context = get_integrations_context(1)
+        self.assertFalse(context["x_ok"])
+
+        with self.assertNumQueries(0):
+            context = get_integrations_context(1)
+        self.assertFalse(context["x_ok"])
+
+        integration = IntegrationsModel.objects.create(
+            account_id=1, platform=Platform.X_TWITTER.value, username="imposting"
+        )
+        context = get_integrations_context(1)
+        self.assertTrue(context["x_ok"])
+        self.assertEqual(context["x_username"], "imposting")
+
+        integration.delete()
+        context = get_integrations_context(1)
+        self.assertFalse(context["x_ok"])
+
+
+class TestCalendarData(TestCase):
+
+    def get_calendar_counts(self, start: date, end: date):
+        daily_counts = DailyPlatformCountModel.objects.filter(
+            account_id=1, date__range=(start, end)
+        ).exclude(count=0).values("date", "platform", "count")
+        return get_calendar_counts(daily_counts, start, end)
+
+    def test_daily_counts_follow_posts(self):
+        # uv run python manage.py test integrations.tests.TestCalendarData
+
+        today = timezone.now().replace(year=2024, month=3, day=1)
+        post = PostModel(
+            scheduled_on=today.replace(month=2, day=29),
+            post_timezone="UTC",
+            account_id=1,
+            description="Test",
+            post_on_x=True,
+            post_on_facebook=True,
+        )
+        post.save(skip_validation=True)
+        PostModel(
+            scheduled_on=today.replace(month=12, day=31),
+            post_timezone="UTC",
+            account_id=1,
+            description="Test",
+            post_on_tiktok=True,
+        ).save(skip_validation=True)
+
+        # Published posts still count
+        post = PostModel.objects.get(pk=post.pk)
+        post.post_on_facebook = False
+        post.link_facebook = "https://facebook.com/post"
+        post.save(skip_validation=True)
+
+        start, end = get_calendar_range({"year": "2024"}, today.date())
+        counts = self.get_calendar_counts(start, end)
+
+        self.assertEqual(len(counts["posts"]), 366)
+        leap_day = (date(2024, 2, 29) - start).days
+        self.assertEqual(counts["posts"][leap_day], 1)
+        self.assertEqual(counts["x"][leap_day], 1)
+        self.assertEqual(counts["facebook"][leap_day], 1)
+        self.assertEqual(counts["posts"][leap_day + 1], 0)
+
+        # TikTok is not part of the day total
+        self.assertEqual(counts["tiktok"][-1], 1)
+        self.assertEqual(counts["posts"][-1], 0)
+
+        # Retry clone moves the x post to the next day
+        post.post_on_x = False
+        post.save(skip_validation=True)
+        post.pk = None
+        post.post_on_x = True
+        post.link_facebook = None
+        post.scheduled_on += timedelta(days=1)
+        post.save(skip_validation=True)
+
+        start, end = get_calendar_range(
+            {"start": "2024-02-29", "end": "2024-03-01"}, today.date()
+        )
+        counts = self.get_calendar_counts(start, end)
+        self.assertEqual(counts["x"], [0, 1])
+        self.assertEqual(counts["facebook"], [1, 0])
+
+        PostModel.objects.filter(pk=post.pk).delete()
+        counts = self.get_calendar_counts(start, end)
+        self.assertEqual(counts["posts"], [1, 0])
+
+        stored = DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all())
+        self.assertEqual(stored, DailyPlatformCountModel.count_posts(PostModel.objects.all()))
+        self.assertEqual(DailyPlatformCountModel.rebuild(), stored)
+
+        with self.assertRaises(ValueError):
+            get_calendar_range({"start": "2024-01-01", "end": "2025-12-31"}, today.date())
+
+
+class TestScheduleVersion(TestCase):
+
+    def test_calendar_is_not_modified_until_posts_change(self):
+        # uv run python manage.py test integrations.tests.TestScheduleVersion
+
+        user = get_user_model().objects.create_user(username="imposting", password="imposting")
+        self.client.force_login(user)
+
+        # Versions outlive the test database in the file cache
+        cache.delete(get_schedule_version_cache_key(user.pk))
+
+        response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        etag = response["ETag"]
+
+        # Years select comes from the fragment cache
+        with self.assertNumQueries(2):
+            response = self.client.get("/")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["ETag"], etag)
+
+        response = self.client.get("/calendar-data/?year=2024")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()["counts"]["posts"]), 366)
+        data_etag = response["ETag"]
+
+        response = self.client.get("/calendar-data/?year=2024", HTTP_IF_NONE_MATCH=data_etag)
+        self.assertEqual(response.status_code, 304)
+
+        # Same schedule version, no queries past the session/user lookup
+        with self.assertNumQueries(2):
+            response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        version = get_schedule_version(user.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            PostModel(
+                scheduled_on=timezone.now(),
+                post_timezone="UTC",
+                account_id=user.pk,
+                description="Test",
+                post_on_x=True,
+            ).save(skip_validation=True)
+        self.assertNotEqual(get_schedule_version(user.pk), version)
+
+        response = self.client.get("/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], etag)
+
+        response = self.client.get("/calendar-data/?year=2024", HTTP_IF_NONE_MATCH=data_etag)
+        self.assertEqual(response.status_code, 200)
+
+
+class TestQueryIndexes(TestCase):
+    # uv run python manage.py test integrations.tests.TestQueryIndexes
+
+    def assertUsesIndex(self, queryset, index_name: str):
+        self.assertIn(index_name, queryset.explain())
+
+    def test_due_deliveries_use_pending_index(self):
+        latest_wall_clock = timezone.now() + timedelta(hours=14)
+        self.assertUsesIndex(
+            PostModel.objects.filter(PENDING_POSTS, scheduled_on__lte=latest_wall_clock),
+            "post_pending_scheduled_idx",
+        )
+
+    def test_schedule_day_uses_account_index(self):
+        day_start = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.assertUsesIndex(
+            PostModel.objects.filter(
+                account_id=1,
+                scheduled_on__gte=day_start,
+                scheduled_on__lt=day_start + timedelta(days=1),
+            ),
+            "post_account_scheduled_idx",
+        )
+
+    def test_processing_queues_use_partial_indexes(self):
+        self.assertUsesIndex(
+            PostModel.objects.filter(
+                process_image=True,
+                image_processed=False,
+                media_file_type=MediaFileTypes.IMAGE.value,
+            ).filter(PENDING_POSTS),
+            "post_image_processing_idx",
+        )
+        self.assertUsesIndex(
+            PostModel.objects.filter(
+                process_video=True,
+                video_processed=False,
+                media_file_type=MediaFileTypes.VIDEO.value,
+            ).filter(PENDING_POSTS),
+            "post_video_processing_idx",
+        )
+
+    def test_integration_lookup_uses_unique_index(self):
+        plan = IntegrationsModel.objects.filter(
+            account_id=1, platform=Platform.X_TWITTER.value
+        ).explain()
+        # SQLite names the unique constraint index itself
+        self.assertIn("USING INDEX", plan)
+        self.assertIn("account_id=? AND platform=?", plan)
+
+
+class TestArchivePosts(TestCase):
+
+    def test_published_posts_are_archived(self):
+        # uv run python manage.py test integrations.tests.TestArchivePosts
+
+        now_utc = timezone.now()
+        old = now_utc - timedelta(days=settings.POST_ARCHIVE_AFTER_DAYS + 2)
+
+        published = PostModel(
+            scheduled_on=old,
+            post_timezone="UTC",
+            account_id=1,
+            description="Published",
+            link_x="https://x.com/post",
+            media_file="1/image.jpg",
+        )
+        published.save(skip_validation=True)
+        pending = PostModel(
+            scheduled_on=old,
+            post_timezone="UTC",
+            account_id=1,
+            description="Pending",
+            post_on_linkedin=True,
+        )
+        pending.save(skip_validation=True)
+        recent = PostModel(
+            scheduled_on=now_utc,
+            post_timezone="UTC",
+            account_id=1,
+            description="Recent",
+            link_x="https://x.com/post",
+        )
+        recent.save(skip_validation=True)
+
+        counts = DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all())
+
+        from django_cleanup.signals import cleanup_pre_delete
+
+        removed = []
+        def record_removed(sender, file_name, **kwargs):
+            removed.append(file_name)
+        cleanup_pre_delete.connect(record_removed)
+        self.addCleanup(cleanup_pre_delete.disconnect, record_removed)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive_posts(now_utc), 1)
+        self.assertEqual(archive_posts(now_utc), 0)
+
+        # The archived copy keeps the media file
+        self.assertEqual(removed, [])
+
+        self.assertFalse(PostModel.objects.filter(pk=published.pk).exists())
+        archived = ArchivedPostModel.objects.get(pk=published.pk)
+        self.assertEqual(archived.description, "Published")
+        self.assertEqual(archived.link_x, "https://x.com/post")
+        self.assertEqual(archived.media_file.name, "1/image.jpg")
+        self.assertEqual(
+            set(PostModel.objects.values_list("pk", flat=True)), {pending.pk, recent.pk}
+        )
+
+        # Calendar counts are unchanged and still match both tables
+        stored = DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all())
+        self.assertEqual(stored, counts)
+        self.assertEqual(stored, DailyPlatformCountModel.count_all_posts())
+
+        archived.delete()
+        stored = DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all())
+        self.assertEqual(stored, DailyPlatformCountModel.count_all_posts())
+
+
+class TestPartialPostSaves(TestCase):
+
+    def test_processing_saves_skip_calendar_counts(self):
+        # uv run python manage.py test integrations.tests.TestPartialPostSaves
+
+        PostModel(
+            scheduled_on=timezone.now(),
+            post_timezone="UTC",
+            account_id=1,
+            description="Test",
+            post_on_instagram=True,
+            media_file_type=MediaFileTypes.IMAGE.value,
+        ).save(skip_validation=True)
+        counts = DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all())
+
+        post = PostModel.objects.only("pk", "account_id", "description", "media_file").get()
+        # Only the update of the loaded columns
+        with self.assertNumQueries(1):
+            post.image_processed = True
+            post.save(skip_validation=True)
+
+        post = PostModel.objects.get()
+        self.assertTrue(post.image_processed)
+        self.assertEqual(
+            DailyPlatformCountModel.get_counts(DailyPlatformCountModel.objects.all()), counts
+        )
+
+
+    def test_platform_link_updates_keep_each_other(self):
+        # uv run python manage.py test integrations.tests.TestPartialPostSaves
+
+        from asgiref.sync import async_to_sync
+        from integrations.platforms.xtwitter import update_x_link
+        from integrations.platforms.facebook import update_facebook_link
+
+        post = create_post(timezone.now(), post_on_x=True, post_on_facebook=True)
+
+        async_to_sync(update_x_link)(post.id, "https://x.com/1", "None")
+        async_to_sync(update_facebook_link)(post.id, None, "Facebook is down")
+
+        post.refresh_from_db()
+        self.assertEqual(post.link_x, "https://x.com/1")
+        self.assertIsNone(post.error_x)
+        self.assertEqual(post.error_facebook, "Facebook is down")
+        self.assertFalse(post.post_on_x or post.post_on_facebook)
+
+        # Stored posts and their counts agree (the retry is a new post)
+        expected = Counter()
+        for stored in PostModel.objects.all():
+            expected.update(stored.get_rollup_keys())
+        counts = Counter({
+            (row.account_id, row.date, row.platform): row.count
+            for row in DailyPlatformCountModel.objects.filter(count__gt=0)
+        })
+        self.assertEqual(counts, +expected)
+
+
+class TestImagePool(TestCase):
+
+    def test_jobs_run_in_worker_processes(self):
+        # uv run python manage.py test integrations.tests.TestImagePool
+
+        import tempfile
+        from PIL import Image
+
+        tmpdir = tempfile.mkdtemp()
+        image_paths = []
+        for idx in range(2):
+            image_path = os.path.join(tmpdir, f"{idx}.jpg")
+            Image.new("RGB", (400, 300), "white").save(image_path)
+            image_paths.append(image_path)
+        image_paths.append(os.path.join(tmpdir, "missing.jpg"))
+
+        pool = create_image_pool(2)
+        try:
+            outcomes = run_image_jobs(
+                pool, [(resize_image, (image_path,)) for image_path in image_paths], timeout=60
+            )
+        finally:
+            close_image_pool(pool)
+
+        for image_path, outcome in zip(image_paths[:2], outcomes):
+            # Flat images are encoded as PNG
+            self.assertEqual(outcome, image_path.replace(".jpg", ".png"))
+            with Image.open(outcome) as image:
+                self.assertEqual(image.size, (1080, 1350))
+
+        # Failed jobs don't take the batch down
+        self.assertIsInstance(outcomes[2], FileNotFoundError)
+
+
+    def test_media_worker_keeps_its_pool_between_polls(self):
+        media_worker = MediaWorker(video_workers=0, poll_seconds=0)
+        try:
+            self.assertEqual(media_worker.process_images(), 0)
+            pool = media_worker.image_pool
+            self.assertIsNotNone(pool)
+
+            self.assertEqual(media_worker.process_images(), 0)
+            self.assertIs(media_worker.image_pool, pool)
+        finally:
+            media_worker.stop()
+
+        self.assertIsNone(media_worker.image_pool)
+
+
+class TestResizeImage(TestCase):
+
+    def legacy_resize(self, image_path: str, target_width: int = 1080, target_height: int = 1350):
+        # Full decode, resize of the whole frame, then crop
+        from PIL import Image
+
+        img = Image.open(image_path).convert("RGB")
+        if img.width / img.height > target_width / target_height:
+            new_width = int(target_height * img.width / img.height)
+            resized = img.resize((new_width, target_height), Image.LANCZOS)
+            left = (new_width - target_width) // 2
+            return resized.crop((left, 0, left + target_width, target_height))
+
+        new_height = int(target_width * img.height / img.width)
+        resized = img.resize((target_width, new_height), Image.LANCZOS)
+        top = (new_height - target_height) // 2
+        return resized.crop((0, top, target_width, top + target_height))
+
+    def test_matches_full_decode(self):
+        # uv run python manage.py test integrations.tests.TestResizeImage
+
+        import tempfile
+        from PIL import Image, ImageChops, ImageDraw, ImageStat
+
+        tmpdir = tempfile.mkdtemp()
+        for size, ext in [((6000, 4000), "jpg"), ((2000, 3000), "jpg"), ((1500, 900), "png")]:
+            # Photo-like content, smooth gradients with a few edges
+            image = Image.merge("RGB", [
+                Image.linear_gradient("L").resize(size),
+                Image.radial_gradient("L").resize(size),
+                Image.linear_gradient("L").rotate(90).resize(size),
+            ])
+            draw = ImageDraw.Draw(image)
+            for idx in range(0, size[0], 400):
+                draw.ellipse((idx, idx // 2, idx + 300, idx // 2 + 300), fill=(200, 40, 90))
+            image_path = os.path.join(tmpdir, f"{size[0]}.{ext}")
+            image.save(image_path, quality=95)
+
+            expected = self.legacy_resize(image_path)
+            with Image.open(resize_image(image_path)) as resized:
+                self.assertEqual(resized.size, (1080, 1350))
+                diff = ImageStat.Stat(ImageChops.difference(resized.convert("RGB"), expected))
+                self.assertLess(max(diff.mean), 2, size)
+
+    def test_refuses_huge_images(self):
+        # uv run python manage.py test integrations.tests.TestResizeImage
+
+        import tempfile
+        from PIL import Image
+
+        image_path = os.path.join(tempfile.mkdtemp(), "large.png")
+        Image.new("RGB", (2000, 2000)).save(image_path)
+
+        original = settings.IMAGE_MAX_PIXELS
+        settings.IMAGE_MAX_PIXELS = 1000 * 1000
+        try:
+            with self.assertRaisesMessage(Exception, "too large"):
+                resize_image(image_path)
+        finally:
+            settings.IMAGE_MAX_PIXELS = original
+
+
+class TestMediaClaims(TestCase):
+
+    def test_posts_are_claimed_once(self):
+        # uv run python manage.py test integrations.tests.TestMediaClaims
+
+        now_utc = timezone.now()
+        posts = [
+            create_post(
+                now_utc + timedelta(minutes=minutes),
+                media_file="1/image.jpg",
+                media_file_type=MediaFileTypes.IMAGE.value,
+                post_on_x=True,
+            )
+            for minutes in [30, 10, 20]
+        ]
+        pending = PostModel.objects.filter(image_processed=False).filter(PENDING_POSTS)
+
+        # Soonest scheduled first
+        self.assertEqual([p.pk for p in claim_media_posts(pending, 2)], [posts[1].pk, posts[2].pk])
+        self.assertEqual([p.pk for p in claim_media_posts(pending, 2)], [posts[0].pk])
+        self.assertEqual(claim_media_posts(pending, 2), [])
+
+        # Failed or crashed jobs are picked up again once their claim is stale
+        stale = now_utc - timedelta(seconds=settings.MEDIA_CLAIM_TIMEOUT_SECONDS + 1)
+        PostModel.objects.filter(pk=posts[0].pk).update(media_claimed_at=stale)
+        self.assertEqual([p.pk for p in claim_media_posts(pending, 2)], [posts[0].pk])
+
+        self.assertEqual(release_media_claims(), 3)
+        self.assertEqual(len(claim_media_posts(pending, 5)), 3)
+
+
+class TestMediaRenditions(TestCase):
+
+    def test_identical_sources_are_rendered_once(self):
+        # uv run python manage.py test integrations.tests.TestMediaRenditions
+
+        import shutil
+        import tempfile
+        from PIL import Image
+
+        spec = RenditionSpec("test_image_200x100", MediaFileTypes.IMAGE.value, 200, 100)
+
+        tmpdir = tempfile.mkdtemp()
+        source_path = os.path.join(tmpdir, "source.jpg")
+        Image.new("RGB", (800, 800), "white").save(source_path)
+        # Same content uploaded again for another post
+        copy_path = os.path.join(tmpdir, "copy.jpg")
+        shutil.copy(source_path, copy_path)
+
+        first_path = get_or_render(spec, source_path)
+        rendition = MediaRenditionModel.objects.get()
+        self.addCleanup(rendition.media_file.delete, save=False)
+
+        second_path = get_or_render(spec, copy_path)
+        self.assertEqual(MediaRenditionModel.objects.count(), 1)
+        self.assertNotEqual(first_path, second_path)
+
+        for path in [first_path, second_path]:
+            with Image.open(path) as image:
+                self.assertEqual(image.size, (200, 100))
+            os.remove(path)
+
+    def test_renditions_are_only_dropped_when_missing(self):
+        from unittest import mock
+
+        spec = RenditionSpec("test_image_200x100", MediaFileTypes.IMAGE.value, 200, 100)
+        MediaRenditionModel.objects.create(source_hash="abc", spec=spec.name, media_file="1/a.jpg")
+
+        response = requests.Response()
+        response.status_code = 503
+        for err in [requests.Timeout(), requests.HTTPError(response=response)]:
+            with mock.patch(
+                "integrations.helpers.renditions.get_filepath_from_cloudflare_url", side_effect=err
+            ):
+                self.assertIsNone(get_rendition_path("abc", spec))
+            self.assertTrue(MediaRenditionModel.objects.exists())
+
+        response.status_code = 404
+        with mock.patch(
+            "integrations.helpers.renditions.get_filepath_from_cloudflare_url",
+            side_effect=requests.HTTPError(response=response),
+        ):
+            self.assertIsNone(get_rendition_path("abc", spec))
+        self.assertFalse(MediaRenditionModel.objects.exists())
+
+
+class TestEncodeImage(TestCase):
+
+    def test_format_and_quality_fit_the_budget(self):
+        # uv run python manage.py test integrations.tests.TestEncodeImage
+
+        from PIL import Image, ImageDraw
+
+        # Photo-like, gradients and some grain
+        gradients = Image.merge("RGB", [
+            Image.linear_gradient("L").resize((1080, 1350)),
+            Image.radial_gradient("L").resize((1080, 1350)),
+            Image.linear_gradient("L").rotate(90).resize((1080, 1350)),
+        ])
+        grain = Image.effect_noise((1080, 1350), 20).convert("RGB")
+        photo = Image.blend(gradients, grain, 0.1)
+        data, params = encode_image(photo, max_bytes=4 * 1024 * 1024)
+        self.assertEqual(params["format"], "JPEG")
+        self.assertTrue(params["progressive"])
+        self.assertGreaterEqual(params["psnr"], MIN_PSNR)
+        self.assertEqual(params["bytes"], len(data))
+
+        # Tight budget, quality is given up for size
+        quality, budget = params["quality"], len(data) // 2
+        data, params = encode_image(photo, max_bytes=budget)
+        self.assertLessEqual(len(data), budget)
+        self.assertLess(params["quality"], quality)
+
+        # Text card
+        card = Image.new("RGB", (1080, 1350), "white")
+        ImageDraw.Draw(card).text((100, 100), "Test " * 20, fill="black")
+        data, params = encode_image(card)
+        self.assertEqual(params["format"], "PNG")
+        self.assertTrue(data.startswith(b"\x89PNG"))
+
+
+class TestTextCard(TestCase):
+
+    def test_text_is_fitted_to_the_card(self):
+        # uv run python manage.py test integrations.tests.TestTextCard
+
+        style = CardStyle()
+        short_size, _ = layout_text("Short post", style)
+        long_size, _ = layout_text("A much longer post about scheduling. " * 20, style)
+        self.assertGreater(short_size, long_size)
+
+        for text in ["Short post", "Line\n\nbreaks", "word " * 2000, "x" * 500]:
+            font_size, lines = layout_text(text, style)
+            self.assertLessEqual(len(lines) * style.line_height(font_size), style.text_height)
+            for line in lines:
+                self.assertLessEqual(get_text_width(line, font_size), style.text_width)
+
+        # Manual line breaks are kept
+        self.assertEqual(layout_text("Line\n\nbreaks", style)[1], ["Line", "", "breaks"])
+
+    def test_cards_are_rendered_once(self):
+        # uv run python manage.py test integrations.tests.TestTextCard
+
+        import tempfile
+        from PIL import Image
+
+        text = f"Cached card {timezone.now()}"
+        style = CardStyle()
+        card_path = get_card_path(text, style)
+        self.addCleanup(card_path.unlink, missing_ok=True)
+
+        tmpdir = tempfile.mkdtemp()
+        create_text_card(text, os.path.join(tmpdir, "first.png"), style)
+        rendered_at = card_path.stat().st_mtime_ns
+        image_path = create_text_card(text, os.path.join(tmpdir, "second.png"), style)
+
+        self.assertEqual(card_path.stat().st_mtime_ns, rendered_at)
+        with Image.open(image_path) as image:
+            self.assertEqual(image.size, (1080, 1350))
+
+
+    def test_background_is_composited_under_the_text(self):
+        # uv run python manage.py test integrations.tests.TestTextCard
+
+        import shutil
+        import tempfile
+        from PIL import Image
+
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        background_path = os.path.join(tmpdir, "background.jpg")
+        Image.new("RGB", (1600, 900), "red").save(background_path)
+        copy_path = os.path.join(tmpdir, "copy.jpg")
+        shutil.copyfile(background_path, copy_path)
+
+        text = f"Card with background {timezone.now()}"
+        style = CardStyle(background_path=background_path)
+        card_path = get_card_path(text, style)
+        self.addCleanup(card_path.unlink, missing_ok=True)
+
+        # Temporary copies of the same background share the card
+        self.assertEqual(get_card_path(text, CardStyle(background_path=copy_path)), card_path)
+        self.assertNotEqual(get_card_path(text, CardStyle()), card_path)
+
+        image_path = create_text_card(text, os.path.join(tmpdir, "card.png"), style)
+        with Image.open(image_path) as image:
+            self.assertEqual(image.size, (1080, 1350))
+            red, green, blue = image.getpixel((5, 5))
+            self.assertGreater(red, 50)
+            self.assertLess(red, 255)
+            self.assertLess(green, 10)
+
+
+class TestPexelsPool(TestCase):
+
+    def setUp(self):
+        import shutil
+        import tempfile
+        from pathlib import Path
+        from unittest import mock
+
+        pool_dir = Path(tempfile.mkdtemp())
+        self.addCleanup(shutil.rmtree, pool_dir)
+        for name, path in [
+            ("POOL_DIR", pool_dir),
+            ("INDEX_PATH", pool_dir / "index.json"),
+            ("QUERIES_DIR", pool_dir / "queries"),
+            ("WANTED_DIR", pool_dir / "wanted"),
+            ("NOTIFIED_PATH", pool_dir / "notified_at"),
+        ]:
+            patcher = mock.patch.object(pexels, name, path)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_backgrounds_come_from_the_pool(self):
+        # uv run python manage.py test integrations.tests.TestPexelsPool
+
+        from PIL import Image
+
+        Image.new("RGB", (1080, 1350), "blue").save(pexels.POOL_DIR / "1.jpg")
+        Image.new("RGB", (1080, 1350), "gray").save(pexels.POOL_DIR / "2.jpg")
+        pexels.write_json(pexels.INDEX_PATH, {"1": ["ocean", "waves"], "2": ["city"]})
+
+        image_path = pexels.get_relevant_image_for_text("Ocean waves at dawn, ocean breeze")
+        self.addCleanup(os.remove, image_path)
+        with open(image_path, "rb") as f, open(pexels.POOL_DIR / "1.jpg", "rb") as pooled:
+            self.assertEqual(f.read(), pooled.read())
+        self.assertFalse(pexels.WANTED_DIR.exists())
+
+        # No match, a pooled background is used and the query is searched later
+        image_path = pexels.get_relevant_image_for_text("Mountains")
+        self.addCleanup(os.remove, image_path)
+        self.assertEqual(
+            [path.read_text() for path in pexels.WANTED_DIR.iterdir()], ["mountains"]
+        )
+
+    def test_pool_keeps_the_recently_picked_backgrounds(self):
+        import time
+        from unittest import mock
+        from core import settings as core_settings
+
+        index = {}
+        for idx, photo_id in enumerate(["1", "2", "3"]):
+            path = pexels.POOL_DIR / f"{photo_id}.jpg"
+            path.write_bytes(b"jpg")
+            os.utime(path, (time.time() - 100 + idx, time.time() - 100 + idx))
+            index[photo_id] = ["ocean"]
+        # Not in the index, left by an interrupted refill
+        (pexels.POOL_DIR / "4.jpg").write_bytes(b"jpg")
+
+        # Oldest download, but just picked
+        pexels.write_json(pexels.INDEX_PATH, index)
+        self.assertEqual(pexels.pick_from_pool(["forest"])[1], 0)
+        picked = max(index, key=lambda photo_id: (pexels.POOL_DIR / f"{photo_id}.jpg").stat().st_mtime)
+
+        expired = pexels.QUERIES_DIR / f"{pexels.get_query_key('ocean')}.json"
+        pexels.write_json(expired, {"fetched_at": 0, "photos": []})
+        os.utime(expired, (0, 0))
+
+        with mock.patch.object(core_settings, "PEXELS_POOL_SIZE", 2):
+            self.assertEqual(pexels.prune_pool(index), 1)
+            pexels.expire_query_cache()
+
+        self.assertEqual(len(index), 2)
+        self.assertIn(picked, index)
+        self.assertEqual(pexels.read_json(pexels.INDEX_PATH, {}), index)
+        self.assertEqual({path.stem for path in pexels.POOL_DIR.glob("*.jpg")}, set(index))
+        self.assertFalse(expired.exists())
+
+    def test_search_results_are_cached(self):
+        # uv run python manage.py test integrations.tests.TestPexelsPool
+
+        import time
+
+        photos = [{"id": "1", "alt": "Ocean", "url": "https://images.pexels.com/1.jpg"}]
+        cache_path = pexels.QUERIES_DIR / f"{pexels.get_query_key('ocean')}.json"
+        pexels.write_json(cache_path, {"fetched_at": time.time(), "photos": photos})
+
+        # Served without calling the API
+        self.assertEqual(pexels.search_photos("ocean"), photos)
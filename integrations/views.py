@@ -11,7 +11,8 @@ from django.contrib import messages
 from django.shortcuts import redirect, render
 from django.contrib.auth.decorators import login_required
 from .models import IntegrationsModel, Platform
-from .helpers.utils import get_integrations_context
+from .helpers.utils import get_integrations_context, delete_integrations_context
+from .platforms.common import get_creator_info_cache_key
 from django.core.cache import cache
 
 
@@ -63,7 +64,12 @@ def linkedin_callback(request):
         "client_secret": settings.LINKEDIN_CLIENT_SECRET,
     }
     token_headers = {"Content-Type": "application/x-www-form-urlencoded"}
-    response = requests.post(token_url, data=token_data, headers=token_headers)
+    response = requests.post(
+        token_url,
+        data=token_data,
+        headers=token_headers,
+        timeout=settings.HTTP_TIMEOUT,
+    )
     response.raise_for_status()
     token_json = response.json()
 
@@ -78,7 +84,11 @@ def linkedin_callback(request):
     headers = {
         "Authorization": f"Bearer {access_token}",
     }
-    response = requests.get(user_info_url, headers=headers)
+    response = requests.get(
+        user_info_url,
+        headers=headers,
+        timeout=settings.HTTP_TIMEOUT,
+    )
     response.raise_for_status()
     user_info = response.json()
     user_id = user_info.get("sub")
@@ -106,6 +116,8 @@ def linkedin_callback(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -124,6 +136,8 @@ def linkedin_uninstall(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -174,6 +188,7 @@ def x_callback(request):
         url=f"https://api.twitter.com/2/users/by/username/{username}",
         headers={"Authorization": f"Bearer {token['access_token']}"},
         params={"user.fields": "profile_image_url"},
+        timeout=settings.HTTP_TIMEOUT,
     )
     response.raise_for_status()
 
@@ -206,6 +221,8 @@ def x_callback(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -224,6 +241,8 @@ def x_uninstall(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -258,6 +277,7 @@ def facebook_callback(request):
             "grant_type": "authorization_code",
         },
         headers={"Content-Type": "application/x-www-form-urlencoded"},
+        timeout=settings.HTTP_TIMEOUT,
     )
     response.raise_for_status()
 
@@ -273,6 +293,7 @@ def facebook_callback(request):
             "fb_exchange_token": short_token,
         },
         headers={"Content-Type": "application/x-www-form-urlencoded"},
+        timeout=settings.HTTP_TIMEOUT,
     )
     response.raise_for_status()
 
@@ -282,7 +303,11 @@ def facebook_callback(request):
     # Retrieve user ID using the Graph API directly
     user_info_url = "https://graph.facebook.com/v23.0/me"
     user_info_params = {"access_token": access_token, "fields": "id"}
-    user_info_response = requests.get(user_info_url, params=user_info_params)
+    user_info_response = requests.get(
+        user_info_url,
+        params=user_info_params,
+        timeout=settings.HTTP_TIMEOUT,
+    )
     user_info_response.raise_for_status()
     user_data = user_info_response.json()
     user_id = user_data.get("id")
@@ -291,6 +316,7 @@ def facebook_callback(request):
     response_pages = requests.get(
         url=f"https://graph.facebook.com/v23.0/{user_id}/accounts",
         params={"access_token": access_token},
+        timeout=settings.HTTP_TIMEOUT,
     )
     response_pages.raise_for_status()
 
@@ -305,6 +331,7 @@ def facebook_callback(request):
     fb_page_details_response = requests.get(
         url=f"https://graph.facebook.com/v23.0/{page_id}",
         params={"access_token": page_access_token, "fields": "name,picture{url}"},
+        timeout=settings.HTTP_TIMEOUT,
     )
     fb_page_details_response.raise_for_status()
     fb_page_data = fb_page_details_response.json()
@@ -315,6 +342,7 @@ def facebook_callback(request):
     response_instagram = requests.get(
         url=f"https://graph.facebook.com/v23.0/{page_id}/instagram_accounts",
         params={"access_token": page_access_token},
+        timeout=settings.HTTP_TIMEOUT,
     )
     response_instagram.raise_for_status()
 
@@ -327,6 +355,7 @@ def facebook_callback(request):
             "access_token": page_access_token,
             "fields": "username,profile_picture_url",
         },
+        timeout=settings.HTTP_TIMEOUT,
     )
     ig_details_response.raise_for_status()
     ig_data = ig_details_response.json()
@@ -370,6 +399,8 @@ def facebook_callback(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -392,6 +423,8 @@ def facebook_uninstall(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -412,8 +445,7 @@ def tiktok_login(request):
 def tiktok_callback(request):
     social_uid = request.social_user_id
 
-    key = f"tiktok_creator_info_{social_uid}"
-    cache.delete(key)
+    cache.delete(get_creator_info_cache_key(social_uid))
 
     code = request.GET.get("code")
     error = request.GET.get("error")
@@ -436,7 +468,12 @@ def tiktok_callback(request):
         "Content-Type": "application/x-www-form-urlencoded",
     }
 
-    resp = requests.post(token_url, data=data, headers=headers)
+    resp = requests.post(
+        token_url,
+        data=data,
+        headers=headers,
+        timeout=settings.HTTP_TIMEOUT,
+    )
     if resp.status_code != 200:
         log.error(resp.content)
         messages.error(request, "Failed to fetch tokens from TikTok.")
@@ -451,6 +488,7 @@ def tiktok_callback(request):
             "Authorization": f"Bearer {token_data['access_token']}",
         },
         params={"fields": "display_name,avatar_url"},
+        timeout=settings.HTTP_TIMEOUT,
     )
     user_info_resp.raise_for_status()
 
@@ -482,6 +520,8 @@ def tiktok_callback(request):
         extra_tags="✅ Success!",
     )
 
+    delete_integrations_context(social_uid)
+
     return redirect("/integrations/")
 
 
@@ -500,14 +540,15 @@ def tiktok_uninstall(request):
         extra_tags="✅ Success!",
     )
 
-    key = f"tiktok_creator_info_{social_uid}"
-    cache.delete(key)
+    cache.delete(get_creator_info_cache_key(social_uid))
+
+    delete_integrations_context(social_uid)
 
     return redirect("/integrations/")
 
 
 def proxy_media_file(request, filename: str):
-    filepath = f"/tmp/{filename}"
+    filepath = os.path.join(settings.POSTER_TMP_DIR, os.path.basename(filename))
 
     if not os.path.isfile(filepath):
         raise Http404("File not found.")
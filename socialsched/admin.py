@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import PostModel
+from .models import PostModel, ArchivedPostModel, DailyPlatformCountModel
 
 
 admin.site.register(PostModel)
+admin.site.register(ArchivedPostModel)
+admin.site.register(DailyPlatformCountModel)
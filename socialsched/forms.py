@@ -6,7 +6,15 @@ class PostForm(forms.ModelForm):
     class Meta:
         model = PostModel
         fields = "__all__"
-        exclude = ["account_id"]
+        exclude = [
+            "account_id",
+            "staged_x",
+            "staged_instagram",
+            "staged_facebook",
+            "staged_linkedin",
+            "staged_on",
+            "media_claimed_at",
+        ]
 
         widgets = {
             "scheduled_on": forms.DateTimeInput(
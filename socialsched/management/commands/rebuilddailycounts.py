@@ -0,0 +1,39 @@
+from core.logger import log
+from django.core.management.base import BaseCommand, CommandError
+from socialsched.models import DailyPlatformCountModel
+
+
+class Command(BaseCommand):
+    help = "Rebuild the calendar daily counts from the live and archived posts and check them."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only compare the daily counts with the posts.",
+        )
+
+    def handle(self, *args, **options):
+        if not options["check"]:
+            counts = DailyPlatformCountModel.rebuild()
+            log.info(f"Rebuilt {len(counts)} daily counts")
+
+        expected = DailyPlatformCountModel.count_all_posts()
+        stored = DailyPlatformCountModel.get_counts(
+            DailyPlatformCountModel.objects.exclude(count=0).iterator()
+        )
+
+        mismatches = [
+            key for key in set(expected) | set(stored) if stored[key] != expected[key]
+        ]
+        for account_id, day, platform in mismatches:
+            key = (account_id, day, platform)
+            log.warning(
+                f"AccountId:{account_id} Date: {day} Platform: {platform} "
+                f"stored {stored[key]} expected {expected[key]}"
+            )
+
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} daily counts don't match the posts")
+
+        log.success("Daily counts match the posts")
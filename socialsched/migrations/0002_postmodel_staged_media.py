@@ -0,0 +1,38 @@
+# Generated by Django 5.2 on 2026-10-19 19:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialsched', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='postmodel',
+            name='staged_facebook',
+            field=models.CharField(blank=True, max_length=5000, null=True),
+        ),
+        migrations.AddField(
+            model_name='postmodel',
+            name='staged_instagram',
+            field=models.CharField(blank=True, max_length=5000, null=True),
+        ),
+        migrations.AddField(
+            model_name='postmodel',
+            name='staged_linkedin',
+            field=models.CharField(blank=True, max_length=5000, null=True),
+        ),
+        migrations.AddField(
+            model_name='postmodel',
+            name='staged_on',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='postmodel',
+            name='staged_x',
+            field=models.CharField(blank=True, max_length=5000, null=True),
+        ),
+    ]
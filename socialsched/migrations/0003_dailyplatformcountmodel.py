@@ -0,0 +1,88 @@
+# Generated by Django 5.2 on 2026-10-19 19:52
+
+from collections import Counter
+from datetime import timezone as dt_timezone
+from django.db import migrations, models
+from django.utils.timezone import is_aware
+
+
+# Frozen copy of the rollup at the time of this migration, don't import it from the models
+PLATFORM_FIELD_KEYS = {
+    "X": "x",
+    "Instagram": "instagram",
+    "Facebook": "facebook",
+    "LinkedIn": "linkedin",
+    "TikTok": "tiktok",
+}
+TOTAL_PLATFORM_KEYS = ["x", "instagram", "facebook", "linkedin"]
+ALL_PLATFORMS = "all"
+ROLLUP_FIELDS = [
+    "account_id",
+    "scheduled_on",
+    *[f"post_on_{key}" for key in PLATFORM_FIELD_KEYS.values()],
+    *[f"link_{key}" for key in PLATFORM_FIELD_KEYS.values()],
+]
+
+
+def get_rollup_keys(values: dict):
+    scheduled_on = values["scheduled_on"]
+    if is_aware(scheduled_on):
+        scheduled_on = scheduled_on.astimezone(dt_timezone.utc)
+    day = scheduled_on.date()
+
+    selected = {
+        key for key in PLATFORM_FIELD_KEYS.values()
+        if values[f"post_on_{key}"] or values[f"link_{key}"]
+    }
+
+    keys = [
+        (values["account_id"], day, platform)
+        for platform, key in PLATFORM_FIELD_KEYS.items()
+        if key in selected
+    ]
+    if selected.intersection(TOTAL_PLATFORM_KEYS):
+        keys.append((values["account_id"], day, ALL_PLATFORMS))
+
+    return Counter(keys)
+
+
+def backfill_daily_counts(apps, schema_editor):
+    PostModel = apps.get_model("socialsched", "PostModel")
+    DailyPlatformCountModel = apps.get_model("socialsched", "DailyPlatformCountModel")
+
+    counts = Counter()
+    for values in PostModel.objects.values(*ROLLUP_FIELDS).iterator():
+        counts.update(get_rollup_keys(values))
+
+    DailyPlatformCountModel.objects.bulk_create(
+        [
+            DailyPlatformCountModel(account_id=account_id, date=day, platform=platform, count=count)
+            for (account_id, day, platform), count in counts.items()
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialsched', '0002_postmodel_staged_media'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPlatformCountModel',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('account_id', models.IntegerField()),
+                ('date', models.DateField()),
+                ('platform', models.CharField(max_length=1000)),
+                ('count', models.IntegerField(default=0)),
+            ],
+            options={
+                'verbose_name_plural': 'daily platform counts',
+                'constraints': [models.UniqueConstraint(fields=('account_id', 'date', 'platform'), name='unique_daily_platform_count')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2 on 2026-10-19 19:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialsched', '0003_dailyplatformcountmodel'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='postmodel',
+            index=models.Index(fields=['account_id', 'scheduled_on'], name='post_account_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postmodel',
+            index=models.Index(condition=models.Q(('post_on_x', True), ('post_on_instagram', True), ('post_on_facebook', True), ('post_on_linkedin', True), ('post_on_tiktok', True), _connector='OR'), fields=['scheduled_on'], name='post_pending_scheduled_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postmodel',
+            index=models.Index(condition=models.Q(('image_processed', False), ('process_image', True)), fields=['media_file_type'], name='post_image_processing_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='postmodel',
+            index=models.Index(condition=models.Q(('process_video', True), ('video_processed', False)), fields=['media_file_type'], name='post_video_processing_idx'),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2 on 2026-10-19 20:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('socialsched', '0005_archivedpostmodel'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedpostmodel',
+            name='media_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='postmodel',
+            name='media_claimed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
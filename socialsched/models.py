@@ -1,11 +1,15 @@
 import os
 import uuid
-from django.db import models
+from collections import Counter
+from django.db import models, transaction
+from django.db.models import F
 from django.utils import timezone
+from datetime import timezone as dt_timezone
 from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 from django.utils.timezone import is_aware
 from enum import IntEnum
 from integrations.models import IntegrationsModel, Platform
+from .schedule_version import bump_schedule_version
 from django.utils.translation import gettext_lazy as _
 from django.db.models import Q
 
@@ -30,12 +34,75 @@ class MediaFileTypes(models.TextChoices):
     IMAGE = "IMAGE", _("image")
 
 
+# Suffix of the per platform fields (post_on_x, link_x, error_x, retries_x, ...)
+PLATFORM_FIELD_KEYS = {
+    Platform.X_TWITTER.value: "x",
+    Platform.INSTAGRAM.value: "instagram",
+    Platform.FACEBOOK.value: "facebook",
+    Platform.LINKEDIN.value: "linkedin",
+    Platform.TIKTOK.value: "tiktok",
+}
+
+
+# Posts still waiting to be published on at least one platform
+PENDING_POSTS = (
+    Q(post_on_x=True)
+    | Q(post_on_instagram=True)
+    | Q(post_on_facebook=True)
+    | Q(post_on_linkedin=True)
+    | Q(post_on_tiktok=True)
+)
+
+# Platforms counted in the calendar day total
+TOTAL_PLATFORM_KEYS = ["x", "instagram", "facebook", "linkedin"]
+
+# DailyPlatformCountModel platform of the day total
+ALL_PLATFORMS = "all"
+
+# Post fields the calendar counts depend on
+ROLLUP_FIELDS = [
+    "account_id",
+    "scheduled_on",
+    *[f"post_on_{key}" for key in PLATFORM_FIELD_KEYS.values()],
+    *[f"link_{key}" for key in PLATFORM_FIELD_KEYS.values()],
+]
+
+# The account of a post never changes, saving only the other fields can't move its counts
+COUNTED_FIELDS = set(ROLLUP_FIELDS) - {"account_id"}
+
+
+def get_rollup_keys(values: dict):
+    """(account_id, date, platform) counts a post adds to the calendar."""
+
+    scheduled_on = values["scheduled_on"]
+    if is_aware(scheduled_on):
+        # Same date the db gives back
+        scheduled_on = scheduled_on.astimezone(dt_timezone.utc)
+    day = scheduled_on.date()
+
+    selected = {
+        key for key in PLATFORM_FIELD_KEYS.values()
+        if values[f"post_on_{key}"] or values[f"link_{key}"]
+    }
+
+    keys = [
+        (values["account_id"], day, platform)
+        for platform, key in PLATFORM_FIELD_KEYS.items()
+        if key in selected
+    ]
+    if selected.intersection(TOTAL_PLATFORM_KEYS):
+        keys.append((values["account_id"], day, ALL_PLATFORMS))
+
+    return Counter(keys)
+
+
 def get_filename(instance, filename):
     ext = os.path.splitext(filename)[1].lower()
     return f"{instance.account_id}/{uuid.uuid4().hex}{ext}"
 
 
-class PostModel(models.Model):
+class BasePostModel(models.Model):
+    # Fields shared by the live posts and the archive
     scheduled_on = models.DateTimeField()
     post_timezone = models.CharField(max_length=100)
     created_at = models.DateTimeField(default=timezone.now, null=True, blank=True)
@@ -56,6 +123,7 @@ class PostModel(models.Model):
     process_video = models.BooleanField(blank=True, null=True, default=True)
     image_processed = models.BooleanField(blank=True, null=True, default=False)
     video_processed = models.BooleanField(blank=True, null=True, default=False)
+    media_claimed_at = models.DateTimeField(blank=True, null=True)
 
     post_on_x = models.BooleanField(blank=True, null=True, default=False)
     post_on_instagram = models.BooleanField(blank=True, null=True, default=False)
@@ -81,6 +149,13 @@ class PostModel(models.Model):
     retries_linkedin = models.IntegerField(blank=True, null=True, default=0)
     retries_tiktok = models.IntegerField(blank=True, null=True, default=0)
 
+    # Media uploaded ahead of scheduled_on (platform media/container ids)
+    staged_x = models.CharField(max_length=5000, blank=True, null=True)
+    staged_instagram = models.CharField(max_length=5000, blank=True, null=True)
+    staged_facebook = models.CharField(max_length=5000, blank=True, null=True)
+    staged_linkedin = models.CharField(max_length=5000, blank=True, null=True)
+    staged_on = models.DateTimeField(blank=True, null=True)
+
     # TIKTOK
     tiktok_nickname = models.CharField(max_length=1000, blank=True, null=True, default=None)
     tiktok_max_video_post_duration_sec = models.IntegerField(blank=True, null=True, default=None)
@@ -95,6 +170,11 @@ class PostModel(models.Model):
     tiktok_branded_content = models.BooleanField(blank=True, null=True, default=None)
     tiktok_ai_generated = models.BooleanField(blank=True, null=True, default=None)
 
+    is_archived = False
+
+    def get_rollup_keys(self):
+        return get_rollup_keys({field: getattr(self, field) for field in ROLLUP_FIELDS})
+
     @property
     def has_video(self):
         return self.media_file_type == MediaFileTypes.VIDEO.value
@@ -103,13 +183,102 @@ class PostModel(models.Model):
     def has_image(self):
         return self.media_file_type == MediaFileTypes.IMAGE.value
 
+    @property
+    def scheduled_aware(self):
+        # scheduled_on holds the wall clock time of post_timezone
+        return self.scheduled_on.replace(tzinfo=ZoneInfo(self.post_timezone))
+
+    @scheduled_aware.setter
+    def scheduled_aware(self, value):
+        wall_clock = value.astimezone(ZoneInfo(self.post_timezone))
+        self.scheduled_on = wall_clock.replace(tzinfo=dt_timezone.utc)
+
+    @property
+    def media_ready(self):
+        if self.media_file_type == MediaFileTypes.IMAGE.value and self.process_image:
+            return bool(self.image_processed)
+        if self.media_file_type == MediaFileTypes.VIDEO.value and self.process_video:
+            return bool(self.video_processed)
+        return True
+
+    class Meta:
+        abstract = True
+
+
+class PostModel(BasePostModel):
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Calendar counts of the post as stored, to apply only the difference on save
+        instance._stored_rollup = None
+        if all(field in field_names for field in ROLLUP_FIELDS):
+            instance._stored_rollup = (instance.pk, instance.get_rollup_keys())
+        return instance
+
+    def get_stored_rollup_keys(self):
+        if self.pk is None:
+            return Counter()
+
+        stored = getattr(self, "_stored_rollup", None)
+        # Clones keep the snapshot of the post they were loaded from
+        if stored is not None and stored[0] == self.pk:
+            return stored[1]
+
+        values = PostModel.objects.filter(pk=self.pk).values(*ROLLUP_FIELDS).first()
+        return get_rollup_keys(values) if values else Counter()
+
+    def get_saved_fields(self, update_fields=None):
+        """Columns the save will write, None for all of them."""
+
+        if update_fields is not None:
+            return set(update_fields)
+
+        # Like Model.save, partially loaded posts (.only()) only write the loaded columns
+        deferred = self.get_deferred_fields() if self.pk is not None else set()
+        if deferred:
+            return {field.attname for field in self._meta.concrete_fields} - deferred
+
+        return None
+
+    def _save_with_rollup(self, *args, **kwargs):
+        account_id = self.account_id
+
+        saved_fields = self.get_saved_fields(kwargs.get("update_fields"))
+        if saved_fields is not None and not COUNTED_FIELDS.intersection(saved_fields):
+            # Media processing and such, nothing the calendar counts depend on
+            super().save(*args, **kwargs)
+            transaction.on_commit(lambda: bump_schedule_version(account_id))
+            return
+
+        # Calendar counts change in the same transaction as the post
+        with transaction.atomic():
+            stored = self.get_stored_rollup_keys()
+            super().save(*args, **kwargs)
+            current = self.get_rollup_keys()
+
+            current.subtract(stored)
+            DailyPlatformCountModel.apply(current)
+
+            transaction.on_commit(lambda: bump_schedule_version(account_id))
+
+        self._stored_rollup = (self.pk, self.get_rollup_keys())
+
+    def reset_staged_media(self):
+        self.staged_x = None
+        self.staged_instagram = None
+        self.staged_facebook = None
+        self.staged_linkedin = None
+        self.staged_on = None
 
     def save(self, *args, **kwargs):
 
         skip_validation = kwargs.pop("skip_validation", False)
+        # Batch creation can pass IntegrationsModel.get_authorized_platforms_by_account()[account_id]
+        authorized_platforms = kwargs.pop("authorized_platforms", None)
 
         if skip_validation:
-            super().save(*args, **kwargs)
+            self._save_with_rollup(*args, **kwargs)
             return
 
         if not any(
@@ -146,11 +315,11 @@ class PostModel(models.Model):
 
         postlen = len(self.description)
 
+        if authorized_platforms is None:
+            authorized_platforms = IntegrationsModel.get_authorized_platforms(self.account_id)
+
         if self.post_on_x:
-            x_ok = IntegrationsModel.objects.filter(
-                account_id=self.account_id, platform=Platform.X_TWITTER.value
-            ).first()
-            if not x_ok:
+            if Platform.X_TWITTER.value not in authorized_platforms:
                 raise ValueError("Please got to Integrations and authorize X app")
             if postlen > TextMaxLength.X_BLUE:
                 raise ValueError(
@@ -164,10 +333,7 @@ class PostModel(models.Model):
                     )
 
         if self.post_on_instagram:
-            ig_ok = IntegrationsModel.objects.filter(
-                account_id=self.account_id, platform=Platform.INSTAGRAM.value
-            ).first()
-            if not ig_ok:
+            if Platform.INSTAGRAM.value not in authorized_platforms:
                 raise ValueError(
                     "Please got to Integrations and authorize Facebook/Instagram app"
                 )
@@ -181,10 +347,7 @@ class PostModel(models.Model):
                 self.media_file_type = MediaFileTypes.IMAGE.value
 
         if self.post_on_facebook:
-            fb_ok = IntegrationsModel.objects.filter(
-                account_id=self.account_id, platform=Platform.FACEBOOK.value
-            ).first()
-            if not fb_ok:
+            if Platform.FACEBOOK.value not in authorized_platforms:
                 raise ValueError(
                     "Please got to Integrations and authorize Facebook/Instagram app"
                 )
@@ -194,10 +357,7 @@ class PostModel(models.Model):
                 )
 
         if self.post_on_linkedin:
-            ld_ok = IntegrationsModel.objects.filter(
-                account_id=self.account_id, platform=Platform.LINKEDIN.value
-            ).first()
-            if not ld_ok:
+            if Platform.LINKEDIN.value not in authorized_platforms:
                 raise ValueError(
                     "Please got to Integrations and authorize LinkedIn app"
                 )
@@ -213,10 +373,7 @@ class PostModel(models.Model):
                     )
 
         if self.post_on_tiktok:
-            tk_ok = IntegrationsModel.objects.filter(
-                account_id=self.account_id, platform=Platform.TIKTOK.value
-            ).first()
-            if not tk_ok:
+            if Platform.TIKTOK.value not in authorized_platforms:
                 raise ValueError("Please got to Integrations and authorize TikTok app")
 
             if self.media_file:
@@ -228,11 +385,144 @@ class PostModel(models.Model):
             else:
                 raise ValueError("A .mp4 video in reel format is needed for TikTok.")
 
-        super().save(*args, **kwargs)
+        self._save_with_rollup(*args, **kwargs)
 
     class Meta:
         app_label = "socialsched"
         verbose_name_plural = "scheduled"
+        indexes = [
+            # Schedule form day range
+            models.Index(fields=["account_id", "scheduled_on"], name="post_account_scheduled_idx"),
+            # Poster due deliveries, only the posts still pending on a platform
+            models.Index(
+                fields=["scheduled_on"],
+                name="post_pending_scheduled_idx",
+                condition=PENDING_POSTS,
+            ),
+            # process_images/process_videos queues
+            models.Index(
+                fields=["media_file_type"],
+                name="post_image_processing_idx",
+                condition=Q(process_image=True, image_processed=False),
+            ),
+            models.Index(
+                fields=["media_file_type"],
+                name="post_video_processing_idx",
+                condition=Q(process_video=True, video_processed=False),
+            ),
+        ]
 
     def __str__(self):
         return f"AccountId:{self.account_id} PostId: {self.pk} PostScheduledOn: {self.scheduled_on}"
+
+
+class ArchivedPostModel(BasePostModel):
+    """
+    Published and exhausted posts moved out of PostModel by `archive_posts`.
+    Keeps the id of the live post, their calendar counts and media files stay as they were.
+    """
+
+    id = models.BigIntegerField(primary_key=True)
+    archived_at = models.DateTimeField(default=timezone.now)
+
+    is_archived = True
+
+    class Meta:
+        app_label = "socialsched"
+        verbose_name_plural = "archived"
+        indexes = [
+            models.Index(fields=["account_id", "scheduled_on"], name="archived_account_scheduled_idx"),
+        ]
+
+    def __str__(self):
+        return f"AccountId:{self.account_id} ArchivedPostId: {self.pk} PostScheduledOn: {self.scheduled_on}"
+
+    @classmethod
+    def from_post(cls, post: PostModel):
+        values = {field.attname: getattr(post, field.attname) for field in PostModel._meta.concrete_fields}
+        values["media_file"] = post.media_file.name
+        return cls(**values)
+
+
+class DailyPlatformCountModel(models.Model):
+    """
+    Calendar counts per account/day/platform (ALL_PLATFORMS for the day total) of live and archived posts.
+    Kept in sync by PostModel.save and post deletes, rebuilt with `manage.py rebuilddailycounts`.
+    """
+
+    account_id = models.IntegerField()
+    date = models.DateField()
+    platform = models.CharField(max_length=1000)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = "socialsched"
+        verbose_name_plural = "daily platform counts"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["account_id", "date", "platform"],
+                name="unique_daily_platform_count",
+            )
+        ]
+
+    def __str__(self):
+        return f"AccountId:{self.account_id} Date: {self.date} Platform: {self.platform} Count: {self.count}"
+
+    @classmethod
+    def apply(cls, deltas: Counter):
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+
+        missing = []
+        for (account_id, day, platform), delta in deltas.items():
+            updated = cls.objects.filter(
+                account_id=account_id, date=day, platform=platform
+            ).update(count=F("count") + delta)
+            if not updated:
+                missing.append((account_id, day, platform))
+
+        if not missing:
+            return
+
+        # Another transaction may insert the same day first, add to its row then
+        cls.objects.bulk_create(
+            [
+                cls(account_id=account_id, date=day, platform=platform)
+                for account_id, day, platform in missing
+            ],
+            ignore_conflicts=True,
+        )
+        for account_id, day, platform in missing:
+            cls.objects.filter(
+                account_id=account_id, date=day, platform=platform
+            ).update(count=F("count") + deltas[(account_id, day, platform)])
+
+    @classmethod
+    def count_posts(cls, posts):
+        counts = Counter()
+        for values in posts.values(*ROLLUP_FIELDS).iterator():
+            counts.update(get_rollup_keys(values))
+        return counts
+
+    @classmethod
+    def get_counts(cls, rows):
+        return Counter(
+            {(row.account_id, row.date, row.platform): row.count for row in rows if row.count}
+        )
+
+    @classmethod
+    def count_all_posts(cls):
+        return cls.count_posts(PostModel.objects.all()) + cls.count_posts(ArchivedPostModel.objects.all())
+
+    @classmethod
+    @transaction.atomic
+    def rebuild(cls):
+        counts = cls.count_all_posts()
+        cls.objects.all().delete()
+        cls.objects.bulk_create(
+            [
+                cls(account_id=account_id, date=day, platform=platform, count=count)
+                for (account_id, day, platform), count in counts.items()
+            ],
+            batch_size=1000,
+        )
+        return counts
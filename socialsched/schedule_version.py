@@ -0,0 +1,82 @@
+import time
+import hashlib
+from datetime import datetime, timezone as dt_timezone
+from django.contrib import messages
+from django.core.cache import cache
+from django.conf import settings
+from django.utils import timezone
+
+
+def get_schedule_version_cache_key(account_id: int):
+    return f"schedule_version_{account_id}"
+
+
+def get_schedule_version(account_id: int):
+    """
+    Changes on every post (or integration) mutation of the account.
+    A missing (evicted) version starts a new one, so old ETags can't match it.
+    """
+
+    key = get_schedule_version_cache_key(account_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), timeout=None)
+        version = cache.get(key)
+    return version
+
+
+def bump_schedule_version(account_id: int):
+    cache.set(get_schedule_version_cache_key(account_id), time.time_ns(), timeout=None)
+
+
+def get_schedule_version_datetime(account_id: int):
+    return datetime.fromtimestamp(get_schedule_version(account_id) / 1e9, tz=dt_timezone.utc)
+
+
+def has_pending_messages(request):
+    # Flash messages are rendered once, those pages can't be reused
+    return len(messages.get_messages(request)) > 0
+
+
+def get_schedule_etag(request, *args, **kwargs):
+    if not request.user.is_authenticated or has_pending_messages(request):
+        return None
+
+    parts = [
+        request.social_user_id,
+        get_schedule_version(request.social_user_id),
+        # Past/current/next highlights and "Post Today" move with the date
+        timezone.now().date().isoformat(),
+        # Pages embed the csrf token and the user menu
+        request.session.session_key,
+        request.COOKIES.get(settings.CSRF_COOKIE_NAME),
+        request.get_full_path(),
+    ]
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def get_schedule_last_modified(request, *args, **kwargs):
+    if not request.user.is_authenticated or has_pending_messages(request):
+        return None
+
+    today = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+    return max(get_schedule_version_datetime(request.social_user_id), today)
+
+
+def get_calendar_data_etag(request, *args, **kwargs):
+    # Counts only, the same for every session and day
+    if not request.user.is_authenticated:
+        return None
+
+    parts = [
+        request.social_user_id,
+        get_schedule_version(request.social_user_id),
+        request.get_full_path(),
+    ]
+    return hashlib.md5(":".join(map(str, parts)).encode()).hexdigest()
+
+
+def get_calendar_data_last_modified(request, *args, **kwargs):
+    if not request.user.is_authenticated:
+        return None
+    return get_schedule_version_datetime(request.social_user_id)
@@ -0,0 +1,25 @@
+from collections import Counter
+from django.db import transaction
+from django.dispatch import receiver
+from django.db.models.signals import pre_delete
+from .models import PostModel, ArchivedPostModel, DailyPlatformCountModel
+from .schedule_version import bump_schedule_version
+
+
+@receiver(pre_delete, sender=PostModel)
+def remove_from_daily_counts(sender, instance: PostModel, **kwargs):
+    # Runs inside the delete transaction, also for queryset deletes (admin)
+    stored = instance.get_stored_rollup_keys()
+    DailyPlatformCountModel.apply(Counter({key: -count for key, count in stored.items()}))
+
+    account_id = instance.account_id
+    transaction.on_commit(lambda: bump_schedule_version(account_id))
+
+
+@receiver(pre_delete, sender=ArchivedPostModel)
+def remove_archived_from_daily_counts(sender, instance: ArchivedPostModel, **kwargs):
+    keys = instance.get_rollup_keys()
+    DailyPlatformCountModel.apply(Counter({key: -count for key, count in keys.items()}))
+
+    account_id = instance.account_id
+    transaction.on_commit(lambda: bump_schedule_version(account_id))
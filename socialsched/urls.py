@@ -4,6 +4,7 @@ from . import views
 
 urlpatterns = [
     path("", views.calendar, name="calendar"),
+    path("calendar-data/", views.calendar_data, name="calendar_data"),
     path("schedule/<str:isodate>/", views.schedule_form, name="schedule_form"),
     path("schedule-save/<str:isodate>/", views.schedule_save, name="schedule_save"),
     path("schedule-edit/<int:post_id>/", views.schedule_edit, name="schedule_edit"),
@@ -9,26 +9,49 @@ from django.contrib.auth import logout, login, get_user_model
 from django.utils import timezone
 from django.db.models import Min, Max
 from core.logger import log
-from datetime import datetime, timedelta
+from datetime import datetime, time, timedelta, timezone as dt_timezone
 from integrations.helpers.utils import get_tiktok_creator_info, get_integrations_context
 from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseRedirect, FileResponse, Http404
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
+from django.views.decorators.cache import cache_control
+from django.utils.functional import SimpleLazyObject
 from django.conf import settings
 import json
 import os
 import base64
 import firebase_admin
 from firebase_admin import credentials, auth as fb_auth
-from .models import PostModel
+from .models import PostModel, ArchivedPostModel, DailyPlatformCountModel
 from .forms import PostForm
-from .schedule_utils import (
-    get_day_data,
-    get_initial_month_placeholder,
-    get_year_dates,
+from .schedule_utils import get_calendar_range, get_calendar_counts
+from .schedule_version import (
+    get_schedule_version,
+    get_schedule_etag,
+    get_schedule_last_modified,
+    get_calendar_data_etag,
+    get_calendar_data_last_modified,
 )
 
 
+def get_select_years(social_uid: int, today):
+    # Daily counts cover the live and archived posts
+    date_range = DailyPlatformCountModel.objects.filter(
+        account_id=social_uid
+    ).exclude(count=0).aggregate(Min("date"), Max("date"))
+    min_date = date_range["date__min"]
+    max_date = date_range["date__max"]
+
+    min_year = min_date.year if min_date else today.year
+    max_year = max_date.year if max_date else today.year
+
+    select_years = list(set([min_year, max_year, today.year, today.year + 4]))
+    return [y for y in range(min(select_years), max(select_years), 1)]
+
+
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=get_schedule_etag, last_modified_func=get_schedule_last_modified)
 def calendar(request):
     social_uid = request.social_user_id
 
@@ -37,121 +60,47 @@ def calendar(request):
     if request.GET.get("year") is not None:
         selected_year = int(request.GET.get("year"))
 
-    min_date = PostModel.objects.filter(account_id=social_uid).aggregate(
-        Min("scheduled_on")
-    )["scheduled_on__min"]
-
-    max_date = PostModel.objects.filter(account_id=social_uid).aggregate(
-        Max("scheduled_on")
-    )["scheduled_on__max"]
-
-    min_year = min_date.year if min_date else today.year
-    max_year = max_date.year if max_date else today.year
-
-    select_years = list(set([min_year, max_year, today.year, today.year + 4]))
-    select_years = [y for y in range(min(select_years), max(select_years), 1)]
-
-    posts = PostModel.objects.filter(
-        account_id=social_uid, scheduled_on__year=selected_year
-    ).values(
-        "scheduled_on",
-        "post_on_instagram",
-        "post_on_facebook",
-        "post_on_tiktok",
-        "post_on_linkedin",
-        "post_on_x",
-        "link_instagram",
-        "link_facebook",
-        "link_tiktok",
-        "link_linkedin",
-        "link_x",
-    )
-
-    year_dates = get_year_dates(selected_year)
-
-    calendar_data = {}
-    for d in year_dates:
-        if d.month == 1:
-            if "january" not in calendar_data:
-                calendar_data["january"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["january"]["days"].append(day_data)
-
-        if d.month == 2:
-            if "february" not in calendar_data:
-                calendar_data["february"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["february"]["days"].append(day_data)
-
-        if d.month == 3:
-            if "march" not in calendar_data:
-                calendar_data["march"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["march"]["days"].append(day_data)
-
-        if d.month == 4:
-            if "april" not in calendar_data:
-                calendar_data["april"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["april"]["days"].append(day_data)
-
-        if d.month == 5:
-            if "may" not in calendar_data:
-                calendar_data["may"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["may"]["days"].append(day_data)
-
-        if d.month == 6:
-            if "june" not in calendar_data:
-                calendar_data["june"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["june"]["days"].append(day_data)
-
-        if d.month == 7:
-            if "july" not in calendar_data:
-                calendar_data["july"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["july"]["days"].append(day_data)
-
-        if d.month == 8:
-            if "august" not in calendar_data:
-                calendar_data["august"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["august"]["days"].append(day_data)
-
-        if d.month == 9:
-            if "september" not in calendar_data:
-                calendar_data["september"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["september"]["days"].append(day_data)
-
-        if d.month == 10:
-            if "octomber" not in calendar_data:
-                calendar_data["octomber"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["octomber"]["days"].append(day_data)
-
-        if d.month == 11:
-            if "november" not in calendar_data:
-                calendar_data["november"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["november"]["days"].append(day_data)
-
-        if d.month == 12:
-            if "december" not in calendar_data:
-                calendar_data["december"] = get_initial_month_placeholder(today, d)
-            day_data = get_day_data(posts, d)
-            calendar_data["december"]["days"].append(day_data)
+    # Only evaluated if the years fragment is not cached for this schedule version
+    select_years = SimpleLazyObject(lambda: get_select_years(social_uid, today))
 
+    # The year grid is rendered client side from calendar_data
     return render(
         request,
         "calendar.html",
         context={
             "selected_year": selected_year,
             "select_years": select_years,
-            "calendar_data": calendar_data,
             "today": today.date().isoformat(),
+            "current_month": today.strftime("%Y-%m"),
+            "social_uid": social_uid,
+            "schedule_version": get_schedule_version(social_uid),
+            "fragment_cache_seconds": settings.SCHEDULE_FRAGMENT_CACHE_SECONDS,
+        },
+    )
+
+
+@login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=get_calendar_data_etag, last_modified_func=get_calendar_data_last_modified)
+def calendar_data(request):
+    social_uid = request.social_user_id
+
+    try:
+        start, end = get_calendar_range(request.GET, timezone.now().date())
+    except ValueError as err:
+        return HttpResponseBadRequest(str(err))
+
+    daily_counts = DailyPlatformCountModel.objects.filter(
+        account_id=social_uid, date__range=(start, end)
+    ).exclude(count=0).values("date", "platform", "count")
+
+    return JsonResponse(
+        {
+            "start": start.isoformat(),
+            "end": end.isoformat(),
+            "counts": get_calendar_counts(daily_counts, start, end),
         },
+        json_dumps_params={"separators": (",", ":")},
     )
 
 
@@ -162,8 +111,19 @@ def get_schedule_form_context(social_uid: int, isodate: str, form: PostForm = No
     prev_date = scheduled_on - timedelta(days=1)
     next_date = scheduled_on + timedelta(days=1)
 
-    posts = PostModel.objects.filter(
-        account_id=social_uid, scheduled_on__date=scheduled_on
+    # Range instead of __date so the account/scheduled_on index can be used
+    day_start = datetime.combine(scheduled_on, time.min, tzinfo=dt_timezone.utc)
+    day_filter = {
+        "account_id": social_uid,
+        "scheduled_on__gte": day_start,
+        "scheduled_on__lt": day_start + timedelta(days=1),
+    }
+    posts = sorted(
+        [
+            *PostModel.objects.filter(**day_filter),
+            *ArchivedPostModel.objects.filter(**day_filter),
+        ],
+        key=lambda post: post.pk,
     )
 
     show_form = today.date() <= scheduled_on
@@ -200,6 +160,8 @@ def get_schedule_form_context(social_uid: int, isodate: str, form: PostForm = No
 
 
 @login_required
+@cache_control(private=True, no_cache=True)
+@condition(etag_func=get_schedule_etag, last_modified_func=get_schedule_last_modified)
 def schedule_form(request, isodate):
     social_uid = request.social_user_id
     context = get_schedule_form_context(social_uid, isodate, form=None)
@@ -325,6 +287,7 @@ def schedule_edit(request, post_id):
             post.media_file = new_media
             post.process_image = False  # Don't process this image
             post.image_processed = True  # Mark as already processed (to skip processing)
+            post.reset_staged_media()
             post.save(skip_validation=True)
             messages.add_message(
                 request,
@@ -368,6 +331,7 @@ def schedule_update_media(request, post_id):
         post.media_file = new_media
         post.process_image = False  # Don't process this image
         post.image_processed = True  # Mark as already processed (to skip processing)
+        post.reset_staged_media()
         post.save(skip_validation=True)
         
         return JsonResponse({